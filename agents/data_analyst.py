@@ -1,6 +1,12 @@
 import pandas as pd
 import numpy as np
 from agents.agent_setup import get_llm, get_dataset_preview
+from utils.correlation import get_correlation_summary
+from utils.category_counts import frequency_table
+from utils.intent import detect_intents
+from utils.column_index import get_column_index
+from utils.aggregated_charts import get_box_statistics
+from utils.analysis_results import AnalysisResult, AnalysisTable, tables_to_prompt
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 import io
@@ -38,55 +44,66 @@ def execute_statistical_code(df: pd.DataFrame, question: str):
     results = {}
     
     try:
-        # Detectar tipo de análise pela pergunta
-        question_lower = question.lower()
+        # Detectar tipo de análise e colunas citadas pela pergunta
+        column_index = get_column_index(df)
+        detection = detect_intents(question, column_index)
+        intents = detection["intents"]
+        all_numeric = column_index.numeric_columns
+        mentioned_numeric = [col for col in detection["columns"] if col in all_numeric]
+        mentioned_categorical = [col for col in detection["columns"] if col in column_index.categorical_columns]
+        # Quando o usuário cita colunas, as análises se concentram nelas
+        numeric_cols = mentioned_numeric or all_numeric
         
         # 1. ANÁLISE DESCRITIVA (describe, estatísticas básicas)
-        if any(word in question_lower for word in ['descri', 'estatística', 'resumo', 'média', 'mediana', 'desvio', 'padrão', 'mínimo', 'máximo']):
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
+        if "describe" in intents:
             if len(numeric_cols) > 0:
                 results['describe'] = df[numeric_cols].describe()
         
         # 2. CORRELAÇÃO
-        if any(word in question_lower for word in ['correlação', 'correlacao', 'relaciona', 'influência', 'influencia']):
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
-            if len(numeric_cols) > 1:
-                results['correlation'] = df[numeric_cols].corr()
+        if "correlation" in intents:
+            if len(mentioned_numeric) == 1 and len(all_numeric) > 1:
+                # Uma coluna citada: correlação dela com as demais, ordenada por força
+                target = mentioned_numeric[0]
+                others = [col for col in all_numeric if col != target]
+                corr_with = df[others].corrwith(df[target]).dropna()
+                corr_with = corr_with.reindex(corr_with.abs().sort_values(ascending=False).index)
+                results[f'correlation_with_{target}'] = corr_with.head(20).to_frame('Correlação')
+            elif len(numeric_cols) > 1:
+                # Para datasets largos, apenas os pares mais fortes e os grupos correlacionados
+                summary = get_correlation_summary(df, list(numeric_cols))
+                if summary["matrix"] is not None:
+                    results['correlation'] = summary["matrix"]
+                else:
+                    results['correlation_top_pairs'] = summary["top_pairs"]
+                    for idx, cluster in enumerate(summary["clusters"], 1):
+                        results[f'correlation_cluster_{idx}'] = cluster
         
         # 3. OUTLIERS (usando IQR)
-        if any(word in question_lower for word in ['outlier', 'atípico', 'atipico', 'anomalia', 'anômalo']):
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
+        if "outliers" in intents:
             outlier_info = {}
             for col in numeric_cols:
-                Q1 = df[col].quantile(0.25)
-                Q3 = df[col].quantile(0.75)
-                IQR = Q3 - Q1
-                lower_bound = Q1 - 1.5 * IQR
-                upper_bound = Q3 + 1.5 * IQR
-                outliers = df[(df[col] < lower_bound) | (df[col] > upper_bound)]
+                # Quartis/limites ficam em cache e são reaproveitados pelo box plot
+                stats = get_box_statistics(df, col)
+                if not stats:
+                    continue
                 outlier_info[col] = {
-                    'Total Outliers': len(outliers),
-                    'Porcentagem': f"{(len(outliers)/len(df)*100):.2f}%",
-                    'Limite Inferior': f"{lower_bound:.2f}",
-                    'Limite Superior': f"{upper_bound:.2f}"
+                    'Total Outliers': stats["n_outliers"],
+                    'Porcentagem': f"{(stats['n_outliers']/len(df)*100):.2f}%",
+                    'Limite Inferior': f"{stats['lower_bound']:.2f}",
+                    'Limite Superior': f"{stats['upper_bound']:.2f}"
                 }
             if outlier_info:
                 results['outliers'] = pd.DataFrame(outlier_info).T
         
         # 4. VALORES MAIS FREQUENTES
-        if any(word in question_lower for word in ['frequente', 'comum', 'valor_counts', 'contagem', 'distribuição']):
-            # Para colunas categóricas
-            cat_cols = df.select_dtypes(include=['object', 'category']).columns
-            if len(cat_cols) > 0:
-                freq_info = {}
-                for col in cat_cols[:5]:  # Limitar a 5 colunas
-                    top_5 = df[col].value_counts().head(5)
-                    freq_info[col] = top_5
-                if freq_info:
-                    results['frequency'] = pd.DataFrame(freq_info)
+        if "frequency" in intents or "distribution" in intents:
+            # Top-5 de todas as colunas categóricas (contagem exata com códigos em cache)
+            freq_table = frequency_table(df, k=5, columns=mentioned_categorical or None)
+            if not freq_table.empty:
+                results['frequency'] = freq_table
         
         # 5. VALORES FALTANTES
-        if any(word in question_lower for word in ['faltante', 'missing', 'nulo', 'nan', 'vazio']):
+        if "missing" in intents:
             missing_data = pd.DataFrame({
                 'Total Missing': df.isnull().sum(),
                 'Porcentagem': (df.isnull().sum() / len(df) * 100).round(2)
@@ -106,37 +123,39 @@ def get_data_analyst_agent(api_key: str):
     chain = prompt | llm | StrOutputParser()
     return chain
 
-def run_data_analyst(api_key: str, df: pd.DataFrame, analysis_context: str, specific_question: str):
+def run_data_analyst(api_key: str, df: pd.DataFrame, analysis_context: str, specific_question: str) -> AnalysisResult:
+    """
+    Executa o DataAnalystAgent.
+    Retorna um AnalysisResult com o texto do LLM e as tabelas estatísticas como DataFrames;
+    a renderização (Markdown, PDF, prompt compacto) fica a cargo de quem consome.
+    """
     try:
         # Verifica se o DataFrame está vazio
         if df.empty:
-            return "Erro: O DataFrame está vazio. Não é possível realizar a análise."
+            return AnalysisResult("Erro: O DataFrame está vazio. Não é possível realizar a análise.")
             
         # Verifica se a pergunta específica foi fornecida
         if not specific_question or not specific_question.strip():
-            return "Erro: Nenhuma pergunta específica foi fornecida para análise."
+            return AnalysisResult("Erro: Nenhuma pergunta específica foi fornecida para análise.")
             
         # EXECUTAR CÓDIGO ESTATÍSTICO REAL
         statistical_results = execute_statistical_code(df, specific_question)
-        
-        # Formatar tabelas como markdown
-        tables_markdown = ""
-        if statistical_results:
-            for analysis_type, result_df in statistical_results.items():
-                if isinstance(result_df, pd.DataFrame):
-                    tables_markdown += f"\n\n**Tabela - {analysis_type.upper()}:**\n\n"
-                    tables_markdown += result_df.to_markdown() + "\n"
+        tables = [
+            AnalysisTable(analysis_type, result_df)
+            for analysis_type, result_df in statistical_results.items()
+            if isinstance(result_df, pd.DataFrame)
+        ]
         
         # Obtém o agente e os dados
         agent = get_data_analyst_agent(api_key)
         dataset_preview = get_dataset_preview(df)
         
-        # Adicionar contexto das tabelas geradas
-        enhanced_context = f"{analysis_context}\n\nTABELAS GERADAS:\n{tables_markdown}" if tables_markdown else analysis_context
+        # Adicionar contexto das tabelas geradas (versão compacta e truncada)
+        enhanced_context = f"{analysis_context}\n\nTABELAS GERADAS:\n{tables_to_prompt(tables)}" if tables else analysis_context
         
         # Verifica se o preview do dataset foi gerado corretamente
         if not dataset_preview:
-            return "Erro: Não foi possível gerar o preview do dataset."
+            return AnalysisResult("Erro: Não foi possível gerar o preview do dataset.")
             
         # Executa a análise
         response = agent.invoke({
@@ -147,16 +166,12 @@ def run_data_analyst(api_key: str, df: pd.DataFrame, analysis_context: str, spec
         
         # Verifica se a resposta é válida
         if not response or response.strip() == "undefined":
-            return "Desculpe, não foi possível gerar uma análise para esta pergunta. Por favor, tente reformular sua pergunta."
+            return AnalysisResult("Desculpe, não foi possível gerar uma análise para esta pergunta. Por favor, tente reformular sua pergunta.")
         
-        # CONCATENAR TABELAS REAIS COM A RESPOSTA DO LLM
-        final_response = response
-        if tables_markdown:
-            final_response = f"{response}\n\n---\n\n## TABELAS ESTATÍSTICAS GERADAS\n{tables_markdown}"
-            
-        return final_response
+        # As tabelas reais acompanham a resposta do LLM como objetos, sem serializar em Markdown
+        return AnalysisResult(response, tables)
         
     except Exception as e:
         # Log do erro para depuração
         print(f"Erro no DataAnalystAgent: {str(e)}")
-        return f"Ocorreu um erro ao processar sua solicitação: {str(e)}"
\ No newline at end of file
+        return AnalysisResult(f"Ocorreu um erro ao processar sua solicitação: {str(e)}")
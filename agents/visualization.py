@@ -5,6 +5,11 @@ import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 from agents.agent_setup import get_llm, get_dataset_preview
+from utils.correlation import get_correlation_summary
+from utils.intent import detect_intents
+from utils.column_index import get_column_index
+from utils.optimized_chart_generator import plan_chart, generate_chart_code
+from utils.chart_cache import register_trusted_code
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
@@ -45,23 +50,41 @@ fig = px.histogram(df, x='idade', title='Distribuição da Idade', nbins=20)
 fig.update_layout(bargap=0.1)
 """
 
-def generate_statistical_visualization(df: pd.DataFrame, question: str):
+# "aggregated": bins/estatísticas calculados no servidor; "raw": valores brutos no navegador
+CHART_MODE = "aggregated"
+
+def generate_statistical_visualization(df: pd.DataFrame, question: str, chart_mode: str = CHART_MODE):
     """
     Gera visualizações automáticas para análises estatísticas comuns.
     Retorna código Python executável para gráficos Plotly.
+
+    Com chart_mode="aggregated", histogramas e box plots são resumidos no servidor
+    em vez de embutir todos os valores brutos na figura.
     """
-    question_lower = question.lower()
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    column_index = get_column_index(df)
+    detection = detect_intents(question, column_index)
+    intents = detection["intents"]
+    numeric_cols = column_index.numeric_columns
+    # Colunas citadas na pergunta têm prioridade sobre a ordem do dataset
+    mentioned_numeric = [col for col in detection["columns"] if col in numeric_cols]
+    target_cols = mentioned_numeric or numeric_cols
     
     # 1. CORRELAÇÃO - Heatmap
-    if any(word in question_lower for word in ['correlação', 'correlacao', 'relaciona', 'influência', 'influencia']):
-        if len(numeric_cols) > 1:
+    if "correlation" in intents:
+        if len(mentioned_numeric) > 1:
+            heatmap_cols = mentioned_numeric
+        elif len(numeric_cols) > 1:
+            # Em datasets largos, o heatmap mostra apenas as variáveis dos pares mais fortes
+            heatmap_cols = get_correlation_summary(df, numeric_cols)["heatmap_columns"]
+        else:
+            heatmap_cols = None
+        if heatmap_cols:
             code = f"""
 import plotly.express as px
 import pandas as pd
 
 # Calcular matriz de correlação
-numeric_cols = {numeric_cols}
+numeric_cols = {heatmap_cols}
 corr_matrix = df[numeric_cols].corr()
 
 # Criar heatmap de correlação
@@ -76,10 +99,22 @@ fig.update_layout(width=800, height=600)
             return code
     
     # 2. OUTLIERS - Box Plot
-    if any(word in question_lower for word in ['outlier', 'atípico', 'atipico', 'anomalia', 'anômalo']):
+    if "outliers" in intents:
         if len(numeric_cols) > 0:
             # Limitar a 6 colunas para não sobrecarregar
-            cols_to_plot = numeric_cols[:6]
+            cols_to_plot = target_cols[:6]
+            if chart_mode == "aggregated":
+                code = f"""
+from utils.aggregated_charts import aggregated_box_plot
+
+# Quartis, whiskers e amostra de outliers pré-calculados (mesmo IQR da análise estatística),
+# sem copiar o DataFrame com melt nem enviar todos os pontos ao navegador
+numeric_cols = {cols_to_plot}
+fig = aggregated_box_plot(df, numeric_cols,
+                          title='Detecção de Outliers por Variável (Box Plot)')
+fig.update_layout(showlegend=False, height=500)
+"""
+                return code
             code = f"""
 import plotly.express as px
 import pandas as pd
@@ -99,10 +134,20 @@ fig.update_layout(showlegend=False, height=500)
             return code
     
     # 3. DISTRIBUIÇÃO - Histogramas múltiplos
-    if any(word in question_lower for word in ['distribuição', 'distribuicao', 'histograma', 'densidade']):
+    if "distribution" in intents:
         if len(numeric_cols) > 0:
-            # Pegar primeira coluna numérica ou a mais relevante
-            col = numeric_cols[0]
+            # Coluna citada na pergunta ou, na falta dela, a primeira numérica
+            col = target_cols[0]
+            if chart_mode == "aggregated":
+                code = f"""
+from utils.aggregated_charts import aggregated_histogram
+
+# Bins e box plot calculados no servidor: o gráfico carrega apenas os resumos
+fig = aggregated_histogram(df, {col!r}, nbins=50, marginal_box=True,
+                           title={f'Distribuição de {col}'!r})
+fig.update_layout(height=500)
+"""
+                return code
             code = f"""
 import plotly.express as px
 
@@ -118,14 +163,21 @@ fig.update_layout(bargap=0.1, height=500)
             return code
     
     # 4. ESTATÍSTICAS DESCRITIVAS - Box plots de todas variáveis
-    if any(word in question_lower for word in ['descri', 'estatística', 'resumo', 'geral']):
+    if "describe" in intents:
         if len(numeric_cols) > 0:
-            cols_to_plot = numeric_cols[:8]
+            cols_to_plot = target_cols[:8]
+            if chart_mode == "aggregated":
+                # Histogramas pré-agregados no servidor (payload proporcional aos bins)
+                histogram_import = "from utils.aggregated_charts import aggregated_histogram_trace\n"
+                histogram_trace = "aggregated_histogram_trace(df[col], nbins=30, name=col, showlegend=False)"
+            else:
+                histogram_import = ""
+                histogram_trace = "go.Histogram(x=df[col], name=col, showlegend=False)"
             code = f"""
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-
+{histogram_import}
 # Criar subplots para múltiplas variáveis
 numeric_cols = {cols_to_plot}
 n_cols = len(numeric_cols)
@@ -139,7 +191,7 @@ for idx, col in enumerate(numeric_cols):
     col_pos = idx % 3 + 1
     
     fig.add_trace(
-        go.Histogram(x=df[col], name=col, showlegend=False),
+        {histogram_trace},
         row=row, col=col_pos
     )
 
@@ -150,7 +202,7 @@ fig.update_layout(height=300*n_rows,
             return code
     
     # 5. VALORES FALTANTES - Gráfico de barras
-    if any(word in question_lower for word in ['faltante', 'missing', 'nulo', 'nan', 'vazio']):
+    if "missing" in intents:
         code = """
 import plotly.express as px
 import pandas as pd
@@ -192,15 +244,29 @@ def get_visualization_agent(api_key: str):
     chain = prompt | llm | StrOutputParser()
     return chain
 
-def run_visualization(api_key: str, df: pd.DataFrame, analysis_results: str, user_request: str):
+def _record_chart_source(stats: dict | None, source: str):
+    """Conta a origem do gráfico: 'statistical', 'template' (ambos sem LLM) ou 'llm'."""
+    if stats is not None:
+        stats[source] = stats.get(source, 0) + 1
+
+def run_visualization(api_key: str, df: pd.DataFrame, analysis_results: str, user_request: str,
+                      stats: dict | None = None):
+    # Tipo de gráfico pedido explicitamente tem prioridade sobre as visualizações estatísticas
+    chart_plan = plan_chart(df, user_request)
+    if chart_plan:
+        _record_chart_source(stats, "template")
+        return register_trusted_code(generate_chart_code(chart_plan))
+
     # TENTAR GERAR VISUALIZAÇÃO AUTOMÁTICA PRIMEIRO
     auto_viz_code = generate_statistical_visualization(df, user_request)
     
     if auto_viz_code:
         # Se detectou análise estatística, retornar código automático
-        return auto_viz_code
-    
+        _record_chart_source(stats, "statistical")
+        return register_trusted_code(auto_viz_code)
+
     # Caso contrário, usar o agente LLM para gerar código customizado
+    _record_chart_source(stats, "llm")
     agent = get_visualization_agent(api_key)
     dataset_preview = get_dataset_preview(df)
     raw_code = agent.invoke({
@@ -1,18 +1,23 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px  # Necessário para o exec
-import matplotlib.pyplot as plt
-import numpy as np
 from uuid import uuid4
 import time
 
 # Importações dos módulos do projeto
 from utils.config import get_config
-from utils.memory import SupabaseMemory
+from utils.services import get_memory_service, get_health_monitor
 from utils.data_loader import load_csv, get_dataset_info
-from utils.chart_cache import exec_with_cache  # Import do cache de gráficos
-from components.ui_components import build_sidebar, display_chat_message, display_code_with_streamlit_suggestion
+from utils.chart_cache import exec_with_cache, execute_code, get_chart_cache  # Import do cache de gráficos
+from utils.column_index import get_column_index
+from utils.code_executor import get_worker_pool, get_shared_dataset, figure_from_json
+from utils.code_validation import CodeValidationError
+from utils.aggregated_charts import figure_payload_bytes
+from utils.analysis_results import AnalysisResult, AnalysisTable
+from utils.answer_cache import get_answer, put_answer, is_standalone_question
+from utils.session_warmup import warm_from_previous_sessions
+from utils.session_list import invalidate_session_list
+from components.ui_components import build_sidebar, display_chat_message, display_code_with_streamlit_suggestion, display_analysis_tables, display_payload_caption, display_chart_stats, display_execution_report, display_memory_stats, display_service_status, display_turn_latency
 from components.notebook_generator import create_jupyter_notebook
 from components.suggestion_generator import generate_dynamic_suggestions, get_fallback_suggestions, extract_conversation_context
 
@@ -90,6 +95,22 @@ st.markdown("""
 
 # Configuração de debug (pode ser alterada para False em produção)
 DEBUG_MODE = False
+SETUP_MS_HISTORY = 50
+TURN_LATENCY_HISTORY = 50
+
+
+def record_turn_latency(turn_start: float, cached: bool):
+    """Registra a latência do turno: da pergunta recebida até a resposta exibida."""
+    st.session_state.turn_latency_ms.append({
+        "total_ms": (time.perf_counter() - turn_start) * 1000,
+        "cached": cached,
+    })
+    del st.session_state.turn_latency_ms[:-TURN_LATENCY_HISTORY]
+
+
+def _ask_suggestion(suggestion: str):
+    # Callback do botão: a pergunta é processada na execução disparada pelo clique
+    st.session_state.last_question = suggestion
 
 # Inicializa o estado da sessão
 if 'session_id' not in st.session_state:
@@ -100,14 +121,40 @@ if 'df' not in st.session_state:
     st.session_state.df = None
 if 'df_info' not in st.session_state:
     st.session_state.df_info = None
+if 'dataset_hash' not in st.session_state:
+    # Hash do conteúdo do arquivo: chave das respostas reaproveitadas entre sessões
+    st.session_state.dataset_hash = None
+if 'warmup_summary' not in st.session_state:
+    st.session_state.warmup_summary = None
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'conversation_history' not in st.session_state:
     st.session_state.conversation_history = ""
 if 'all_analyses_history' not in st.session_state:
     st.session_state.all_analyses_history = ""
+if 'history_intent_state' not in st.session_state:
+    st.session_state.history_intent_state = {}
+if 'analysis_results' not in st.session_state:
+    st.session_state.analysis_results = []
+if 'chart_stats' not in st.session_state:
+    # Origem dos gráficos gerados: automáticos/templates (sem LLM) ou LLM
+    st.session_state.chart_stats = {"statistical": 0, "template": 0, "llm": 0}
+if 'setup_ms' not in st.session_state:
+    # Custo de preparação dos serviços em cada reexecução do script (últimas SETUP_MS_HISTORY)
+    st.session_state.setup_ms = []
+if 'suggestions' not in st.session_state:
+    # Sugestões geradas para `suggestions_history` (regeneradas só quando o histórico muda)
+    st.session_state.suggestions = []
+    st.session_state.suggestions_history = None
+if 'turn_latency_ms' not in st.session_state:
+    st.session_state.turn_latency_ms = []
+if 'memory_round_trips' not in st.session_state:
+    # Requisições ao banco por turno: síncronas (no caminho da resposta) e gravações enfileiradas
+    st.session_state.memory_round_trips = []
 
 # --- Carregamento de Configurações e Serviços ---
+# Configuração, memória e monitor de saúde são criados uma vez por processo (st.cache_resource)
+setup_start = time.perf_counter()
 config = get_config()
 
 # Verificar se a chave da API está configurada
@@ -115,21 +162,14 @@ if not config["google_api_key"]:
     st.error("ERRO: Chave da API do Google não configurada. Por favor, configure a variável de ambiente GOOGLE_API_KEY no arquivo .streamlit/secrets.toml")
     st.stop()
 
-# Verificar se as configurações do Supabase estão configuradas
-# Só inicializa o Supabase se as credenciais estiverem disponíveis
-if config["supabase_url"] and config["supabase_key"]:
-    try:
-        memory = SupabaseMemory(url=config["supabase_url"], key=config["supabase_key"])
-    except Exception as e:
-        # Supabase opcional - sistema funciona sem ele
-        memory = None
-else:
-    # Supabase opcional - memória da sessão continua funcionando
-    memory = None
+# Supabase quando as credenciais estiverem disponíveis, senão SQLite local
+memory = get_memory_service(config["supabase_url"], config["supabase_key"])
+health_monitor = get_health_monitor(config["supabase_url"], config["supabase_key"])
+st.session_state.setup_ms.append((time.perf_counter() - setup_start) * 1000)
+del st.session_state.setup_ms[:-SETUP_MS_HISTORY]
 
 # --- Interface do Usuário (Sidebar) ---
 uploaded_file = build_sidebar(memory, st.session_state.user_id)
-
 # --- Lógica Principal de Processamento do CSV ---
 if uploaded_file is not None:
     st.sidebar.success("SUCESSO: Arquivo CSV carregado com sucesso!")
@@ -138,6 +178,11 @@ if uploaded_file is not None:
                 df, file_hash = load_csv(uploaded_file)
                 st.session_state.df = df
                 st.session_state.df_info = get_dataset_info(df, uploaded_file.name)
+                # Índice de colunas construído no carregamento (resolução de menções sem LLM)
+                get_column_index(df)
+                # Pool de execução pré-aquecido e dataset publicado em memória compartilhada
+                if get_worker_pool() is not None:
+                    get_shared_dataset(df)
 
                 # Cria uma nova sessão no Supabase (se disponível)
                 try:
@@ -146,26 +191,33 @@ if uploaded_file is not None:
                         dataset_hash=file_hash,
                         user_id=st.session_state.user_id
                     )
+                    # A lista de sessões da sidebar passa a incluir a nova
+                    invalidate_session_list(st.session_state.user_id)
                     
                     # Define o ID da sessão no estado
                     st.session_state.session_id = session_id
                     
                     # Carrega o histórico da sessão, se existir
                     try:
-                        session_history = memory.get_session_history(session_id)
+                        # Apenas a página mais recente, sem os gráficos (carregados sob demanda)
+                        session_history = memory.get_history_page(session_id)
                         
                         # Restaura o histórico de conversas
                         if session_history["conversations"]:
                             st.session_state.conversation_history = "\n".join(
-                                f"{'Usuário' if i % 2 == 0 else 'Assistente'}: {msg['question'] if i % 2 == 0 else msg['answer']}"
-                                for i, msg in enumerate(session_history["conversations"])
+                                f"Usuário: {msg['question']}\nAssistente: {msg['answer']}"
+                                for msg in session_history["conversations"]
                             )
                         
-                        # Restaura as análises
+                        # Restaura as análises (texto + tabelas estruturadas)
                         if session_history["analyses"]:
-                            st.session_state.all_analyses_history = "\n".join(
-                                f"Análise: {analysis['results'].get('analysis', '')}"
+                            st.session_state.analysis_results = [
+                                AnalysisResult.from_dict(analysis['results'])
                                 for analysis in session_history["analyses"]
+                            ]
+                            st.session_state.all_analyses_history = "\n".join(
+                                f"Análise: {result.to_prompt()}"
+                                for result in st.session_state.analysis_results
                             )
                             
                     except Exception as e:
@@ -178,6 +230,20 @@ if uploaded_file is not None:
                     st.session_state.session_id = None
                     st.session_state.conversation_history = ""
                     st.session_state.all_analyses_history = f"Análise iniciada para o dataset: {uploaded_file.name}\n"
+
+                # Dataset já analisado antes: respostas, gráficos e análises de sessões anteriores aquecem os caches
+                st.session_state.dataset_hash = file_hash
+                try:
+                    warmup = warm_from_previous_sessions(memory, file_hash, df, st.session_state.user_id,
+                                                         st.session_state.session_id)
+                    if warmup["analyses"] and not st.session_state.analysis_results:
+                        st.session_state.analysis_results = warmup["analyses"]
+                        st.session_state.all_analyses_history += "\n".join(
+                            f"Análise: {result.to_prompt()}" for result in warmup["analyses"]
+                        ) + "\n"
+                    st.session_state.warmup_summary = warmup
+                except Exception as e:
+                    print(f"Erro ao reaproveitar sessões anteriores: {e}")
                 st.rerun()  # Força recarregamento para mostrar o dataset
             except ValueError as e:
                 st.error(f"ERRO: Falha ao carregar o arquivo: {e}")
@@ -196,6 +262,7 @@ if uploaded_file is None and st.session_state.get('df') is not None:
     st.session_state.messages = []
     st.session_state.conversation_history = ""
     st.session_state.all_analyses_history = ""
+    st.session_state.analysis_results = []
 
 # --- Área Principal de Exibição ---
 st.title("Sistema de Análise Exploratória de Dados")
@@ -213,78 +280,12 @@ if st.session_state.df is not None:
 
     # Exibe mensagens do histórico (preservar mensagens existentes)
     for i, message in enumerate(st.session_state.messages):
-        display_chat_message(message["role"], message["content"], message.get("chart_fig"), generated_code=message.get("generated_code"))
-
-    # Exibir gráfico preservado apenas se ainda não estiver nas mensagens
-    if 'last_chart' in st.session_state and st.session_state.last_chart:
-        assistant_has_chart = any(
-            message.get("role") == "assistant" and message.get("chart_fig") is not None
-            for message in st.session_state.messages
-        )
-
-        if assistant_has_chart:
-            # Evitar duplicação removendo o gráfico preservado redundante
-            del st.session_state.last_chart
-            if 'last_chart_code' in st.session_state:
-                del st.session_state.last_chart_code
-        else:
-            st.success("GRAFICO: Visualizacao preservada da analise anterior:")
-            try:
-                chart_key = f"preserved_chart_{len(st.session_state.messages)}"
-                st.plotly_chart(st.session_state.last_chart, use_container_width=True, key=chart_key)
-            except Exception as e:
-                st.warning(f"AVISO: Erro ao exibir grafico preservado: {e}")
-                # Limpar gráfico preservado se houver erro
-                if 'last_chart' in st.session_state:
-                    del st.session_state.last_chart
-
-    # --- Sugestões Dinâmicas de Perguntas ---
-    st.subheader("Sugestoes de Perguntas:")
-
-    # Sempre gerar sugestões baseadas no histórico atual
-    if st.session_state.conversation_history.strip():
-        try:
-            dataset_preview = get_dataset_preview(st.session_state.df)
-
-            # Extrair contexto da conversa para melhorar as sugestões
-            conversation_context = extract_conversation_context(st.session_state.conversation_history)
-
-            # Adicionar contexto ao histórico para o agente
-            enriched_history = st.session_state.conversation_history
-            if conversation_context["analysis_types"]:
-                enriched_history += f"\n\nTipos de análise realizados: {', '.join(conversation_context['analysis_types'])}"
-            if conversation_context["agents_used"]:
-                enriched_history += f"\nAgentes utilizados: {', '.join(conversation_context['agents_used'])}"
-
-            # Gerar novas sugestões sempre com o histórico atualizado
-            suggestions = generate_dynamic_suggestions(
-                api_key=config["google_api_key"],
-                dataset_preview=dataset_preview,
-                conversation_history=enriched_history
-            )
-
-        except Exception as e:
-            st.warning(f"AVISO: Erro ao gerar sugestoes: {e}")
-            suggestions = get_fallback_suggestions()
-            st.info(f"Usando sugestoes padrao: {len(suggestions)} sugestoes")
-    else:
-        # Se não há histórico, usar sugestões padrão
-        suggestions = get_fallback_suggestions()
-
-    # Garantir que sempre tenhamos sugestões
-    if not suggestions:
-        suggestions = get_fallback_suggestions()
-        st.warning("AVISO: Usando sugestoes padrao")
-
-    # Exibir as sugestões
-    st.write(f"Mostrando {len(suggestions[:3])} sugestoes:")
-    cols = st.columns(3)
-    for i, suggestion in enumerate(suggestions[:3]):
-        if cols[i].button(suggestion, use_container_width=True, key=f"suggestion_{i}"):
-            st.session_state.last_question = suggestion
+        display_chat_message(message["role"], message["content"], message.get("chart_fig"), generated_code=message.get("generated_code"),
+                             tables=message.get("tables"), payload_bytes=message.get("chart_payload_bytes"))
 
     if prompt := st.chat_input("Faça sua pergunta sobre os dados...") or st.session_state.get('last_question'):
         st.session_state.last_question = None  # Limpa a sugestão imediatamente
+        turn_start = time.perf_counter()
 
         # Adiciona a pergunta do usuário ao histórico e exibe
         st.session_state.messages.append({"role": "user", "content": prompt})
@@ -295,6 +296,7 @@ if st.session_state.df is not None:
         
         # Inicializa conversation_id como None
         conversation_id = None
+        round_trips_before = memory.round_trip_count() if memory else None
         
         # Registrar a conversa no banco de dados
         if st.session_state.session_id:
@@ -307,396 +309,479 @@ if st.session_state.df is not None:
             except Exception as e:
                 st.warning(f"AVISO: Erro ao registrar conversa: {e}")
 
-        with st.spinner("Analisando e gerando resposta..."):
-            try:
-                # 1. CoordinatorAgent decide o que fazer
-                coordinator_decision = run_coordinator(
-                    api_key=config["google_api_key"],
-                    df=st.session_state.df,
-                    conversation_history=st.session_state.conversation_history,
-                    user_question=prompt
-                )
+        # Pergunta já respondida para este dataset (nesta ou em sessões anteriores): sem chamar o LLM.
+        # Continuações ("sim", "explique melhor") dependem dos turnos anteriores e não são reaproveitadas
+        standalone_question = is_standalone_question(prompt, get_column_index(st.session_state.df))
+        cached_answer = (get_answer(st.session_state.user_id, st.session_state.dataset_hash, prompt)
+                         if standalone_question else None)
+        if cached_answer is not None:
+            cached_figure = None
+            if cached_answer["chart_id"] and memory is not None:
+                try:
+                    fig_json = memory.get_chart(cached_answer["chart_id"])
+                    cached_figure = figure_from_json(fig_json) if fig_json else None
+                except Exception as e:
+                    print(f"Erro ao carregar gráfico da resposta em cache: {e}")
+            cached_content = f"{cached_answer['answer']}\n\n*♻️ Resposta reaproveitada de uma análise anterior deste dataset.*"
+            cached_tables = [AnalysisTable.from_dict(table) for table in cached_answer["tables"]]
+            display_chat_message("assistant", cached_content, cached_figure, generated_code=cached_answer["generated_code"],
+                                 tables=cached_tables)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": cached_content,
+                "chart_fig": cached_figure,
+                "generated_code": cached_answer["generated_code"],
+                "tables": cached_tables,
+            })
+            st.session_state.conversation_history += f"Assistente: {cached_answer['answer']}\n"
+            if conversation_id:
+                memory.update_conversation(conversation_id, cached_answer["answer"], cached_answer["chart_id"],
+                                       st.session_state.session_id)
+            record_turn_latency(turn_start, cached=True)
+        else:
+            # Etapa atual do turno, atualizada no mesmo lugar (sem pausas artificiais)
+            turn_status = st.empty()
+            turn_status.info("Analisando e gerando resposta...")
+            with st.spinner("Analisando e gerando resposta..."):
+                try:
+                    # 1. CoordinatorAgent decide o que fazer
+                    coordinator_decision = run_coordinator(
+                        api_key=config["google_api_key"],
+                        df=st.session_state.df,
+                        conversation_history=st.session_state.conversation_history,
+                        user_question=prompt
+                    )
 
-                agent_to_call = coordinator_decision.get("agent_to_call")
-                question_for_agent = coordinator_decision.get("question_for_agent")
-                
-                # Inicializa conversation_id como None
-                conversation_id = None
+                    agent_to_call = coordinator_decision.get("agent_to_call")
+                    question_for_agent = coordinator_decision.get("question_for_agent")
 
-                st.info(f"Roteando para: **{agent_to_call}**")
-                time.sleep(1)
+                    turn_status.info(f"Roteando para: **{agent_to_call}**")
 
-                bot_response_content = ""
-                chart_figure = None
-                generated_code = ""
+                    bot_response_content = ""
+                    chart_figure = None
+                    generated_code = ""
+                    analysis_tables = []
+                    # Resposta bem-sucedida e completa por si só (pode ser reaproveitada pelo cache de respostas)
+                    answer_complete = False
 
-                # 2. Roteia para o agente apropriado
-                # NOVO: Suporte para análises estatísticas completas (BOTH = DataAnalyst + Visualization)
-                if agent_to_call == "BOTH":
-                    # Primeiro: DataAnalystAgent gera tabelas estatísticas
-                    bot_response_content = run_data_analyst(
-                        api_key=config["google_api_key"],
-                        df=st.session_state.df,
-                        analysis_context=st.session_state.all_analyses_history,
-                        specific_question=question_for_agent
-                    )
-                    st.session_state.all_analyses_history += f"Análise Estatística:\n{bot_response_content}\n"
+                    # 2. Roteia para o agente apropriado
+                    # NOVO: Suporte para análises estatísticas completas (BOTH = DataAnalyst + Visualization)
+                    if agent_to_call == "BOTH":
+                        # Primeiro: DataAnalystAgent gera tabelas estatísticas
+                        analysis_result = run_data_analyst(
+                            api_key=config["google_api_key"],
+                            df=st.session_state.df,
+                            analysis_context=st.session_state.all_analyses_history,
+                            specific_question=question_for_agent
+                        )
+                        bot_response_content = analysis_result.text
+                        analysis_tables = analysis_result.tables
+                        st.session_state.analysis_results.append(analysis_result)
+                        st.session_state.all_analyses_history += f"Análise Estatística:\n{analysis_result.to_prompt()}\n"
+                    
+                        # Armazenar a análise no banco de dados
+                        if st.session_state.session_id:
+                            try:
+                                memory.store_analysis(
+                                    session_id=st.session_state.session_id,
+                                    conversation_id=conversation_id,
+                                    analysis_type="data_analysis",
+                                    results=analysis_result.to_dict()
+                                )
+                            except Exception as e:
+                                st.warning(f"AVISO: Erro ao salvar analise: {e}")
                     
-                    # Armazenar a análise no banco de dados
-                    if st.session_state.session_id:
+                        # Segundo: VisualizationAgent gera gráfico
                         try:
-                            memory.store_analysis(
-                                session_id=st.session_state.session_id,
-                                conversation_id=conversation_id,
-                                analysis_type="data_analysis",
-                                results={"analysis": bot_response_content}
+                            generated_code = run_visualization(
+                                api_key=config["google_api_key"],
+                                df=st.session_state.df,
+                                analysis_results=analysis_result.to_prompt(),  # Passa a análise recém-gerada
+                                user_request=question_for_agent,
+                                stats=st.session_state.chart_stats
                             )
+
+                            # Executar código do gráfico
+                            try:
+                                chart_figure = exec_with_cache(generated_code, st.session_state.df,
+                                                              session_id=st.session_state.user_id)
+                                if chart_figure:
+                                    bot_response_content += "\n\n---\n\n**VISUALIZAÇÃO GERADA:**\n\n(Gráfico abaixo)"
+                                    st.session_state.all_analyses_history += f"Visualização Gerada: {question_for_agent}\n"
+                                    answer_complete = True
+                                else:
+                                    bot_response_content += "\n\nAVISO: Não foi possível gerar visualização."
+                            except Exception as e:
+                                bot_response_content += f"\n\nAVISO: Erro ao gerar visualização: {e}"
                         except Exception as e:
-                            st.warning(f"AVISO: Erro ao salvar analise: {e}")
+                            bot_response_content += f"\n\nAVISO: Erro no agente de visualização: {e}"
                     
-                    # Segundo: VisualizationAgent gera gráfico
-                    try:
-                        generated_code = run_visualization(
+                        agent_to_call = "BOTH"  # Manter para lógica posterior
+
+                    elif agent_to_call == "DataAnalystAgent":
+                        analysis_result = run_data_analyst(
                             api_key=config["google_api_key"],
                             df=st.session_state.df,
-                            analysis_results=bot_response_content,  # Passa a análise recém-gerada
-                            user_request=question_for_agent
+                            analysis_context=st.session_state.all_analyses_history,
+                            specific_question=question_for_agent
                         )
-
-                        # Executar código do gráfico
-                        try:
-                            chart_figure = exec_with_cache(generated_code, st.session_state.df)
-                            if chart_figure:
-                                bot_response_content += "\n\n---\n\n**VISUALIZAÇÃO GERADA:**\n\n(Gráfico abaixo)"
-                                st.session_state.all_analyses_history += f"Visualização Gerada: {question_for_agent}\n"
-                            else:
-                                bot_response_content += "\n\nAVISO: Não foi possível gerar visualização."
-                        except Exception as e:
-                            bot_response_content += f"\n\nAVISO: Erro ao gerar visualização: {e}"
-                    except Exception as e:
-                        bot_response_content += f"\n\nAVISO: Erro no agente de visualização: {e}"
+                        bot_response_content = analysis_result.text
+                        analysis_tables = analysis_result.tables
+                        st.session_state.analysis_results.append(analysis_result)
+                        st.session_state.all_analyses_history += f"Análise Estatística:\n{analysis_result.to_prompt()}\n"
+                        answer_complete = True
                     
-                    agent_to_call = "BOTH"  # Manter para lógica posterior
+                        # Armazenar a análise no banco de dados
+                        if st.session_state.session_id:
+                            try:
+                                memory.store_analysis(
+                                    session_id=st.session_state.session_id,
+                                    conversation_id=conversation_id,
+                                    analysis_type="data_analysis",
+                                    results=analysis_result.to_dict()
+                                )
+                            except Exception as e:
+                                st.warning(f"AVISO: Erro ao salvar analise: {e}")
 
-                elif agent_to_call == "DataAnalystAgent":
-                    bot_response_content = run_data_analyst(
-                        api_key=config["google_api_key"],
-                        df=st.session_state.df,
-                        analysis_context=st.session_state.all_analyses_history,
-                        specific_question=question_for_agent
-                    )
-                    st.session_state.all_analyses_history += f"Análise Estatística:\n{bot_response_content}\n"
-                    
-                    # Armazenar a análise no banco de dados
-                    if st.session_state.session_id:
+                    elif agent_to_call == "VisualizationAgent":
                         try:
-                            memory.store_analysis(
-                                session_id=st.session_state.session_id,
-                                conversation_id=conversation_id,
-                                analysis_type="data_analysis",
-                                results={"analysis": bot_response_content}
+                            generated_code = run_visualization(
+                                api_key=config["google_api_key"],
+                                df=st.session_state.df,
+                                analysis_results=st.session_state.all_analyses_history,
+                                user_request=question_for_agent,
+                                stats=st.session_state.chart_stats
                             )
+
+                            # Tenta executar o código para gerar o gráfico usando cache
+                            try:
+                                # Usar cache otimizado para gráficos
+                                chart_figure = exec_with_cache(generated_code, st.session_state.df,
+                                                              session_id=st.session_state.user_id)
+
+                                if chart_figure:
+                                    bot_response_content = "Aqui está a visualização que você pediu."
+                                    st.session_state.all_analyses_history += f"Visualização Gerada: {question_for_agent}\n"
+                                    answer_complete = True
+                                else:
+                                    bot_response_content = "O código foi gerado, mas não criou uma figura válida. Verifique se o código define uma variável 'fig'."
+                            except CodeValidationError as ve:
+                                problems = "\n".join(f"- {issue}" for issue in ve.issues)
+                                bot_response_content = f"O código gerado foi rejeitado na validação (não foi executado):\n{problems}\n\nCódigo:\n```python\n{generated_code}\n```"
+                            except SyntaxError as se:
+                                bot_response_content = f"Erro de sintaxe no código gerado: {se}\n\nCódigo com erro:\n```python\n{generated_code}\n```"
+                            except NameError as ne:
+                                bot_response_content = f"Erro: variável não definida no código: {ne}\n\nCódigo com erro:\n```python\n{generated_code}\n```"
+                            except Exception as e:
+                                bot_response_content = f"Erro ao executar código do gráfico: {e}\n\nCódigo que falhou:\n```python\n{generated_code}\n```"
+
                         except Exception as e:
-                            st.warning(f"AVISO: Erro ao salvar analise: {e}")
+                            bot_response_content = f"Erro no agente de visualização: {e}\n\nTente reformular sua pergunta ou verifique se sua chave da API do Google está configurada corretamente."
 
-                elif agent_to_call == "VisualizationAgent":
-                    try:
-                        generated_code = run_visualization(
+                    elif agent_to_call == "ConsultantAgent":
+                        bot_response_content = run_consultant(
                             api_key=config["google_api_key"],
                             df=st.session_state.df,
-                            analysis_results=st.session_state.all_analyses_history,
-                            user_request=question_for_agent
+                            all_analyses=st.session_state.all_analyses_history,
+                            user_question=question_for_agent
                         )
+                    
+                        # Armazenar a conclusão no banco de dados
+                        if st.session_state.session_id:
+                            try:
+                                memory.store_conclusion(
+                                    session_id=st.session_state.session_id,
+                                    conversation_id=conversation_id,
+                                    conclusion_text=bot_response_content,
+                                    confidence_score=0.9  # Pontuação de confiança padrão
+                                )
+                            except Exception as e:
+                                st.warning(f"AVISO: Erro ao salvar conclusao: {e}")
 
-                        # Tenta executar o código para gerar o gráfico usando cache
-                        try:
-                            # Usar cache otimizado para gráficos
-                            chart_figure = exec_with_cache(generated_code, st.session_state.df)
-
-                            if chart_figure:
-                                bot_response_content = "Aqui está a visualização que você pediu."
-                                st.session_state.all_analyses_history += f"Visualização Gerada: {question_for_agent}\n"
-                            else:
-                                bot_response_content = "O código foi gerado, mas não criou uma figura válida. Verifique se o código define uma variável 'fig'."
-                        except SyntaxError as se:
-                            bot_response_content = f"Erro de sintaxe no código gerado: {se}\n\nCódigo com erro:\n```python\n{generated_code}\n```"
-                        except NameError as ne:
-                            bot_response_content = f"Erro: variável não definida no código: {ne}\n\nCódigo com erro:\n```python\n{generated_code}\n```"
-                        except Exception as e:
-                            bot_response_content = f"Erro ao executar código do gráfico: {e}\n\nCódigo que falhou:\n```python\n{generated_code}\n```"
+                    elif agent_to_call == "CodeGeneratorAgent":
+                        analysis_context = f"Pergunta do usuário: {prompt}\n\nContexto da conversa:\n{st.session_state.all_analyses_history}"
+                        generated_code = run_code_generator(
+                            api_key=config["google_api_key"],
+                            dataset_info=str(st.session_state.df_info),
+                            analysis_to_convert=analysis_context
+                        )
+                        # Não incluir o código na resposta - ele será exibido automaticamente na interface
+                        bot_response_content = "CODIGO GERADO: O codigo Python foi gerado e sera executado automaticamente na interface!"
 
-                    except Exception as e:
-                        bot_response_content = f"Erro no agente de visualização: {e}\n\nTente reformular sua pergunta ou verifique se sua chave da API do Google está configurada corretamente."
+                    else:
+                        bot_response_content = "Desculpe, não entendi qual agente usar. Poderia reformular sua pergunta?"
 
-                elif agent_to_call == "ConsultantAgent":
-                    bot_response_content = run_consultant(
-                        api_key=config["google_api_key"],
-                        df=st.session_state.df,
-                        all_analyses=st.session_state.all_analyses_history,
-                        user_question=question_for_agent
-                    )
-                    
-                    # Armazenar a conclusão no banco de dados
-                    if st.session_state.session_id:
+                    # Tamanho do JSON do gráfico enviado ao navegador (também valida a serialização)
+                    chart_payload_bytes = None
+                    if chart_figure:
                         try:
-                            memory.store_conclusion(
-                                session_id=st.session_state.session_id,
-                                conversation_id=conversation_id,
-                                conclusion_text=bot_response_content,
-                                confidence_score=0.9  # Pontuação de confiança padrão
-                            )
+                            chart_payload_bytes = figure_payload_bytes(chart_figure)
                         except Exception as e:
-                            st.warning(f"AVISO: Erro ao salvar conclusao: {e}")
-
-                elif agent_to_call == "CodeGeneratorAgent":
-                    analysis_context = f"Pergunta do usuário: {prompt}\n\nContexto da conversa:\n{st.session_state.all_analyses_history}"
-                    generated_code = run_code_generator(
-                        api_key=config["google_api_key"],
-                        dataset_info=str(st.session_state.df_info),
-                        analysis_to_convert=analysis_context
-                    )
-                    # Não incluir o código na resposta - ele será exibido automaticamente na interface
-                    bot_response_content = "CODIGO GERADO: O codigo Python foi gerado e sera executado automaticamente na interface!"
-
-                else:
-                    bot_response_content = "Desculpe, não entendi qual agente usar. Poderia reformular sua pergunta?"
-
-                # 3. Exibe a resposta do bot
-                execution_container = None
-                results_container = None
-
-                # Executar código automaticamente se foi gerado
-                if generated_code:
-                    # Exibir código com containers para execução
-                    with st.chat_message("assistant"):
-                        st.markdown(bot_response_content)
+                            # Manter o gráfico mesmo se não for serializável
+                            pass
 
-                        # Sempre exibir o código gerado PRIMEIRO
-                        execution_container, results_container = display_code_with_streamlit_suggestion(generated_code, auto_execute=True)
+                    # 3. Exibe a resposta do bot
+                    execution_container = None
+                    results_container = None
+
+                    # Executar código automaticamente se foi gerado
+                    if generated_code:
+                        # Exibir código com containers para execução
+                        with st.chat_message("assistant"):
+                            st.markdown(bot_response_content)
+                            if analysis_tables:
+                                display_analysis_tables(analysis_tables)
+
+                            # Sempre exibir o código gerado PRIMEIRO
+                            execution_container, results_container = display_code_with_streamlit_suggestion(generated_code, auto_execute=True)
+
+                            # Exibir gráfico APENAS se foi gerado pelo VisualizationAgent ou BOTH (evita duplicação)
+                            if chart_figure and agent_to_call in ["VisualizationAgent", "BOTH"]:
+                                try:
+                                    # Usar chave única para evitar re-renderização
+                                    chart_key = f"chart_{len(st.session_state.messages)}_{hash(str(chart_figure))}"
+                                    st.plotly_chart(chart_figure, use_container_width=True, key=chart_key)
+                                    display_payload_caption(chart_payload_bytes)
+                                except Exception as e:
+                                    st.warning(f"⚠️ Erro ao exibir gráfico na execução inicial: {str(e)}")
+
+                        # Remover deep copy para melhorar performance
+                        # chart_to_save = copy.deepcopy(chart_to_save) se necessário
+
+                        st.session_state.messages.append({
+                            "role": "assistant",
+                            "content": bot_response_content,
+                            "chart_fig": chart_figure,
+                            "chart_payload_bytes": chart_payload_bytes,
+                            "generated_code": generated_code,
+                            "tables": analysis_tables
+                        })
+
+                        if execution_container is None:
+                            st.error("ERRO: Containers nao foram criados corretamente!")
+                            # Não usar return aqui, continuar a execução
+
+                        # Executar o código gerado (apenas para CodeGeneratorAgent)
+                        if agent_to_call == "CodeGeneratorAgent":
+                            try:
+                                execution_container.markdown("**Status:** 🔄 Executando código Python gerado...")
+
+                                # Verificar se o DataFrame está disponível
+                                if st.session_state.df is None:
+                                    results_container.markdown("**ERRO:** Nenhum arquivo CSV foi carregado.")
+                                    st.error("ERRO: Nenhum DataFrame disponivel para analise.")
+                                else:
+                                    # Execução única por (dataset, código): reruns reaproveitam o resultado em cache
+                                    execution = execute_code(generated_code, st.session_state.df,
+                                                             session_id=st.session_state.user_id)
+                                    origin = f" (resultado em cache: {execution.cached})" if execution.cached else ""
+                                    execution_container.markdown(f"**Status:** ✅ Código executado com sucesso!{origin}")
+
+                                    with results_container.container():
+                                        if execution.note:
+                                            st.info(f"🧪 {execution.note}")
+                                        if execution.stdout:
+                                            st.markdown("**Saída do código:**")
+                                            st.code(execution.stdout, language='text')
+                                        for name, frame in execution.dataframes.items():
+                                            st.markdown(f"**DataFrame `{name}`:**")
+                                            st.dataframe(frame, use_container_width=True)
+                                        if execution.result is not None:
+                                            st.markdown(f"**Valor de retorno:** {execution.result}")
+
+                                        # Verificar se foi gerada uma figura
+                                        if isinstance(execution.fig, go.Figure):
+                                            st.markdown("**Resultados:** Visualização gerada automaticamente:")
+                                            fig = execution.fig
+                                            # Usar chave única para evitar re-renderização
+                                            fig_key = f"code_chart_{len(st.session_state.messages)}_{id(fig)}"
+                                            st.plotly_chart(fig, use_container_width=True, key=fig_key)
+                                            chart_payload_bytes = figure_payload_bytes(fig)
+                                            display_payload_caption(chart_payload_bytes)
+
+                                            # Atualizar a mensagem para incluir a figura
+                                            st.session_state.messages[-1]["chart_fig"] = fig
+                                            st.session_state.messages[-1]["chart_payload_bytes"] = chart_payload_bytes
+                                            chart_figure = fig
+                                        elif not (execution.stdout or execution.dataframes or execution.result):
+                                            st.markdown("**Resultados:** Código executado sem gerar visualização específica.")
+
+                                        display_execution_report(execution)
+                            except CodeValidationError as ve:
+                                problems = "\n".join(f"- {issue}" for issue in ve.issues)
+                                execution_container.markdown("**Status:** ERRO: código rejeitado na validação (não executado)")
+                                results_container.markdown(f"**Problemas encontrados:**\n{problems}")
+                            except Exception as e:
+                                execution_container.markdown(f"**Status:** ERRO na execucao: {str(e)}")
+                                results_container.markdown(f"**Detalhes do erro:** {str(e)}")
+                                st.error(f"ERRO: Falha na execucao do codigo: {e}")
+                        else:
+                            # Para VisualizationAgent, mostrar que o código já foi executado
+                            if execution_container and results_container:
+                                execution_container.markdown("**Status:** ✅ Código executado com sucesso!")
+                                results_container.markdown("**Resultados:** Gráfico gerado automaticamente acima.")
 
-                        # Exibir gráfico APENAS se foi gerado pelo VisualizationAgent ou BOTH (evita duplicação)
-                        if chart_figure and agent_to_call in ["VisualizationAgent", "BOTH"]:
+                    else:
+                        # Para agentes sem código, usar display_chat_message normalmente
+                        display_chat_message("assistant", bot_response_content, chart_figure, generated_code=None,
+                                             tables=analysis_tables, payload_bytes=chart_payload_bytes)
+
+                        # Atualizar a mensagem no histórico
+                        st.session_state.messages.append({
+                            "role": "assistant",
+                            "content": bot_response_content,
+                            "chart_fig": chart_figure,
+                            "chart_payload_bytes": chart_payload_bytes,
+                            "generated_code": None,
+                            "tables": analysis_tables
+                        })
+
+                    # Atualiza o histórico de texto APÓS processar a resposta
+                    st.session_state.conversation_history += f"Assistente: {bot_response_content}\n"
+
+                    # 4. Salva no Supabase
+                    try:
+                        chart_id = None
+                        if chart_figure:
+                            try:
+                                # JSON completo, comprimido e deduplicado pelo conteúdo (restaurável sem perdas)
+                                chart_id = memory.store_chart(chart_figure.to_json())
+                            except Exception as chart_error:
+                                st.warning(f"⚠️ Não foi possível salvar o gráfico: {str(chart_error)}")
+
+                        # Inicializa a variável conv_id
+                        conv_id = None
+                        # Atualizar a conversa existente em vez de criar uma nova
+                        if 'conversation_id' in locals() and conversation_id:
+                            try:
+                                # Atualiza a conversa existente
+                                memory.update_conversation(conversation_id, bot_response_content, chart_id,
+                                                           st.session_state.session_id)
+                                conv_id = conversation_id
+                            except Exception as e:
+                                st.warning(f"AVISO: Erro ao atualizar conversa: {e}")
+                        else:
+                            # Se não tiver um ID de conversa, cria uma nova
                             try:
-                                # Usar chave única para evitar re-renderização
-                                chart_key = f"chart_{len(st.session_state.messages)}_{hash(str(chart_figure))}"
-                                st.plotly_chart(chart_figure, use_container_width=True, key=chart_key)
+                                # Cria uma nova conversa e pega o ID retornado
+                                conv_response = memory.log_conversation(
+                                    session_id=st.session_state.session_id,
+                                    question=prompt,
+                                    answer=bot_response_content,
+                                    chart_id=chart_id
+                                )
+                                conv_id = conv_response  # Atribui o ID retornado
                             except Exception as e:
-                                st.warning(f"⚠️ Erro ao exibir gráfico na execução inicial: {str(e)}")
+                                st.warning(f"AVISO: Erro ao salvar conversa: {e}")
+                    except Exception as db_error:
+                        st.warning(f"AVISO: Erro ao salvar conversa no banco: {str(db_error)}")
+                        conv_id = None
 
-                    # Atualizar a mensagem no histórico com verificação robusta
-                    chart_to_save = chart_figure
-                    if chart_figure:
+                    # Próximas perguntas iguais sobre este dataset reaproveitam a resposta (só as bem-sucedidas;
+                    # erros e o código do CodeGeneratorAgent, que depende da execução na interface, ficam de fora)
+                    if answer_complete and standalone_question:
+                        put_answer(st.session_state.user_id, st.session_state.dataset_hash, prompt, bot_response_content,
+                                   chart_id, [table.to_dict() for table in analysis_tables], generated_code or None)
+
+                    if generated_code:
+                        # Tentar salvar o código gerado, mas com proteção contra timeout
                         try:
-                            # Verificar se o gráfico é serializável
-                            chart_figure.to_json()
-                        except Exception as e:
-                            # Manter o gráfico mesmo se não for serializável
-                            pass
+                            # Verificar se o código é muito longo (limite de 5000 caracteres)
+                            if len(generated_code) > 5000:
+                                # Truncar o código para evitar timeout
+                                truncated_code = generated_code[:5000] + "\n\n# ... (código truncado para evitar timeout no banco de dados)"
+                                code_to_save = truncated_code
+                            else:
+                                code_to_save = generated_code
 
-                    # Remover deep copy para melhorar performance
-                    # chart_to_save = copy.deepcopy(chart_to_save) se necessário
+                            memory.store_generated_code(
+                                session_id=st.session_state.session_id,
+                                conversation_id=conv_id,
+                                code_type='visualization' if agent_to_call in ("VisualizationAgent", "BOTH") else 'analysis',
+                                python_code=code_to_save,
+                                description=question_for_agent
+                            )
+                        except Exception as db_error:
+                            # Se houver erro no banco, apenas logar e continuar
+                            st.warning(f"AVISO: Codigo executado com sucesso, mas houve problema ao salvar: {str(db_error)}")
+                            # Não interromper o fluxo principal
 
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": bot_response_content,
-                        "chart_fig": chart_to_save,
-                        "generated_code": generated_code
-                    })
+                    if round_trips_before is not None:
+                        round_trips_after = memory.round_trip_count()
+                        st.session_state.memory_round_trips.append({
+                            kind: round_trips_after[kind] - round_trips_before[kind] for kind in round_trips_after
+                        })
 
-                    if execution_container is None:
-                        st.error("ERRO: Containers nao foram criados corretamente!")
-                        # Não usar return aqui, continuar a execução
+                    turn_status.success("SUCESSO: Analise concluida com sucesso!")
+                    record_turn_latency(turn_start, cached=False)
 
-                    # Executar o código gerado (apenas para CodeGeneratorAgent)
-                    if agent_to_call == "CodeGeneratorAgent":
-                        try:
-                            execution_container.markdown("**Status:** 🔄 Executando código Python gerado...")
-
-                            # Criar ambiente seguro para execução
-                            local_scope = {
-                                "df": st.session_state.df,
-                                "pd": pd,
-                                "px": px,
-                                "go": go,
-                                "st": st,
-                                "plt": plt,
-                                "np": np
-                            }
-
-                            # Verificar se o DataFrame está disponível
-                            if st.session_state.df is None:
-                                results_container.markdown("**ERRO:** Nenhum arquivo CSV foi carregado.")
-                                st.error("ERRO: Nenhum DataFrame disponivel para analise.")
-                                # Não usar return, continuar com o fluxo
-
-                            # Executar o código usando cache otimizado
-                            exec_with_cache(generated_code, local_scope)
-
-                            # Verificar se foi gerada uma figura
-                            if 'fig' in local_scope:
-                                execution_container.markdown("**Status:** ✅ Código executado com sucesso!")
-                                results_container.markdown("**Resultados:** Visualização gerada automaticamente:")
+                except Exception as e:
+                    turn_status.empty()
+                    st.error(f"ERRO: Ocorreu um erro inesperado: {e}")
 
-                                # Exibir a figura gerada APENAS UMA VEZ
-                                fig = local_scope['fig']
-                                # Usar chave única para evitar re-renderização
-                                fig_key = f"code_chart_{len(st.session_state.messages)}_{id(fig)}"
-                                st.plotly_chart(fig, use_container_width=True, key=fig_key)
+    # --- Sugestões Dinâmicas de Perguntas ---
+    # Depois da resposta do turno: já refletem o novo contexto, sem reexecutar o script
+    st.subheader("Sugestoes de Perguntas:")
 
-                                # Atualizar a mensagem para incluir a figura
-                                st.session_state.messages[-1]["chart_fig"] = fig
-                                chart_figure = fig
+    # Novas sugestões só quando o histórico mudou (reexecuções por cliques reaproveitam as anteriores)
+    if st.session_state.suggestions_history != st.session_state.conversation_history:
+        if st.session_state.conversation_history.strip():
+            try:
+                dataset_preview = get_dataset_preview(st.session_state.df)
 
-                            else:
-                                execution_container.markdown("**Status:** ✅ Código executado com sucesso!")
-                                results_container.markdown("**Resultados:** Código executado sem gerar visualização específica.")
+                # Extrair contexto da conversa para melhorar as sugestões
+                conversation_context = extract_conversation_context(
+                    st.session_state.conversation_history,
+                    scan_state=st.session_state.history_intent_state
+                )
 
-                            # Capturar outras saídas importantes
-                            if 'result' in local_scope:
-                                results_container.markdown(f"**Valor de retorno:** {local_scope['result']}")
-                        except Exception as e:
-                            execution_container.markdown(f"**Status:** ERRO na execucao: {str(e)}")
-                            results_container.markdown(f"**Detalhes do erro:** {str(e)}")
-                            st.error(f"ERRO: Falha na execucao do codigo: {e}")
-                    else:
-                        # Para VisualizationAgent, mostrar que o código já foi executado
-                        if execution_container and results_container:
-                            execution_container.markdown("**Status:** ✅ Código executado com sucesso!")
-                            results_container.markdown("**Resultados:** Gráfico gerado automaticamente acima.")
-
-                else:
-                    # Para agentes sem código, usar display_chat_message normalmente
-                    display_chat_message("assistant", bot_response_content, chart_figure, generated_code=None)
-
-                    # Atualizar a mensagem no histórico
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": bot_response_content,
-                        "chart_fig": chart_figure,
-                        "generated_code": None
-                    })
-
-                # Atualiza o histórico de texto APÓS processar a resposta
-                st.session_state.conversation_history += f"Assistente: {bot_response_content}\n"
-
-                # Forçar atualização das sugestões na próxima renderização
-                st.session_state.suggestions = []  # Forçar regeneração
-
-                # 4. Salva no Supabase
-                try:
-                    chart_json = None
-                    if chart_figure:
-                        try:
-                            # Converter gráfico para JSON com timeout protection
-                            chart_json = chart_figure.to_json()
-                            # Se o JSON for muito grande, truncar para evitar timeout
-                            if len(chart_json) > 10000:  # Reduzir limite para ~10KB
-                                chart_json = chart_json[:10000] + "\n... (truncado para evitar timeout)"
-                        except Exception as json_error:
-                            # Se não conseguir converter, salvar apenas metadados básicos
-                            st.warning(f"⚠️ Não foi possível converter gráfico para JSON: {str(json_error)}")
-                            chart_json = f"Gráfico gerado ({type(chart_figure).__name__})"
-
-                    # Inicializa a variável conv_id
-                    conv_id = None
-                    # Atualizar a conversa existente em vez de criar uma nova
-                    if 'conversation_id' in locals() and conversation_id:
-                        try:
-                            # Atualiza a conversa existente
-                            memory.client.table("conversations").update({
-                                "answer": bot_response_content,
-                                "chart_json": chart_json
-                            }).eq("id", conversation_id).execute()
-                            conv_id = conversation_id
-                        except Exception as e:
-                            st.warning(f"AVISO: Erro ao atualizar conversa: {e}")
-                    else:
-                        # Se não tiver um ID de conversa, cria uma nova
-                        try:
-                            # Cria uma nova conversa e pega o ID retornado
-                            conv_response = memory.log_conversation(
-                                session_id=st.session_state.session_id,
-                                question=prompt,
-                                answer=bot_response_content,
-                                chart_json=chart_json
-                            )
-                            conv_id = conv_response  # Atribui o ID retornado
-                        except Exception as e:
-                            st.warning(f"AVISO: Erro ao salvar conversa: {e}")
-                except Exception as db_error:
-                    st.warning(f"AVISO: Erro ao salvar conversa no banco: {str(db_error)}")
-                    conv_id = None
+                # Adicionar contexto ao histórico para o agente
+                enriched_history = st.session_state.conversation_history
+                if conversation_context["analysis_types"]:
+                    enriched_history += f"\n\nTipos de análise realizados: {', '.join(conversation_context['analysis_types'])}"
+                if conversation_context["agents_used"]:
+                    enriched_history += f"\nAgentes utilizados: {', '.join(conversation_context['agents_used'])}"
 
-                if generated_code:
-                    # Tentar salvar o código gerado, mas com proteção contra timeout
-                    try:
-                        # Verificar se o código é muito longo (limite de 5000 caracteres)
-                        if len(generated_code) > 5000:
-                            # Truncar o código para evitar timeout
-                            truncated_code = generated_code[:5000] + "\n\n# ... (código truncado para evitar timeout no banco de dados)"
-                            code_to_save = truncated_code
-                        else:
-                            code_to_save = generated_code
-
-                        memory.store_generated_code(
-                            session_id=st.session_state.session_id,
-                            conversation_id=conv_id,
-                            code_type='visualization' if agent_to_call == "VisualizationAgent" else 'analysis',
-                            python_code=code_to_save,
-                            description=question_for_agent
-                        )
-                    except Exception as db_error:
-                        # Se houver erro no banco, apenas logar e continuar
-                        st.warning(f"AVISO: Codigo executado com sucesso, mas houve problema ao salvar: {str(db_error)}")
-                        # Não interromper o fluxo principal
-
-                # Recarregar a página para atualizar as sugestões com o novo histórico
-                # Mas apenas se estivermos em modo debug OU se não houver gráfico para evitar problemas
-                should_rerun = False  # Otimização: reduzir reruns desnecessários
-
-                if chart_figure:
-                    # Se há gráfico, só fazer rerun em modo debug para evitar problemas de renderização
-                    if DEBUG_MODE:
-                        st.success("SUCESSO: Resposta processada com sucesso! (Grafico preservado)")
-                        should_rerun = True
-                    else:
-                        st.success("SUCESSO: Analise concluida com sucesso!")
-                        should_rerun = False
-                else:
-                    # Se não há gráfico, rerun é seguro
-                    if DEBUG_MODE:
-                        st.success("SUCESSO: Resposta processada com sucesso!")
-                    else:
-                        st.success("SUCESSO: Analise concluida com sucesso!")
-                    should_rerun = False  # Otimização: evitar rerun desnecessário
-
-                if should_rerun and DEBUG_MODE:
-                    st.rerun()
-
-                # FORÇAR ATUALIZAÇÃO DAS SUGESTÕES APÓS CADA RESPOSTA
-                st.info("Atualizando sugestoes com o novo contexto...")
-
-                # Preservar gráficos antes do re-run apenas se necessário
-                if chart_figure:
-                    st.session_state.last_chart = chart_figure
-                    st.session_state.last_chart_code = generated_code
-
-                # Forçar re-run para atualizar sugestões com o novo contexto
-                # Mas apenas se não estivermos em modo debug para evitar problemas
-                if not DEBUG_MODE:
-                    time.sleep(0.5)  # Pequena pausa para mostrar a mensagem
-                    st.rerun()
-                else:
-                    st.success("SUCESSO: Sugestoes atualizadas (modo debug)")
-
-                # Limpar gráficos preservados após o re-run bem-sucedido
-                if 'last_chart' in st.session_state:
-                    del st.session_state.last_chart
-                if 'last_chart_code' in st.session_state:
-                    del st.session_state.last_chart_code
+                suggestions = generate_dynamic_suggestions(
+                    api_key=config["google_api_key"],
+                    dataset_preview=dataset_preview,
+                    conversation_history=enriched_history
+                )
 
             except Exception as e:
-                st.error(f"ERRO: Ocorreu um erro inesperado: {e}")
+                st.warning(f"AVISO: Erro ao gerar sugestoes: {e}")
+                suggestions = get_fallback_suggestions()
+        else:
+            # Se não há histórico, usar sugestões padrão
+            suggestions = get_fallback_suggestions()
+
+        # Garantir que sempre tenhamos sugestões
+        st.session_state.suggestions = suggestions or get_fallback_suggestions()
+        st.session_state.suggestions_history = st.session_state.conversation_history
+
+    # Exibir as sugestões (o clique registra a pergunta antes da próxima execução)
+    suggestions = st.session_state.suggestions[:3]
+    cols = st.columns(3)
+    for i, suggestion in enumerate(suggestions):
+        cols[i].button(suggestion, use_container_width=True, key=f"suggestion_{i}",
+                       on_click=_ask_suggestion, args=(suggestion,))
+
+# Métricas da sidebar por último: refletem o turno que acabou de ser respondido
+display_chart_stats(st.session_state.chart_stats, get_chart_cache().stats())
+display_memory_stats(st.session_state.memory_round_trips)
+display_turn_latency(st.session_state.turn_latency_ms)
+writer = getattr(memory, "writer", None)
+failed_writes = {
+    "session": writer.failed_count(st.session_state.session_id) if st.session_state.session_id else 0,
+    "total": writer.stats["failed"],
+} if writer else None
+display_service_status(health_monitor.status if health_monitor else None, st.session_state.setup_ms, failed_writes)
+if st.session_state.warmup_summary and (st.session_state.warmup_summary["answers"] or st.session_state.warmup_summary["charts"]):
+    st.sidebar.caption(
+        f"♻️ Dataset já analisado: {st.session_state.warmup_summary['answers']} respostas, "
+        f"{st.session_state.warmup_summary['charts']} gráficos e {len(st.session_state.warmup_summary['analyses'])} "
+        f"análises reaproveitadas de {st.session_state.warmup_summary['sessions']} sessões"
+    )
 
 # Adiciona um footer
 st.markdown("---")
@@ -1,6 +1,7 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from agents.agent_setup import get_llm
+from utils.intent import scan_incremental, STATISTICS_INTENTS
 import json
 
 SUGGESTION_PROMPT_TEMPLATE = """
@@ -113,12 +114,14 @@ def generate_dynamic_suggestions(api_key: str, dataset_preview: str, conversatio
         print(f"Erro ao gerar sugestões dinâmicas: {e}")
         return get_fallback_suggestions()[:3]
 
-def extract_conversation_context(conversation_history: str) -> dict:
+def extract_conversation_context(conversation_history: str, scan_state: dict | None = None) -> dict:
     """
     Extrai informações contextuais do histórico da conversa.
 
     Args:
         conversation_history: Histórico completo da conversa
+        scan_state: Estado persistente da varredura (ex.: guardado no session_state).
+            Quando fornecido, apenas o trecho novo do histórico é analisado.
 
     Returns:
         Dicionário com informações contextuais
@@ -134,52 +137,40 @@ def extract_conversation_context(conversation_history: str) -> dict:
     }
 
     if not conversation_history:
+        if scan_state is not None:
+            scan_state.clear()
         return context
 
-    # Palavras-chave para identificar tipos de análise
-    stat_keywords = ["estatística", "correlação", "média", "mediana", "desvio", "outlier", "distribuição"]
-    viz_keywords = ["gráfico", "plot", "visualização", "histograma", "scatter", "heatmap", "box plot"]
-    insight_keywords = ["insight", "recomendação", "conclusão", "negócio", "estratégia", "otimizar"]
-    code_keywords = ["código", "python", "notebook", "script", "função"]
-
-    conversation_lower = conversation_history.lower()
+    intents = scan_incremental(conversation_history, scan_state if scan_state is not None else {})
 
     # Verificar tipos de análise realizados
-    for keyword in stat_keywords:
-        if keyword in conversation_lower:
-            context["has_statistics"] = True
-            context["analysis_types"].append("estatística")
-            break
-
-    for keyword in viz_keywords:
-        if keyword in conversation_lower:
-            context["has_visualization"] = True
-            context["analysis_types"].append("visualização")
-            break
-
-    for keyword in insight_keywords:
-        if keyword in conversation_lower:
-            context["has_insights"] = True
-            context["analysis_types"].append("insights")
-            break
-
-    for keyword in code_keywords:
-        if keyword in conversation_lower:
-            context["has_code"] = True
-            context["analysis_types"].append("código")
-            break
+    if any(intent in intents for intent in STATISTICS_INTENTS):
+        context["has_statistics"] = True
+        context["analysis_types"].append("estatística")
+
+    if "visualization" in intents:
+        context["has_visualization"] = True
+        context["analysis_types"].append("visualização")
+
+    if "insights" in intents:
+        context["has_insights"] = True
+        context["analysis_types"].append("insights")
+
+    if "code" in intents:
+        context["has_code"] = True
+        context["analysis_types"].append("código")
 
     # Identificar agentes usados (baseado em padrões de resposta)
-    if "dataanalystagent" in conversation_lower or context["has_statistics"]:
+    if "agent_data_analyst" in intents or context["has_statistics"]:
         context["agents_used"].append("DataAnalystAgent")
 
-    if "visualizationagent" in conversation_lower or context["has_visualization"]:
+    if "agent_visualization" in intents or context["has_visualization"]:
         context["agents_used"].append("VisualizationAgent")
 
-    if "consultantagent" in conversation_lower or context["has_insights"]:
+    if "agent_consultant" in intents or context["has_insights"]:
         context["agents_used"].append("ConsultantAgent")
 
-    if "codegeneratoragent" in conversation_lower or context["has_code"]:
+    if "agent_code_generator" in intents or context["has_code"]:
         context["agents_used"].append("CodeGeneratorAgent")
 
     return context
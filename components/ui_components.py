@@ -12,6 +12,34 @@ except ImportError:
     PDF_AVAILABLE = False
     st.warning("⚠️ Bibliotecas de PDF ainda não instaladas. Aguarde alguns minutos e recarregue a página.")
 
+from utils.session_list import get_session_list
+
+SESSIONS_PER_PAGE = 10
+
+# Fragmentos (st.fragment a partir do Streamlit 1.37, st.experimental_fragment em 1.33-1.36): a interação
+# reexecuta apenas a função, não o script inteiro. Em versões anteriores, a função é chamada normalmente
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda function: function)
+
+
+@_fragment
+def display_session_page(sessions):
+    """Uma página da lista de sessões em um único bloco, com navegação entre páginas."""
+    pages = (len(sessions) - 1) // SESSIONS_PER_PAGE + 1
+    page = min(st.session_state.get('session_list_page', 0), pages - 1)
+    start = page * SESSIONS_PER_PAGE
+    st.info("\n\n".join(sessions[start:start + SESSIONS_PER_PAGE]))
+    if pages > 1:
+        # Callbacks atualizam a página antes da reexecução (só do fragmento) disparada pelo clique
+        previous_col, label_col, next_col = st.columns([1, 2, 1])
+        previous_col.button("◀", key="session_list_previous", disabled=page == 0,
+                            on_click=_set_session_page, args=(page - 1,))
+        label_col.caption(f"Página {page + 1} de {pages} ({len(sessions)} sessões)")
+        next_col.button("▶", key="session_list_next", disabled=page == pages - 1,
+                        on_click=_set_session_page, args=(page + 1,))
+
+
+def _set_session_page(page):
+    st.session_state.session_list_page = page
 
 
 def build_sidebar(memory, user_id):
@@ -35,41 +63,14 @@ def build_sidebar(memory, user_id):
 
         st.subheader("Histórico de Sessões")
         try:
-            sessions = memory.get_user_sessions(user_id)
+            # Lista cacheada (TTL) e invalidada ao criar sessão: sem consulta ao banco a cada reexecução
+            sessions = get_session_list(memory, user_id) if memory is not None else None
         except Exception as e:
             # Se o Supabase não estiver configurado ou houver erro, ignora
             sessions = None
-            
+
         if sessions:
-            for session in sessions:
-                try:
-                    # Converte a string de data/hora para um objeto datetime com timezone UTC
-                    # O formato esperado é algo como '2025-09-26T22:26:00.000000+00:00'
-                    created_at_str = session['created_at']
-                    
-                    # Verifica se já tem timezone (deve ter vindo do Supabase com +00:00)
-                    if 'Z' in created_at_str or '+00:00' in created_at_str:
-                        # Se já tiver timezone UTC, converte para objeto datetime com timezone
-                        created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-                        # Converte para o fuso horário local do sistema
-                        local_time = created_at.astimezone()
-                        # Obtém o offset local formatado (ex: -03:00)
-                        offset = local_time.strftime('%z')
-                        offset_str = f"UTC{offset[:3]}:{offset[3:5]}"
-                    else:
-                        # Se não tiver timezone, assume UTC e converte para local
-                        created_at = datetime.fromisoformat(created_at_str).replace(tzinfo=timezone.utc)
-                        local_time = created_at.astimezone()
-                        offset = local_time.strftime('%z')
-                        offset_str = f"UTC{offset[:3]}:{offset[3:5]}"
-                    
-                    st.info(
-                        f"ID: ...{session['id'][-6:]}\n"
-                        f"Dataset: {session['dataset_name']}\n"
-                        f"Data: {local_time.strftime('%d/%m/%Y %H:%M')} ({offset_str})"
-                    )
-                except Exception as e:
-                    st.error(f"Erro ao exibir sessão: {e}")
+            display_session_page(sessions)
         else:
             st.write("Nenhuma sessão anterior encontrada.")
 
@@ -109,7 +110,7 @@ def build_sidebar(memory, user_id):
     return uploaded_file
 
 
-def display_chat_message(role, content, chart_fig=None, key=None, generated_code=None):
+def display_chat_message(role, content, chart_fig=None, key=None, generated_code=None, tables=None, payload_bytes=None):
     """Exibe uma mensagem no chat."""
     execution_container = None
     results_container = None
@@ -117,6 +118,10 @@ def display_chat_message(role, content, chart_fig=None, key=None, generated_code
     with st.chat_message(role):
         st.markdown(content)
 
+        # Tabelas estatísticas estruturadas (renderizadas direto dos DataFrames)
+        if tables and role == "assistant":
+            display_analysis_tables(tables)
+
         # Sempre exibe o código se estiver disponível (ANTES do gráfico)
         # O código deve aparecer antes do gráfico para melhor UX
         if generated_code and role == "assistant":
@@ -137,6 +142,7 @@ def display_chat_message(role, content, chart_fig=None, key=None, generated_code
 
                     # Exibir o gráfico com verificação de erro
                     st.plotly_chart(chart_fig, use_container_width=True, key=key)
+                    display_payload_caption(payload_bytes)
                 else:
                     st.warning("⚠️ Gráfico não está mais disponível.")
                     st.info("O gráfico foi gerado anteriormente mas não pôde ser restaurado.")
@@ -148,6 +154,114 @@ def display_chat_message(role, content, chart_fig=None, key=None, generated_code
     return execution_container, results_container
 
 
+def display_analysis_tables(tables):
+    """Exibe as tabelas de um AnalysisResult como DataFrames nativos do Streamlit."""
+    st.markdown("---")
+    st.markdown("**TABELAS ESTATÍSTICAS GERADAS**")
+    for table in tables:
+        st.markdown(f"**{table.title}:**")
+        st.dataframe(table.data, use_container_width=True)
+
+
+def display_payload_caption(payload_bytes):
+    """Mostra o tamanho do JSON do gráfico enviado ao navegador."""
+    if payload_bytes is None:
+        return
+    if payload_bytes >= 1024 * 1024:
+        size = f"{payload_bytes / (1024 * 1024):.1f} MB"
+    else:
+        size = f"{payload_bytes / 1024:.1f} KB"
+    st.caption(f"📦 Payload do gráfico: {size}")
+
+
+def display_chart_stats(stats, cache_stats=None):
+    """Mostra na sidebar quantos gráficos foram gerados sem chamar o LLM e as métricas do cache."""
+    total = sum(stats.values())
+    if not total:
+        return
+    without_llm = stats.get("statistical", 0) + stats.get("template", 0)
+    with st.sidebar:
+        st.caption(
+            f"📊 Gráficos sem LLM: {without_llm} de {total} "
+            f"({stats.get('template', 0)} por templates, {stats.get('statistical', 0)} estatísticos)"
+        )
+        if cache_stats:
+            st.caption(
+                f"🗃️ Cache de gráficos: {cache_stats['hits']} acertos, {cache_stats['misses']} falhas, "
+                f"{cache_stats['evictions']} remoções ({cache_stats['bytes'] / (1024 * 1024):.1f} MB)"
+            )
+
+
+def display_memory_stats(round_trips):
+    """Mostra na sidebar as requisições ao banco de dados do último turno e a média por turno."""
+    if not round_trips:
+        return
+    last = round_trips[-1]
+    average_sync = sum(turn["sync"] for turn in round_trips) / len(round_trips)
+    with st.sidebar:
+        st.caption(
+            f"🗄️ Banco de dados no último turno: {last['sync']} requisições síncronas, "
+            f"{last['queued']} gravações em segundo plano (média: {average_sync:.1f} síncronas/turno)"
+        )
+
+
+def display_turn_latency(turns):
+    """Mostra na sidebar a latência do último turno (pergunta até resposta exibida) e a média."""
+    if not turns:
+        return
+    last = turns[-1]
+    average = sum(turn["total_ms"] for turn in turns) / len(turns)
+    origin = " (resposta reaproveitada)" if last["cached"] else ""
+    with st.sidebar:
+        st.caption(f"⏱️ Último turno: {last['total_ms'] / 1000:.2f} s{origin} "
+                   f"(média de {len(turns)} turnos: {average / 1000:.2f} s)")
+
+
+def display_service_status(health, setup_ms, failed_writes=None):
+    """
+    Mostra na sidebar o estado do banco (verificado em segundo plano), as gravações perdidas
+    (`failed_writes`: {"session", "total"}) e o custo de preparação por execução.
+    """
+    with st.sidebar:
+        if failed_writes and failed_writes["session"]:
+            st.warning(f"⚠️ {failed_writes['session']} registro(s) desta sessão não foram salvos no histórico")
+        if failed_writes and failed_writes["total"]:
+            st.caption(f"🗄️ Gravações que falharam no servidor: {failed_writes['total']}")
+        if health and health["ok"] is False:
+            st.caption(f"🔴 Banco de dados inacessível: {health['error']}")
+        elif health and health["ok"]:
+            st.caption(f"🟢 Banco de dados disponível ({health['latency_ms']:.0f} ms)")
+        if setup_ms:
+            st.caption(f"⚙️ Preparação dos serviços: {setup_ms[-1]:.1f} ms nesta execução "
+                       f"(média: {sum(setup_ms) / len(setup_ms):.1f} ms)")
+
+
+def display_execution_report(execution):
+    """Mostra o tempo de execução, as reescritas do otimizador e as instruções mais lentas."""
+    if "exec_ms" in execution.timings:
+        st.caption(f"⏱️ Execução: {execution.timings['exec_ms']:.0f} ms")
+    if "dry_run_ms" in execution.timings:
+        st.caption(f"🧪 Teste em amostras: {execution.timings['dry_run_ms']:.0f} ms "
+                   f"(estimativa nos dados completos: {execution.timings['estimated_full_ms'] / 1000:.1f} s)")
+    optimization = execution.optimization
+    statements = execution.timings.get("statements", [])
+    if not (optimization["rewrites"] or optimization["warnings"] or statements):
+        return
+    with st.expander("⚡ Relatório de desempenho do código", expanded=False):
+        if optimization["rewrites"]:
+            st.markdown("**Reescritas vetorizadas aplicadas:**")
+            st.markdown("\n".join(f"- `{rewrite}`" for rewrite in optimization["rewrites"]))
+        if optimization["warnings"]:
+            st.markdown("**Padrões lentos não reescritos:**")
+            st.markdown("\n".join(f"- {warning}" for warning in optimization["warnings"]))
+        if statements:
+            st.markdown("**Instruções mais lentas:**")
+            st.dataframe(
+                pd.DataFrame(statements, columns=["Linha", "Tempo (ms)", "Código"]).round({"Tempo (ms)": 1}),
+                use_container_width=True, hide_index=True,
+            )
+
+
 def _is_chart_valid(chart_fig):
     """Verifica se um gráfico Plotly é válido e pode ser exibido."""
     try:
@@ -0,0 +1,22 @@
+-- Gráficos endereçados por conteúdo: o JSON completo da figura é gravado uma única
+-- vez (comprimido com zlib e codificado em base64) e as conversas guardam apenas o
+-- `chart_id`. Executar no SQL Editor do Supabase antes de implantar esta versão:
+-- sem a tabela `charts` e a coluna `conversations.chart_id`, os lotes de gravação
+-- de conversas falham.
+
+create table if not exists public.charts (
+    id text primary key,                      -- hash blake2b (16 bytes, hex) do JSON da figura
+    created_at timestamptz not null default now(),
+    payload text not null,                    -- JSON comprimido (zlib) em base64
+    size_bytes integer                        -- tamanho do JSON original
+);
+
+alter table public.conversations
+    add column if not exists chart_id text references public.charts(id);
+
+-- `chart_json` (JSON truncado) não é mais gravado nem lido; mantido para as linhas
+-- antigas. Pode ser removido quando elas não forem mais necessárias:
+-- alter table public.conversations drop column if exists chart_json;
+
+-- Reaproveitamento entre sessões do mesmo usuário e dataset (find_sessions_by_dataset)
+create index if not exists idx_sessions_user_dataset on public.sessions (user_id, dataset_hash, created_at);
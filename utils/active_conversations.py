@@ -0,0 +1,43 @@
+"""
+Conversa ativa de cada sessão, rastreada no cliente e compartilhada pelos backends
+de memória (Supabase e SQLite): análises e conclusões são ligadas à conversa mais
+recente sem consultar o banco para encontrá-la.
+"""
+import threading
+from collections import OrderedDict
+
+# Sessões rastreadas no processo (as menos usadas saem ao passar do limite)
+MAX_ACTIVE_CONVERSATIONS = 1000
+
+_active_conversations = OrderedDict()
+_lock = threading.Lock()
+
+
+def remember_conversation(session_id: str, conversation_id: str, replace: bool = True):
+    """Registra a conversa ativa da sessão (`replace=False` mantém uma já registrada)."""
+    with _lock:
+        if replace or session_id not in _active_conversations:
+            _active_conversations[session_id] = conversation_id
+        _active_conversations.move_to_end(session_id)
+        while len(_active_conversations) > MAX_ACTIVE_CONVERSATIONS:
+            _active_conversations.popitem(last=False)
+
+
+def resolve_conversation(session_id: str, conversation_id: str | None, find_latest, create) -> str:
+    """
+    Conversa à qual ligar um registro: a informada, a ativa da sessão, a mais recente no banco
+    (`find_latest()`, None se não houver) ou uma nova (`create()`).
+    """
+    if conversation_id:
+        remember_conversation(session_id, conversation_id)
+        return conversation_id
+    with _lock:
+        active = _active_conversations.get(session_id)
+    if active:
+        return active
+    latest = find_latest()
+    if latest:
+        remember_conversation(session_id, latest)
+        return latest
+    # Se não houver conversa, cria uma vazia (registrada como ativa por log_conversation)
+    return create()
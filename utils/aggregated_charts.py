@@ -0,0 +1,163 @@
+"""
+Gráficos pré-agregados no servidor.
+Bins de histograma e estatísticas de box plot são calculados com numpy e
+enviados ao navegador como traces de barras/box já resumidos, de modo que o
+tamanho da figura depende do número de bins e não do número de linhas.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.express as px
+from plotly.subplots import make_subplots
+
+from utils.dataset_cache import get_or_compute
+
+DEFAULT_BINS = 50
+# Máximo de pontos de outlier desenhados por coluna (os extremos sempre entram)
+MAX_OUTLIER_POINTS = 200
+
+
+def _finite_values(series: pd.Series) -> np.ndarray:
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return values[np.isfinite(values)]
+
+
+def histogram_bins(series: pd.Series, nbins: int = DEFAULT_BINS):
+    """Retorna (bordas, contagens) do histograma, ignorando valores nulos/infinitos."""
+    values = _finite_values(series)
+    if values.size == 0:
+        return np.array([0.0, 1.0]), np.array([0])
+    counts, edges = np.histogram(values, bins=nbins)
+    return edges, counts
+
+
+def box_statistics(series: pd.Series, max_outlier_points: int = MAX_OUTLIER_POINTS) -> dict:
+    """
+    Quartis, média, cercas de Tukey (whiskers no último ponto dentro de 1.5*IQR),
+    total de outliers e uma amostra limitada deles para desenhar.
+    """
+    values = _finite_values(series)
+    if values.size == 0:
+        return {}
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    lower_bound, upper_bound = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    is_inside = (values >= lower_bound) & (values <= upper_bound)
+    inside = values[is_inside]
+    outliers = values[~is_inside]
+
+    if outliers.size > max_outlier_points:
+        if max_outlier_points < 2:
+            outliers = outliers[:0]
+        else:
+            # Amostra determinística, preservando o mínimo e o máximo
+            rng = np.random.default_rng(0)
+            sample = rng.choice(outliers, size=max_outlier_points - 2, replace=False)
+            outliers = np.concatenate([[outliers.min(), outliers.max()], sample])
+
+    return {
+        "q1": float(q1),
+        "median": float(median),
+        "q3": float(q3),
+        "mean": float(values.mean()),
+        "lowerfence": float(inside.min()) if inside.size else float(q1),
+        "upperfence": float(inside.max()) if inside.size else float(q3),
+        "lower_bound": float(lower_bound),
+        "upper_bound": float(upper_bound),
+        "n_outliers": int((~is_inside).sum()),
+        "outlier_sample": outliers,
+    }
+
+
+def get_box_statistics(df: pd.DataFrame, col: str) -> dict:
+    """Estatísticas de box plot/IQR da coluna, compartilhadas entre a análise e os gráficos."""
+    return get_or_compute(df, ("box_statistics", col), lambda: box_statistics(df[col]))
+
+
+def aggregated_histogram_trace(series: pd.Series, nbins: int = DEFAULT_BINS, name: str | None = None,
+                               **trace_kwargs) -> go.Bar:
+    """Trace de barras equivalente a go.Histogram, mas com as contagens já calculadas."""
+    edges, counts = histogram_bins(series, nbins)
+    return go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        name=name or str(series.name),
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate='[%{customdata[0]:.4g}, %{customdata[1]:.4g}): %{y}<extra></extra>',
+        **trace_kwargs
+    )
+
+
+def aggregated_box_trace(series: pd.Series, name: str | None = None, horizontal: bool = False,
+                         stats: dict | None = None, **trace_kwargs) -> go.Box:
+    """Box plot com estatísticas pré-calculadas (nenhum ponto bruto é enviado)."""
+    if stats is None:
+        stats = box_statistics(series, max_outlier_points=0)
+    name = name or str(series.name)
+    position = {"y": [name]} if horizontal else {"x": [name]}
+    if not stats:
+        return go.Box(name=name, **position, **trace_kwargs)
+    return go.Box(
+        name=name,
+        q1=[stats["q1"]], median=[stats["median"]], q3=[stats["q3"]],
+        lowerfence=[stats["lowerfence"]], upperfence=[stats["upperfence"]],
+        mean=[stats["mean"]],
+        orientation='h' if horizontal else 'v',
+        **position,
+        **trace_kwargs
+    )
+
+
+def aggregated_histogram(df: pd.DataFrame, col: str, nbins: int = DEFAULT_BINS, marginal_box: bool = True,
+                         title: str | None = None) -> go.Figure:
+    """Equivalente a px.histogram(df, x=col, marginal='box') com payload O(bins)."""
+    if marginal_box:
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.2, 0.8], vertical_spacing=0.02)
+        box = aggregated_box_trace(df[col], name=col, horizontal=True, stats=get_box_statistics(df, col),
+                                   showlegend=False)
+        fig.add_trace(box, row=1, col=1)
+        fig.add_trace(aggregated_histogram_trace(df[col], nbins, name=col, showlegend=False), row=2, col=1)
+        fig.update_yaxes(showticklabels=False, row=1, col=1)
+        fig.update_xaxes(title_text=col, row=2, col=1)
+        fig.update_yaxes(title_text='Contagem', row=2, col=1)
+    else:
+        fig = go.Figure(aggregated_histogram_trace(df[col], nbins, name=col, showlegend=False))
+        fig.update_layout(xaxis_title=col, yaxis_title='Contagem')
+    fig.update_layout(title=title or f'Distribuição de {col}', bargap=0.1)
+    return fig
+
+
+def aggregated_box_plot(df: pd.DataFrame, cols: list, title: str | None = None) -> go.Figure:
+    """
+    Box plots de várias colunas sem `melt`: quartis e whiskers pré-calculados
+    (reaproveitando o IQR já calculado pela análise) e uma amostra limitada de outliers.
+    """
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for idx, col in enumerate(cols):
+        stats = get_box_statistics(df, col)
+        if not stats:
+            continue
+        color = colors[idx % len(colors)]
+        fig.add_trace(go.Box(
+            name=str(col), x=[str(col)],
+            q1=[stats["q1"]], median=[stats["median"]], q3=[stats["q3"]],
+            lowerfence=[stats["lowerfence"]], upperfence=[stats["upperfence"]],
+            mean=[stats["mean"]],
+            marker_color=color, legendgroup=str(col)
+        ))
+        if len(stats["outlier_sample"]):
+            fig.add_trace(go.Scatter(
+                x=[str(col)] * len(stats["outlier_sample"]), y=stats["outlier_sample"],
+                mode='markers', name=f'{col} (outliers)',
+                marker=dict(color=color, size=5, opacity=0.6), legendgroup=str(col),
+                hovertemplate=f'{col}: %{{y}}<br>{stats["n_outliers"]} outliers no total<extra></extra>'
+            ))
+    fig.update_layout(title=title or 'Box Plot', xaxis_title='Variável', yaxis_title='Valor')
+    return fig
+
+
+def figure_payload_bytes(fig: go.Figure) -> int:
+    """Tamanho (em bytes) do JSON da figura enviado ao navegador."""
+    return len(fig.to_json())
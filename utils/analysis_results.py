@@ -0,0 +1,131 @@
+"""
+Resultados estruturados de análise.
+As tabelas estatísticas ficam como DataFrames na sessão; Markdown, tabelas do
+ReportLab e versões compactas para prompts são geradas apenas quando necessárias.
+"""
+import pandas as pd
+
+# Limites da renderização compacta enviada aos prompts dos agentes
+MAX_PROMPT_ROWS = 15
+MAX_PROMPT_COLS = 8
+MAX_CELL_CHARS = 40
+# Limites para persistência e PDF
+MAX_STORED_ROWS = 100
+MAX_PDF_ROWS = 40
+
+
+def _format_cell(value, max_chars: int | None = None) -> str:
+    if isinstance(value, float):
+        text = f"{value:.4f}".rstrip('0').rstrip('.') if pd.notna(value) else "NaN"
+    else:
+        text = str(value)
+    text = text.replace('\n', ' ')
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars - 1] + "…"
+    return text
+
+
+class AnalysisTable:
+    """Tabela gerada por uma análise (describe, correlação, outliers...)."""
+
+    def __init__(self, name: str, data: pd.DataFrame):
+        self.name = name
+        self.data = data
+
+    @property
+    def title(self) -> str:
+        return f"Tabela - {self.name.upper()}"
+
+    def _rows(self, max_rows: int | None, max_cols: int | None, max_chars: int | None):
+        """Cabeçalho + linhas como texto, já truncados."""
+        data = self.data
+        if max_cols is not None and data.shape[1] > max_cols:
+            data = data.iloc[:, :max_cols]
+        if max_rows is not None and len(data) > max_rows:
+            data = data.iloc[:max_rows]
+        header = [""] + [_format_cell(col, max_chars) for col in data.columns]
+        rows = [
+            [_format_cell(index, max_chars)] + [_format_cell(value, max_chars) for value in values]
+            for index, values in zip(data.index, data.itertuples(index=False, name=None))
+        ]
+        return header, rows
+
+    def _omitted_note(self, max_rows: int | None, max_cols: int | None) -> str:
+        omitted = []
+        if max_rows is not None and len(self.data) > max_rows:
+            omitted.append(f"{len(self.data) - max_rows} linhas")
+        if max_cols is not None and self.data.shape[1] > max_cols:
+            omitted.append(f"{self.data.shape[1] - max_cols} colunas")
+        return f"\n(... {' e '.join(omitted)} omitidas)" if omitted else ""
+
+    def to_markdown(self, max_rows: int | None = None, max_cols: int | None = None,
+                    max_chars: int | None = None) -> str:
+        """Tabela Markdown (com '|' escapado nas células)."""
+        header, rows = self._rows(max_rows, max_cols, max_chars)
+
+        def line(cells):
+            return "| " + " | ".join(cell.replace('|', '\\|') for cell in cells) + " |"
+
+        lines = [line(header), "|" + "|".join("---" for _ in header) + "|"]
+        lines.extend(line(row) for row in rows)
+        return "\n".join(lines) + self._omitted_note(max_rows, max_cols)
+
+    def to_prompt(self) -> str:
+        """Renderização compacta e truncada para uso em prompts."""
+        markdown = self.to_markdown(MAX_PROMPT_ROWS, MAX_PROMPT_COLS, MAX_CELL_CHARS)
+        return f"{self.title}:\n{markdown}"
+
+    def to_table_data(self, max_rows: int = MAX_PDF_ROWS) -> list:
+        """Lista de linhas (cabeçalho primeiro) para o ReportLab."""
+        header, rows = self._rows(max_rows, None, MAX_CELL_CHARS)
+        return [header] + rows
+
+    def to_dict(self, max_rows: int = MAX_STORED_ROWS) -> dict:
+        """Formato serializável em JSON para persistência."""
+        data = self.data.iloc[:max_rows]
+        return {
+            "name": self.name,
+            "columns": [str(col) for col in data.columns],
+            "index": [_format_cell(index) for index in data.index],
+            "data": [[_format_cell(value) for value in row] for row in data.itertuples(index=False, name=None)],
+        }
+
+    @classmethod
+    def from_dict(cls, payload: dict) -> "AnalysisTable":
+        data = pd.DataFrame(payload.get("data", []), columns=payload.get("columns"), index=payload.get("index"))
+        return cls(payload.get("name", "tabela"), data)
+
+
+class AnalysisResult:
+    """Resposta do DataAnalystAgent: texto do LLM + tabelas estatísticas tipadas."""
+
+    def __init__(self, text: str, tables: list | None = None):
+        self.text = text
+        self.tables = tables or []
+
+    def to_markdown(self) -> str:
+        """Texto completo com as tabelas em Markdown (usado apenas para exportação)."""
+        if not self.tables:
+            return self.text
+        parts = [self.text, "---", "## TABELAS ESTATÍSTICAS GERADAS"]
+        parts.extend(f"**{table.title}:**\n\n{table.to_markdown()}" for table in self.tables)
+        return "\n\n".join(parts)
+
+    def to_prompt(self) -> str:
+        """Texto + tabelas compactas, para o histórico de análises enviado aos agentes."""
+        if not self.tables:
+            return self.text
+        return self.text + "\n\n" + "\n\n".join(table.to_prompt() for table in self.tables)
+
+    def to_dict(self) -> dict:
+        return {"analysis": self.text, "tables": [table.to_dict() for table in self.tables]}
+
+    @classmethod
+    def from_dict(cls, payload: dict) -> "AnalysisResult":
+        tables = [AnalysisTable.from_dict(table) for table in payload.get("tables", [])]
+        return cls(payload.get("analysis", ""), tables)
+
+
+def tables_to_prompt(tables: list) -> str:
+    """Renderização compacta de várias tabelas para prompts."""
+    return "\n\n".join(table.to_prompt() for table in tables)
@@ -0,0 +1,65 @@
+"""
+Cache de respostas por dataset.
+Perguntas repetidas sobre o mesmo conteúdo (mesmo hash do arquivo) reaproveitam
+a resposta já gerada, inclusive de sessões anteriores do mesmo usuário, sem
+chamar o LLM. Só entram respostas bem-sucedidas e completas por si mesmas
+(texto, tabelas, gráfico e código) a perguntas que não dependem de turnos
+anteriores.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from utils.intent import detect_intents, normalize_text
+
+MAX_CACHED_ANSWERS = 2000
+# Perguntas curtas demais costumam ser continuações ("sim", "explique melhor")
+MIN_STANDALONE_WORDS = 4
+# Início ou palavras que indicam referência a turnos anteriores
+FOLLOW_UP_STARTS = {'e', 'sim', 'nao', 'ok', 'entao', 'agora', 'tambem', 'mas'}
+REFERENCE_WORDS = {'isso', 'isto', 'disso', 'nisso', 'desse', 'dessa', 'esse', 'essa', 'anterior', 'anteriores',
+                   'acima', 'outra', 'outro', 'outras', 'outros', 'mesmo', 'mesma', 'melhor', 'ele', 'ela',
+                   'dele', 'dela', 'deles', 'delas'}
+
+_answers = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """Minúsculas, sem acentos, pontuação e espaços repetidos."""
+    return " ".join(re.sub(r"[^\w\s]", " ", normalize_text(question)).split())
+
+
+def is_standalone_question(question: str, columns=None) -> bool:
+    """Pergunta completa por si só: cita colunas ou um tipo de análise e não se refere a turnos anteriores."""
+    words = normalize_question(question).split()
+    if len(words) < MIN_STANDALONE_WORDS or words[0] in FOLLOW_UP_STARTS or REFERENCE_WORDS.intersection(words):
+        return False
+    detection = detect_intents(question, columns)
+    return bool(detection["columns"] or detection["intents"])
+
+
+def get_answer(user_id: str, dataset_hash: str | None, question: str) -> dict | None:
+    """Resposta em cache: {"answer", "chart_id", "tables", "generated_code"} ou None."""
+    if not dataset_hash:
+        return None
+    key = (user_id, dataset_hash, normalize_question(question))
+    with _lock:
+        entry = _answers.get(key)
+        if entry is not None:
+            _answers.move_to_end(key)
+        return entry
+
+
+def put_answer(user_id: str, dataset_hash: str | None, question: str, answer: str, chart_id: str | None = None,
+               tables: list | None = None, generated_code: str | None = None):
+    """Guarda a resposta; `tables` no formato de AnalysisTable.to_dict()."""
+    if not dataset_hash or not answer:
+        return
+    key = (user_id, dataset_hash, normalize_question(question))
+    with _lock:
+        _answers[key] = {"answer": answer, "chart_id": chart_id, "tables": tables or [],
+                         "generated_code": generated_code}
+        _answers.move_to_end(key)
+        while len(_answers) > MAX_CACHED_ANSWERS:
+            _answers.popitem(last=False)
@@ -0,0 +1,56 @@
+"""
+Valores mais frequentes de colunas categóricas, inclusive de alta cardinalidade.
+A contagem é exata, com bincount sobre os códigos fatorizados em cache entre
+perguntas: com os códigos já calculados, uma passada O(n + únicos) é mais barata
+que qualquer resumo aproximado.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.dataset_cache import get_or_compute
+
+DEFAULT_TOP_K = 5
+
+CATEGORICAL_DTYPES = ['object', 'category', 'string', 'bool']
+
+
+def get_factorized_codes(df: pd.DataFrame, col: str):
+    """Retorna (códigos, valores únicos) da coluna, calculados uma única vez por dataset."""
+    def factorize():
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series.cat.codes.to_numpy(), series.cat.categories
+        return pd.factorize(series, use_na_sentinel=True)
+
+    return get_or_compute(df, ("factorized", col), factorize)
+
+
+def top_k_frequent(df: pd.DataFrame, col: str, k: int = DEFAULT_TOP_K) -> pd.DataFrame:
+    """Top-k valores da coluna com contagem e porcentagem (ignora valores nulos, como value_counts)."""
+    def compute():
+        codes, uniques = get_factorized_codes(df, col)
+        all_counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        # Ordenação estável: empates pela ordem de aparição (código menor), igual entre execuções
+        top = np.argsort(-all_counts, kind='stable')[:k]
+        top = top[all_counts[top] > 0]
+        top_codes, top_counts = top, all_counts[top]
+
+        return pd.DataFrame({
+            'Coluna': col,
+            'Valor': [uniques[c] for c in top_codes],
+            'Contagem': top_counts.astype(np.int64),
+            'Porcentagem': [f"{(c / len(df) * 100):.2f}%" for c in top_counts],
+            'Método': 'exato',
+        })
+
+    return get_or_compute(df, ("top_k_frequent", col, k), compute)
+
+
+def frequency_table(df: pd.DataFrame, k: int = DEFAULT_TOP_K, columns: list | None = None) -> pd.DataFrame:
+    """Tabela longa com os top-k valores das colunas informadas (padrão: todas as categóricas)."""
+    cat_cols = columns if columns is not None else df.select_dtypes(include=CATEGORICAL_DTYPES).columns
+    tables = [top_k_frequent(df, col, k) for col in cat_cols]
+    tables = [table for table in tables if not table.empty]
+    if not tables:
+        return pd.DataFrame()
+    return pd.concat(tables, ignore_index=True)
@@ -1,25 +1,320 @@
 """
-Cache simples para gráficos.
+Execução e cache do código gerado.
+`execute_code` é o ponto único de execução: valida, executa no pool isolado e
+guarda o ExecutionResult (figura, stdout, `result`, DataFrames e tempos).
+A chave combina a impressão digital do conteúdo do dataset com o código
+normalizado; os resultados ficam em um LRU limitado por memória, com cota por
+sessão e métricas de acerto/erro/remoção, e em uma camada em disco (JSON
+compactado com gzip) que sobrevive a reinícios e é compartilhada entre workers.
 """
+import ast
+import contextlib
+import gzip
 import hashlib
+import os
+import threading
 import time
+from collections import OrderedDict
+from pathlib import Path
+
 import plotly.graph_objects as go
 
-_cache = {}
+from utils.code_executor import ExecutionResult, ExecutionTimeout
+from utils.code_optimizer import optimize_code
+from utils.code_validation import validate_code, CodeValidationError
+from utils.dataset_cache import dataset_fingerprint
+from utils.downsampling import optimize_figure
+from utils.dry_run import execute_with_dry_run
+
+# Memória total das figuras em cache (tamanho do JSON)
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Fatia máxima do cache que uma única sessão pode ocupar
+MAX_SESSION_BYTES = 64 * 1024 * 1024
+# Camada em disco: diretório e tamanho máximo (arquivos comprimidos)
+DISK_CACHE_DIR = Path(os.environ.get("CHART_CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache" / "charts"))
+MAX_DISK_BYTES = 512 * 1024 * 1024
+# Resultados do mesmo dataset carregados na memória no upload
+WARM_CHART_LIMIT = 20
+
+# Hashes do código gerado pelo próprio sistema (templates e visualizações estatísticas), em LRU:
+# os menos usados saem (e voltam a passar pelo teste em amostras) ao passar do limite
+MAX_TRUSTED_CODES = 1000
+
+_trusted_codes = OrderedDict()
+_trusted_lock = threading.Lock()
+
+
+def normalize_code(code: str) -> str:
+    """Forma canônica do código (sem comentários nem diferenças de formatação)."""
+    try:
+        return ast.unparse(ast.parse(code))
+    except SyntaxError:
+        return code.strip()
+
+
+def code_hash(code: str) -> str:
+    return hashlib.blake2b(normalize_code(code).encode(), digest_size=16).hexdigest()
+
+
+def chart_cache_key(code: str, df) -> tuple:
+    """Chave (impressão digital do dataset, hash do código normalizado)."""
+    return dataset_fingerprint(df), code_hash(code)
+
+
+class ChartCache:
+    """LRU de resultados limitado por bytes, com cotas por sessão e métricas."""
+
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES, max_session_bytes: int = MAX_SESSION_BYTES):
+        self.max_bytes = max_bytes
+        self.max_session_bytes = max_session_bytes
+        self._entries = OrderedDict()  # chave -> (resultado, bytes, sessão)
+        self._session_bytes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "rejected": 0}
+
+    def __contains__(self, key) -> bool:
+        """Presença sem afetar a ordem LRU nem as métricas."""
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value, session_id=None, size: int | None = None):
+        if size is None:
+            size = value.nbytes()
+        with self._lock:
+            if size > min(self.max_bytes, self.max_session_bytes):
+                # Resultado maior que a cota inteira: não vale a pena guardar
+                self.metrics["rejected"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            # Primeiro respeita a cota da sessão (removendo as entradas mais antigas dela)
+            while self._session_bytes.get(session_id, 0) + size > self.max_session_bytes:
+                oldest = next(k for k, entry in self._entries.items() if entry[2] == session_id)
+                self._remove(oldest)
+                self.metrics["evictions"] += 1
+            # Depois o limite global (LRU entre todas as sessões)
+            while self._total_bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.metrics["evictions"] += 1
+            self._entries[key] = (value, size, session_id)
+            self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + size
+            self._total_bytes += size
+
+    def _remove(self, key):
+        _, size, session_id = self._entries.pop(key)
+        self._total_bytes -= size
+        remaining = self._session_bytes.get(session_id, 0) - size
+        if remaining > 0:
+            self._session_bytes[session_id] = remaining
+        else:
+            self._session_bytes.pop(session_id, None)
+
+    def clear_session(self, session_id):
+        """Libera todos os resultados de uma sessão."""
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[2] == session_id]:
+                self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "sessions": len(self._session_bytes),
+                "hit_rate": self.metrics["hits"] / lookups if lookups else 0.0,
+            }
+
+
+class DiskChartCache:
+    """Resultados em disco como JSON compacto + gzip, com remoção dos menos usados ao exceder o limite."""
+
+    def __init__(self, directory: Path = DISK_CACHE_DIR, max_bytes: int = MAX_DISK_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+
+    def _path(self, key) -> Path:
+        fingerprint, digest = key
+        return self.directory / f"{fingerprint}_{digest}.result.json.gz"
 
-def exec_with_cache(code, df):
-    # Criar chave mais robusta incluindo o código e as dimensões do DataFrame
-    key = hashlib.md5(f"{code}_{df.shape}_{str(df.columns.tolist())}".encode()).hexdigest()
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                result = ExecutionResult.from_payload(file.read())
+            os.utime(path)  # marca o uso recente para a remoção por LRU
+        except FileNotFoundError:
+            self.metrics["misses"] += 1
+            return None
+        except Exception as e:
+            print(f"Erro ao ler resultado do cache em disco: {e}")
+            self.metrics["errors"] += 1
+            return None
+        self.metrics["hits"] += 1
+        return result
+
+    def put(self, key, result):
+        path = self._path(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with gzip.open(temporary, 'wt', encoding='utf-8', compresslevel=6) as file:
+                file.write(result.to_payload())
+            os.replace(temporary, path)  # escrita atômica: leitores nunca veem arquivo parcial
+            self._evict()
+        except Exception as e:
+            print(f"Erro ao gravar resultado no cache em disco: {e}")
+            self.metrics["errors"] += 1
+
+    def recent_keys(self, fingerprint: str, limit: int) -> list:
+        """Chaves dos resultados deste dataset em disco, das mais recentes para as mais antigas."""
+        try:
+            entries = [(entry.stat().st_mtime, entry.name) for entry in os.scandir(self.directory)
+                       if entry.name.startswith(f"{fingerprint}_") and entry.name.endswith(".result.json.gz")]
+        except FileNotFoundError:
+            return []
+        return [(fingerprint, name[len(fingerprint) + 1:-len(".result.json.gz")])
+                for _, name in sorted(entries, reverse=True)[:limit]]
+
+    def _evict(self):
+        with self._lock:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                     for entry in os.scandir(self.directory) if entry.name.endswith(".json.gz")]
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                total -= size
+                self.metrics["evictions"] += 1
+
+
+_cache = ChartCache()
+_disk_cache = DiskChartCache()
+
+
+def get_chart_cache() -> ChartCache:
+    return _cache
+
+
+def register_trusted_code(code: str) -> str:
+    """Marca o código como gerado pelo sistema (dispensa o teste em amostras); retorna o próprio código."""
+    key = code_hash(code)
+    with _trusted_lock:
+        _trusted_codes[key] = True
+        _trusted_codes.move_to_end(key)
+        while len(_trusted_codes) > MAX_TRUSTED_CODES:
+            _trusted_codes.popitem(last=False)
+    return code
+
+
+def _is_trusted(code: str) -> bool:
+    with _trusted_lock:
+        return code_hash(code) in _trusted_codes
+
+
+def _prepare_code(code: str, df, require_fig: bool) -> tuple:
+    """Valida e otimiza o código; retorna (código otimizado, chave do cache)."""
+    # Validação estática antes de qualquer execução
+    validated = validate_code(code, df.columns, require_fig=require_fig)
+    if validated.repairs:
+        print(f"Código corrigido automaticamente: {'; '.join(validated.repairs)}")
+    # Padrões lentos (apply linha a linha, iterrows) reescritos na forma vetorizada sobre o df do usuário
+    optimized = optimize_code(validated.source)
+    if optimized.rewrites:
+        print(f"Código vetorizado: {'; '.join(optimized.rewrites)}")
+    # Chave pelo conteúdo do dataset e pelo código normalizado (comentários/formatação não importam)
+    return optimized, chart_cache_key(optimized.source, df)
+
+
+def warm_chart_cache(df, session_id=None, limit: int = WARM_CHART_LIMIT) -> int:
+    """Carrega na memória os resultados em disco mais recentes deste dataset; retorna quantos."""
+    warmed = 0
+    for key in _disk_cache.recent_keys(dataset_fingerprint(df), limit):
+        if key in _cache:
+            continue
+        result = _disk_cache.get(key)
+        if result is not None:
+            _cache.put(key, result, session_id)
+            warmed += 1
+    return warmed
+
+
+def seed_chart_result(code: str, df, fig, session_id=None) -> bool:
+    """
+    Registra na memória um gráfico persistido (ex.: de uma sessão anterior) sob a chave
+    do código de visualização que o gerou. Apenas a figura é persistida no banco: o
+    resultado fica marcado como `figure_only` e não vai para o disco.
+    """
+    try:
+        _, key = _prepare_code(code, df, require_fig=True)
+    except CodeValidationError:
+        return False
     if key in _cache:
-        return _cache[key]
+        return False
+    result = ExecutionResult(fig=fig)
+    result.figure_only = True
+    _cache.put(key, result, session_id)
+    return True
+
+
+def execute_code(code: str, df, session_id=None, require_fig: bool = False) -> ExecutionResult:
+    """
+    Ponto único de execução do código gerado: valida, executa uma única vez por
+    (dataset, código) e reaproveita o resultado em reruns e sessões.
+
+    Raises:
+        CodeValidationError, ExecutionTimeout ou o erro levantado pelo código
+    """
+    optimized, key = _prepare_code(code, df, require_fig)
+    cached = _cache.get(key)
+    # Resultado só com a figura atende pedidos de gráfico; as demais execuções rodam o código
+    if cached is not None and (require_fig or not cached.figure_only):
+        return cached.reused("memoria", optimized.to_dict())
+    # Camada em disco: resultados de execuções anteriores (outros processos ou antes de um reinício)
+    cached = _disk_cache.get(key)
+    if cached is not None:
+        cached.optimization = optimized.to_dict()
+        _cache.put(key, cached, session_id)
+        return cached.reused("disco", cached.optimization)
+
+    # Executa em um worker isolado (limites de tempo/memória); em datasets grandes, antes
+    # em amostras estratificadas para falhar rápido e estimar o custo da execução completa
+    started = time.perf_counter()
+    result = execute_with_dry_run(optimized.source, df, require_fig=require_fig,
+                                  trusted=_is_trusted(code))
+    result.optimization = optimized.to_dict()
+    if isinstance(result.fig, go.Figure):
+        # Séries grandes são reduzidas (LTTB/min-max + WebGL) antes de ir para o cache
+        result.fig, _ = optimize_figure(result.fig)
+    result.timings["wall_ms"] = (time.perf_counter() - started) * 1000
+    _cache.put(key, result, session_id)
+    _disk_cache.put(key, result)
+    return result
+
 
+def exec_with_cache(code, df, session_id=None):
+    """Executa o código de um gráfico e retorna apenas a figura (None se não houver)."""
     try:
-        local_scope = {"df": df, "go": go, "px": __import__('plotly.express')}
-        exec(code, local_scope)
-        if 'fig' in local_scope:
-            _cache[key] = local_scope['fig']
-            return local_scope['fig']
+        result = execute_code(code, df, session_id, require_fig=True)
+    except (CodeValidationError, ExecutionTimeout):
+        raise
     except Exception as e:
         print(f"Erro na execução do código em cache: {e}")
-        pass
-    return None
+        return None
+    return result.fig if isinstance(result.fig, go.Figure) else None
@@ -0,0 +1,34 @@
+"""
+Armazenamento de gráficos endereçado por conteúdo.
+O JSON completo da figura é comprimido (zlib) e identificado pelo hash do
+conteúdo: gráficos repetidos são gravados uma única vez e as conversas guardam
+apenas o `chart_id`. O conteúdo é buscado só quando o gráfico for exibido.
+"""
+import base64
+import hashlib
+import zlib
+
+CHART_COMPRESSION_LEVEL = 6
+
+
+def chart_id_for(fig_json: str) -> str:
+    """Identificador do gráfico: hash do JSON da figura (mesmo gráfico, mesmo ID)."""
+    return hashlib.blake2b(fig_json.encode(), digest_size=16).hexdigest()
+
+
+def compress_chart(fig_json: str) -> tuple:
+    """Retorna (chart_id, JSON comprimido)."""
+    return chart_id_for(fig_json), zlib.compress(fig_json.encode(), CHART_COMPRESSION_LEVEL)
+
+
+def decompress_chart(payload: bytes) -> str:
+    return zlib.decompress(payload).decode()
+
+
+def encode_payload(payload: bytes) -> str:
+    """Binário em texto para a API REST (base64 é mais compacto que o hex do bytea)."""
+    return base64.b64encode(payload).decode('ascii')
+
+
+def decode_payload(text: str) -> bytes:
+    return base64.b64decode(text)
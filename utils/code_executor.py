@@ -0,0 +1,457 @@
+"""
+Execução isolada de código gerado.
+Um pool de processos pré-aquecidos (spawn) executa o código com limite de tempo
+e de memória. O DataFrame é publicado uma vez em memória compartilhada (pickle
+protocolo 5 com buffers fora de banda: os blocos numéricos não são copiados) e a
+figura volta como JSON compacto. Se o pool não puder ser usado, o código roda
+no próprio processo.
+"""
+import atexit
+import base64
+import contextlib
+import copy
+import gc
+import io
+import json
+import multiprocessing
+import pickle
+import queue
+import threading
+import time
+import traceback
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils.code_validation import compile_statements
+from utils.dataset_cache import dataset_fingerprint, get_or_compute
+
+WORKER_COUNT = 2
+# Tempo máximo de parede por execução; o worker é encerrado e recriado ao estourar
+EXECUTION_TIMEOUT = 30
+# Limite de memória virtual de cada worker (RLIMIT_AS, apenas POSIX)
+WORKER_MEMORY_LIMIT = 4 * 1024 ** 3
+# Datasets mantidos já desserializados em cada worker (dados completos + amostras do dry run)
+WORKER_DATASET_SLOTS = 3
+WORKER_START_TIMEOUT = 60
+# Espera máxima por um worker livre (uma execução completa de outro usuário, com folga)
+WORKER_ACQUIRE_TIMEOUT = EXECUTION_TIMEOUT * 2
+# DataFrames produzidos pelo código que são devolvidos (e quantas linhas de cada)
+MAX_RESULT_FRAMES = 5
+MAX_RESULT_ROWS = 100
+MAX_RESULT_CHARS = 2_000
+# Instruções mais lentas incluídas no perfil de cada execução
+PROFILE_TOP_STATEMENTS = 5
+
+
+class ExecutionTimeout(TimeoutError):
+    """O código gerado excedeu o tempo máximo de execução."""
+
+
+class WorkerCrashed(RuntimeError):
+    """O processo worker morreu durante a execução (ex.: limite de memória)."""
+
+
+class CodeExecutionError(RuntimeError):
+    """Exceção levantada pelo código gerado dentro do worker."""
+
+    def __init__(self, error_type: str, message: str, details: str = ""):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+        self.details = details
+
+
+# --- Publicação do DataFrame em memória compartilhada ---
+
+class SharedDataset:
+    """DataFrame serializado em um segmento de memória compartilhada (liberado com o objeto)."""
+
+    def __init__(self, df):
+        buffers = []
+        meta = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+        raws = [buffer.raw() for buffer in buffers]
+        # Segmento: [pickle com a estrutura e colunas de objetos][buffers dos blocos numéricos]
+        self.meta_size = len(meta)
+        self.layout = []
+        offset = self.meta_size
+        for raw in raws:
+            self.layout.append((offset, raw.nbytes))
+            offset += raw.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.shm.buf[:self.meta_size] = meta
+        for (start, size), raw in zip(self.layout, raws):
+            self.shm.buf[start:start + size] = raw.cast('B')
+        self.token = dataset_fingerprint(df)
+        self.nbytes = offset
+        weakref.finalize(self, _release_shared_memory, self.shm)
+
+    def descriptor(self) -> dict:
+        return {"token": self.token, "name": self.shm.name, "meta_size": self.meta_size, "layout": self.layout}
+
+
+def _release_shared_memory(shm):
+    try:
+        shm.close()
+        shm.unlink()
+    except Exception:
+        pass
+
+
+def get_shared_dataset(df) -> SharedDataset:
+    """Segmento compartilhado do dataset (criado uma vez e reutilizado entre execuções)."""
+    return get_or_compute(df, "shared_dataset", lambda: SharedDataset(df))
+
+
+def _attach_dataset(descriptor: dict):
+    """No worker: mapeia o segmento e reconstrói o DataFrame sobre ele (buffers somente leitura)."""
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    view = shm.buf.toreadonly()
+    buffers = [view[start:start + size] for start, size in descriptor["layout"]]
+    return shm, pickle.loads(view[:descriptor["meta_size"]], buffers=buffers)
+
+
+def _detach_dataset(shm):
+    gc.collect()  # libera os arrays que ainda apontam para o segmento
+    with contextlib.suppress(BufferError):
+        shm.close()
+
+
+class ExecutionResult:
+    """Saídas de uma execução de código gerado."""
+
+    def __init__(self, fig=None, stdout: str = "", result: str | None = None, dataframes: dict | None = None,
+                 timings: dict | None = None, isolated: bool = False):
+        self.fig = fig
+        self.stdout = stdout
+        self.result = result
+        self.dataframes = dataframes or {}
+        self.timings = timings or {}
+        self.isolated = isolated
+        # Origem quando reaproveitado: None (executado agora), "memoria" ou "disco"
+        self.cached = None
+        # Relatório do otimizador (reescritas vetorizadas e avisos)
+        self.optimization = {"rewrites": [], "warnings": []}
+        # Aviso exibido quando o resultado vem de uma amostra dos dados
+        self.note = None
+        # Só a figura (restaurada do banco): não atende execuções que precisam das demais saídas
+        self.figure_only = False
+        self._fig_json = None
+
+    def reused(self, origin: str, optimization: dict) -> "ExecutionResult":
+        """Cópia rasa marcada como reaproveitada; a entrada do cache, compartilhada entre sessões, não muda."""
+        result = copy.copy(self)
+        result.cached = origin
+        result.optimization = optimization
+        return result
+
+    def fig_json(self) -> str | None:
+        """JSON compacto da figura (calculado uma única vez)."""
+        if self._fig_json is None and hasattr(self.fig, "to_json"):
+            self._fig_json = self.fig.to_json()
+        return self._fig_json
+
+    def nbytes(self) -> int:
+        """Tamanho aproximado em memória (figura serializada + DataFrames + textos)."""
+        frames = sum(int(frame.memory_usage(deep=True).sum()) for frame in self.dataframes.values())
+        return len(self.fig_json() or "") + frames + len(self.stdout) + len(self.result or "")
+
+    def to_payload(self) -> str:
+        """Serialização JSON (figura embutida sem reprocessar) para o cache em disco."""
+        extras = json.dumps({
+            "stdout": self.stdout,
+            "result": self.result,
+            "note": self.note,
+            "dataframes": {name: frame.to_json(orient='split', date_format='iso')
+                           for name, frame in self.dataframes.items()},
+        })
+        return '{"fig": ' + (self.fig_json() or 'null') + ', ' + extras[1:]
+
+    @classmethod
+    def from_payload(cls, payload: str) -> "ExecutionResult":
+        data = json.loads(payload)
+        fig = data.get("fig")
+        dataframes = {name: pd.read_json(io.StringIO(frame), orient='split', dtype=False)
+                      for name, frame in data.get("dataframes", {}).items()}
+        result = cls(figure_from_dict(fig) if fig else None, data.get("stdout", ""), data.get("result"), dataframes)
+        result.note = data.get("note")
+        return result
+
+
+# --- Execução (compartilhada entre o worker e o fallback local) ---
+
+def _base_scope(df) -> dict:
+    import plotly.express as px
+    return {"df": df, "pd": pd, "np": np, "px": px, "go": go}
+
+
+def _collect_dataframes(scope: dict, df) -> dict:
+    """DataFrames/Series criados pelo código (primeiras linhas de cada)."""
+    frames = {}
+    for name, value in scope.items():
+        if len(frames) >= MAX_RESULT_FRAMES:
+            break
+        if name.startswith('_') or value is df or not isinstance(value, (pd.DataFrame, pd.Series)):
+            continue
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        frames[name] = frame.head(MAX_RESULT_ROWS)
+    return frames
+
+
+def run_code(code: str, df) -> dict:
+    """Executa o código capturando stdout; retorna figura, resultado, DataFrames e tempos."""
+    started = time.perf_counter()
+    scope = _base_scope(df)
+    stdout = io.StringIO()
+    statements = []
+    with contextlib.redirect_stdout(stdout):
+        for lineno, text, code_object in compile_statements(code):
+            statement_started = time.perf_counter()
+            exec(code_object, scope)
+            statements.append((lineno, (time.perf_counter() - statement_started) * 1000, text[:80]))
+    executed = time.perf_counter()
+    result = scope.get("result")
+    return {
+        "fig": scope.get("fig"),
+        "result": None if result is None else str(result)[:MAX_RESULT_CHARS],
+        "stdout": stdout.getvalue(),
+        "dataframes": _collect_dataframes(scope, df),
+        "timings": {
+            "exec_ms": (executed - started) * 1000,
+            # Instruções mais lentas: (linha, ms, trecho)
+            "statements": sorted(statements, key=lambda item: item[1], reverse=True)[:PROFILE_TOP_STATEMENTS],
+        },
+    }
+
+
+def _run_in_worker_scope(code: str, df) -> dict:
+    try:
+        # Cópia rasa: colunas novas/reatribuídas não contaminam o dataset mantido no worker
+        return run_code(code, df.copy(deep=False))
+    except ValueError as error:
+        # Os blocos compartilhados são somente leitura: alterações in-place usam uma cópia privada
+        if "read-only" not in str(error):
+            raise
+        return run_code(code, df.copy())
+
+
+def _worker_main(conn, memory_limit):
+    """Loop do processo worker."""
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    except (ImportError, ValueError, OSError):
+        pass
+    # Pré-aquecimento: importa as bibliotecas e inicializa os validadores do plotly
+    # (a primeira figura é lenta) antes da primeira execução
+    _base_scope(None)["px"].scatter(x=[0], y=[0]).to_json()
+    conn.send(("ready", None))
+
+    datasets = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        code, descriptor = message
+        try:
+            attach_started = time.perf_counter()
+            token = descriptor["token"]
+            if token not in datasets:
+                if len(datasets) >= WORKER_DATASET_SLOTS:
+                    old_token = next(iter(datasets))
+                    old_shm, _ = datasets.pop(old_token)
+                    _detach_dataset(old_shm)
+                datasets[token] = _attach_dataset(descriptor)
+            attach_ms = (time.perf_counter() - attach_started) * 1000
+
+            output = _run_in_worker_scope(code, datasets[token][1])
+            serialize_started = time.perf_counter()
+            fig = output.pop("fig")
+            output["fig_json"] = fig.to_json() if hasattr(fig, "to_json") else None
+            output["timings"]["attach_ms"] = attach_ms
+            output["timings"]["serialize_ms"] = (time.perf_counter() - serialize_started) * 1000
+            conn.send(("ok", output))
+        except BaseException as error:
+            conn.send(("error", (type(error).__name__, str(error), traceback.format_exc(limit=5))))
+
+
+def _decode_typed_arrays(value):
+    """Converte os arrays binários do JSON do Plotly ({'dtype', 'bdata'}) de volta para numpy."""
+    if isinstance(value, dict):
+        if "bdata" in value and "dtype" in value:
+            array = np.frombuffer(base64.b64decode(value["bdata"]), dtype=value["dtype"])
+            shape = value.get("shape")
+            if shape:
+                array = array.reshape([int(dim) for dim in str(shape).split(",")])
+            return array
+        return {key: _decode_typed_arrays(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_typed_arrays(item) for item in value]
+    return value
+
+
+def figure_from_dict(fig_dict: dict) -> go.Figure:
+    """Reconstrói a figura a partir do JSON compacto já decodificado (arrays voltam a ser numpy)."""
+    return go.Figure(_decode_typed_arrays(fig_dict), skip_invalid=True)
+
+
+def figure_from_json(fig_json: str) -> go.Figure:
+    return figure_from_dict(json.loads(fig_json))
+
+
+# --- Pool de workers ---
+
+class _Worker:
+    def __init__(self, context, memory_limit):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        if not self.ready:
+            if not self.conn.poll(timeout):
+                raise WorkerCrashed("O worker não iniciou a tempo.")
+            self.conn.recv()
+            self.ready = True
+
+    def kill(self):
+        with contextlib.suppress(Exception):
+            self.process.kill()
+            self.process.join(1)
+        with contextlib.suppress(Exception):
+            self.conn.close()
+
+
+class WorkerPool:
+    """Pool de processos que executam código gerado com limites de tempo e memória."""
+
+    def __init__(self, size: int = WORKER_COUNT, timeout: float = EXECUTION_TIMEOUT,
+                 memory_limit: int = WORKER_MEMORY_LIMIT):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(_Worker(self._context, memory_limit))
+
+    def execute(self, code: str, df, timeout: float | None = None) -> dict:
+        """
+        Executa o código em um worker livre.
+
+        Returns:
+            {"fig_json", "result" (repr), "stdout", "timings"}
+        Raises:
+            ExecutionTimeout, WorkerCrashed ou CodeExecutionError
+        """
+        timeout = timeout or self.timeout
+        started = time.perf_counter()
+        shared = get_shared_dataset(df)
+        try:
+            # Sem espera indefinida: workers presos ou perdidos não travam as próximas execuções
+            worker = self._idle.get(timeout=WORKER_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise ExecutionTimeout(f"Nenhum worker livre em {WORKER_ACQUIRE_TIMEOUT:.0f}s; tente novamente.") from None
+        try:
+            worker.wait_ready(WORKER_START_TIMEOUT)
+            dispatched = time.perf_counter()
+            worker.conn.send((code, shared.descriptor()))
+            if not worker.conn.poll(timeout):
+                raise ExecutionTimeout(f"Execução excedeu {timeout:.0f}s e foi interrompida.")
+            status, payload = worker.conn.recv()
+        except (ExecutionTimeout, WorkerCrashed):
+            worker = self._replace(worker)
+            raise
+        except (EOFError, OSError, BrokenPipeError) as error:
+            worker = self._replace(worker)
+            raise WorkerCrashed(f"O processo de execução foi encerrado: {error}") from error
+        finally:
+            self._idle.put(worker)
+
+        if status == "error":
+            raise CodeExecutionError(*payload)
+        payload["timings"]["queue_ms"] = (dispatched - started) * 1000
+        payload["timings"]["total_ms"] = (time.perf_counter() - started) * 1000
+        return payload
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        return _Worker(self._context, self.memory_limit)
+
+    def shutdown(self):
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            with contextlib.suppress(Exception):
+                worker.conn.send(None)
+            worker.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_failed = False
+
+
+def get_worker_pool() -> WorkerPool | None:
+    """Pool global (criado sob demanda); None se não for possível criar processos."""
+    global _pool, _pool_failed
+    with _pool_lock:
+        if _pool is None and not _pool_failed:
+            try:
+                _pool = WorkerPool()
+                atexit.register(_pool.shutdown)
+            except Exception as e:
+                print(f"Pool de execução indisponível, usando execução local: {e}")
+                _pool_failed = True
+        return _pool
+
+
+def _run_local(code: str, df) -> ExecutionResult:
+    """Execução no próprio processo sobre uma cópia: alterações in-place não chegam ao df da sessão
+    (nem deixam desatualizados os artefatos e a impressão digital em cache para ele)."""
+    return ExecutionResult(**run_code(code, df.copy()))
+
+
+def execute_isolated(code: str, df, timeout: float | None = None) -> ExecutionResult:
+    """Executa o código gerado no pool de workers (ou localmente, se indisponível)."""
+    pool = get_worker_pool()
+    if pool is None:
+        return _run_local(code, df)
+
+    try:
+        output = pool.execute(code, df, timeout)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        # DataFrame que não pode ser publicado (ex.: objetos não serializáveis): executa localmente
+        print(f"Dataset não compartilhável com o pool, usando execução local: {e}")
+        return _run_local(code, df)
+
+    fig_json = output.pop("fig_json")
+    return ExecutionResult(figure_from_json(fig_json) if fig_json else None, isolated=True, **output)
+
+
+def benchmark_overhead(df, code: str = "fig = None", runs: int = 20) -> dict | None:
+    """
+    Compara o tempo mediano (ms) da execução no pool com o mesmo trabalho no próprio processo
+    (run_code sobre uma cópia rasa, como no worker). Os dois caminhos são aquecidos antes
+    (imports, compilação em cache, dataset publicado). None se o pool estiver indisponível.
+    """
+    if get_worker_pool() is None:
+        return None
+
+    def median_ms(run):
+        run()
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1000)
+        return float(np.median(samples))
+
+    local_ms = median_ms(lambda: ExecutionResult(**run_code(code, df.copy(deep=False))))
+    pool_ms = median_ms(lambda: execute_isolated(code, df))
+    return {"local_ms": local_ms, "pool_ms": pool_ms, "overhead_ms": pool_ms - local_ms}
@@ -0,0 +1,321 @@
+"""
+Otimizador de código pandas gerado.
+Passo sobre a AST, antes da execução, que reescreve padrões lentos conhecidos
+(apply linha a linha, apply/map com lambda, loops iterrows com append) na forma
+vetorizada. Só são reescritas expressões aritméticas/comparações simples sobre o
+DataFrame do usuário (`df`, `df['col']`, `df.col`); a aritmética, só com guarda em
+tempo de execução que exige colunas float. Os demais padrões são apenas sinalizados.
+"""
+import ast
+import copy
+from collections import Counter
+from functools import lru_cache
+
+# Aritmética idêntica à dos escalares apenas em float: em int64 o numpy transborda onde o int do
+# Python não. As reescritas que a usam só valem sob a guarda de colunas float (ver _float_guard)
+SAFE_BINOPS = (ast.Add, ast.Sub, ast.Mult)
+SAFE_COMPARISONS = (ast.Gt, ast.GtE, ast.Lt, ast.LtE, ast.Eq, ast.NotEq)
+SAFE_UNARY = (ast.USub, ast.UAdd)
+# Operações vetorizáveis, mas com diferenças em casos de borda (divisão por zero vira inf em vez de
+# ZeroDivisionError, overflow de inteiros)
+UNSAFE_BINOPS = (ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+# Nome do DataFrame no escopo de execução: o único receptor cujo tipo é conhecido
+FRAME_NAME = 'df'
+
+
+class OptimizedCode:
+    """Código após o passe de otimização, com as reescritas aplicadas e os avisos."""
+
+    def __init__(self, source: str, rewrites: list, warnings: list):
+        self.source = source
+        self.rewrites = rewrites
+        self.warnings = warnings
+
+    def to_dict(self) -> dict:
+        return {"rewrites": self.rewrites, "warnings": self.warnings}
+
+
+def _is_frame(node) -> bool:
+    return isinstance(node, ast.Name) and node.id == FRAME_NAME
+
+
+def _is_known_receiver(node) -> bool:
+    """Receptores de tipo conhecido e sem efeitos colaterais: df, df['col'] ou df.col (outros nomes
+    podem ser GroupBy, listas etc., em que a forma vetorizada não vale)."""
+    if _is_frame(node):
+        return True
+    if isinstance(node, ast.Subscript):
+        return _is_frame(node.value) and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)
+    return isinstance(node, ast.Attribute) and _is_frame(node.value)
+
+
+def _translate(node, leaf):
+    """
+    Traduz uma expressão aritmética para a forma vetorizada.
+    `leaf(node)` traduz as referências ao parâmetro da lambda/linha; retorna
+    (expressão, usa_parametro, motivo_da_recusa).
+    """
+    replaced = leaf(node)
+    if replaced is not None:
+        return replaced, True, None
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return copy.deepcopy(node), False, None
+    if isinstance(node, ast.BinOp):
+        if isinstance(node.op, UNSAFE_BINOPS):
+            return None, False, f"operador '{ast.unparse(node)}' pode diferir em casos de borda"
+        if not isinstance(node.op, SAFE_BINOPS):
+            return None, False, None
+        left, left_uses, reason = _translate(node.left, leaf)
+        if left is None:
+            return None, False, reason
+        right, right_uses, reason = _translate(node.right, leaf)
+        if right is None:
+            return None, False, reason
+        return ast.BinOp(left=left, op=node.op, right=right), left_uses or right_uses, None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, SAFE_UNARY):
+        operand, uses, reason = _translate(node.operand, leaf)
+        return (ast.UnaryOp(op=node.op, operand=operand), uses, None) if operand is not None else (None, False, reason)
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], SAFE_COMPARISONS):
+        left, left_uses, reason = _translate(node.left, leaf)
+        if left is None:
+            return None, False, reason
+        right, right_uses, reason = _translate(node.comparators[0], leaf)
+        if right is None:
+            return None, False, reason
+        return ast.Compare(left=left, ops=node.ops, comparators=[right]), left_uses or right_uses, None
+    return None, False, None
+
+
+def _row_leaf(row_name: str, frame):
+    """row['col'] -> frame['col']"""
+    def leaf(node):
+        if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == row_name
+                and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+            return ast.Subscript(value=copy.deepcopy(frame), slice=copy.deepcopy(node.slice), ctx=ast.Load())
+        return None
+    return leaf
+
+
+def _upcast_row_leaf(row_name: str, frame):
+    """row['col'] -> frame['col'] no dtype comum das colunas: iterrows e apply(axis=1) convertem a
+    linha para ele (ex.: inteiros viram float quando há colunas float)."""
+    def leaf(node):
+        column = _row_leaf(row_name, frame)(node)
+        if column is None:
+            return None
+        common_dtype = ast.parse(f"{ast.unparse(frame)}.iloc[:0].to_numpy().dtype", mode='eval').body
+        return ast.Call(func=ast.Attribute(value=column, attr='astype', ctx=ast.Load()), args=[common_dtype],
+                        keywords=[])
+    return leaf
+
+
+def _is_arithmetic(node) -> bool:
+    return any(isinstance(child, ast.BinOp) or (isinstance(child, ast.UnaryOp) and isinstance(child.op, ast.USub))
+               for child in ast.walk(node))
+
+
+def _float_guard(receiver, row_wise: bool):
+    """Condição em tempo de execução: as colunas envolvidas são float (linhas: o dtype comum é float)."""
+    text = ast.unparse(receiver)
+    if row_wise:
+        condition = f"{text}.iloc[:0].to_numpy().dtype.kind == 'f'"
+    elif _is_frame(receiver):
+        condition = f"all(dtype.kind == 'f' for dtype in {text}.dtypes)"
+    else:
+        condition = f"{text}.dtype.kind == 'f'"
+    return ast.parse(condition, mode='eval').body
+
+
+def _guarded(vectorized, original, receiver, row_wise: bool):
+    """Forma vetorizada com a aritmética protegida pela guarda float; senão mantém o código original."""
+    if not _is_arithmetic(vectorized):
+        return vectorized
+    return ast.IfExp(test=_float_guard(receiver, row_wise), body=vectorized, orelse=original)
+
+
+def _value_leaf(param: str, series):
+    """x -> series"""
+    def leaf(node):
+        if isinstance(node, ast.Name) and node.id == param:
+            return copy.deepcopy(series)
+        return None
+    return leaf
+
+
+def _uses_name(node, name: str) -> bool:
+    return any(isinstance(child, ast.Name) and child.id == name for child in ast.walk(node))
+
+
+def _name_counts(node, shadowed=frozenset()) -> Counter:
+    """Ocorrências de cada nome, ignorando os parâmetros de lambdas dentro do próprio corpo."""
+    counts = Counter()
+    if isinstance(node, ast.Name) and node.id not in shadowed:
+        counts[node.id] += 1
+    if isinstance(node, ast.Lambda):
+        shadowed = shadowed | {argument.arg for argument in node.args.args}
+    for child in ast.iter_child_nodes(node):
+        counts.update(_name_counts(child, shadowed))
+    return counts
+
+
+def _single_lambda(call):
+    """Lambda de um parâmetro passada como único argumento posicional."""
+    if len(call.args) == 1 and isinstance(call.args[0], ast.Lambda):
+        arguments = call.args[0].args
+        if len(arguments.args) == 1 and not (arguments.vararg or arguments.kwarg or arguments.kwonlyargs):
+            return call.args[0]
+    return None
+
+
+class _Vectorizer(ast.NodeTransformer):
+    def __init__(self, name_counts: Counter, enabled: bool = True):
+        self.name_counts = name_counts
+        # Desligado quando o código reatribui `df` (o tipo do receptor deixa de ser conhecido)
+        self.enabled = enabled
+        self.rewrites = []
+        self.warnings = []
+
+    def _warn(self, node, message):
+        self.warnings.append(f"linha {node.lineno}: {message}")
+
+    def _rewrite(self, node, vectorized, original: str | None = None):
+        guard = " (só com colunas float)" if _is_arithmetic(vectorized) else ""
+        self.rewrites.append(f"linha {node.lineno}: {original or ast.unparse(node)} -> {ast.unparse(vectorized)}{guard}")
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        if not (isinstance(func, ast.Attribute) and func.attr in ('apply', 'map')):
+            return node
+        keywords = {keyword.arg: keyword.value for keyword in node.keywords}
+        row_wise = ('axis' in keywords and isinstance(keywords['axis'], ast.Constant)
+                    and keywords['axis'].value in (1, 'columns'))
+        lam = _single_lambda(node)
+
+        if row_wise:
+            extra = set(keywords) - {'axis'}
+            if lam is None or extra or not self.enabled or not _is_frame(func.value):
+                self._warn(node, "apply(axis=1) linha a linha não vetorizado automaticamente")
+                return node
+            param = lam.args.args[0].arg
+            translated, uses, reason = _translate(lam.body, _upcast_row_leaf(param, func.value))
+            if translated is None or not uses or _uses_name(translated, param):
+                self._warn(node, f"apply(axis=1) não vetorizado ({reason or 'expressão não suportada'})")
+                return node
+            self._rewrite(node, translated)
+            return _guarded(translated, node, func.value, row_wise=True)
+
+        if lam is None or set(keywords) - {'na_action'} or not self.enabled or not _is_known_receiver(func.value):
+            return node
+        param = lam.args.args[0].arg
+        translated, uses, reason = _translate(lam.body, _value_leaf(param, func.value))
+        if translated is None or not uses:
+            if reason:
+                self._warn(node, f"{func.attr}() com lambda não vetorizado ({reason})")
+            return node
+        self._rewrite(node, translated)
+        return _guarded(translated, node, func.value, row_wise=False)
+
+    def visit_For(self, node):
+        self.generic_visit(node)
+        iterator = node.iter
+        if not (isinstance(iterator, ast.Call) and isinstance(iterator.func, ast.Attribute)):
+            return node
+        method = iterator.func.attr
+        if method == 'groupby':
+            self._warn(node, "loop sobre groupby(): prefira groupby().agg()/transform()")
+            return node
+        if method == 'itertuples':
+            self._warn(node, "loop com itertuples(): considere operações vetorizadas")
+            return node
+        if method != 'iterrows':
+            return node
+
+        rewritten = self._rewrite_iterrows(node)
+        if rewritten is None:
+            self._warn(node, "loop com iterrows() não vetorizado automaticamente")
+            return node
+        vectorized = rewritten.body[0] if isinstance(rewritten, ast.If) else rewritten
+        self._rewrite(node, vectorized, "loop iterrows()")
+        return rewritten
+
+    def _rewrite_iterrows(self, node):
+        """for i, row in df.iterrows(): lista.append(expr) [com if opcional] -> lista.extend(...)"""
+        frame = node.iter.func.value
+        target = node.target
+        if not (self.enabled and _is_frame(frame) and not node.orelse and isinstance(target, ast.Tuple) and len(target.elts) == 2
+                and all(isinstance(elt, ast.Name) for elt in target.elts)):
+            return None
+        index_name, row_name = target.elts[0].id, target.elts[1].id
+        # As variáveis do loop não podem ser usadas fora dele (deixariam de existir)
+        inner = _name_counts(node)
+        if any(self.name_counts[name] > inner[name] for name in (index_name, row_name)):
+            return None
+
+        if len(node.body) != 1:
+            return None
+        statement, condition = node.body[0], None
+        if isinstance(statement, ast.If) and not statement.orelse and len(statement.body) == 1:
+            condition, statement = statement.test, statement.body[0]
+        if not (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call)):
+            return None
+        call = statement.value
+        if not (isinstance(call.func, ast.Attribute) and call.func.attr == 'append' and len(call.args) == 1
+                and not call.keywords and isinstance(call.func.value, ast.Name)
+                and call.func.value.id not in (index_name, row_name)):
+            return None
+
+        leaf = _upcast_row_leaf(row_name, frame)
+        values, uses, _ = _translate(call.args[0], leaf)
+        if values is None or not uses or _uses_name(values, row_name) or _uses_name(values, index_name):
+            return None
+        if condition is not None:
+            mask, mask_uses, _ = _translate(condition, leaf)
+            if mask is None or not mask_uses or _uses_name(mask, row_name) or _uses_name(mask, index_name):
+                return None
+            values = ast.Subscript(value=values, slice=mask, ctx=ast.Load())
+
+        extend = ast.Call(
+            func=ast.Attribute(value=copy.deepcopy(call.func.value), attr='extend', ctx=ast.Load()),
+            args=[ast.Call(func=ast.Attribute(value=values, attr='tolist', ctx=ast.Load()), args=[], keywords=[])],
+            keywords=[],
+        )
+        rewritten = ast.Expr(value=extend)
+        if _is_arithmetic(values):
+            # Loop original mantido para linhas que não são float (guarda em tempo de execução)
+            rewritten = ast.If(test=_float_guard(frame, row_wise=True), body=[rewritten], orelse=[node])
+        return ast.copy_location(rewritten, node)
+
+
+def _repeated_filters(tree) -> list:
+    """Máscaras booleanas idênticas aplicadas mais de uma vez (ex.: df[df['a'] > 0])."""
+    filters = Counter()
+    first_line = {}
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load)
+                and isinstance(node.slice, (ast.Compare, ast.BoolOp, ast.BinOp, ast.UnaryOp))):
+            text = ast.unparse(node)
+            filters[text] += 1
+            first_line.setdefault(text, node.lineno)
+    return [
+        f"linha {first_line[text]}: filtro `{text}` repetido {count} vezes: calcule uma vez e reutilize"
+        for text, count in filters.items() if count > 1
+    ]
+
+
+@lru_cache(maxsize=256)
+def optimize_code(source: str) -> OptimizedCode:
+    """Aplica as reescritas vetorizadas e sinaliza os demais anti-padrões."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return OptimizedCode(source, [], [])
+
+    frame_reassigned = any(isinstance(node, ast.Name) and node.id == FRAME_NAME and not isinstance(node.ctx, ast.Load)
+                           for node in ast.walk(tree))
+    vectorizer = _Vectorizer(_name_counts(tree), enabled=not frame_reassigned)
+    tree = ast.fix_missing_locations(vectorizer.visit(tree))
+    warnings = vectorizer.warnings + _repeated_filters(tree)
+    if vectorizer.rewrites:
+        source = ast.unparse(tree)
+    return OptimizedCode(source, vectorizer.rewrites, warnings)
@@ -0,0 +1,225 @@
+"""
+Validação estática e cache de compilação do código gerado.
+O código é analisado uma única vez (AST): problemas comuns são corrigidos
+automaticamente (fig.show(), read_csv, nomes de colunas com erro de digitação)
+e o que não pode ser corrigido é rejeitado antes de qualquer execução.
+"""
+import ast
+import difflib
+import re
+from functools import lru_cache
+
+# Módulos que o código gerado pode importar (nível superior do pacote)
+ALLOWED_IMPORTS = {
+    'pandas', 'numpy', 'plotly', 'scipy', 'sklearn', 'statsmodels', 'seaborn', 'matplotlib',
+    'math', 'statistics', 'datetime', 'collections', 'itertools', 'functools', 're', 'json',
+    'warnings', 'textwrap', 'string', 'decimal', 'calendar',
+}
+# Módulos do projeto usados pelo código dos gráficos automáticos
+ALLOWED_PROJECT_MODULES = {'utils.aggregated_charts', 'utils.optimized_chart_generator'}
+FORBIDDEN_CALLS = {'eval', 'exec', 'compile', 'open', '__import__', 'input', 'breakpoint', 'globals', 'vars'}
+READ_FUNCTIONS = {'read_csv', 'read_excel', 'read_parquet', 'read_json', 'read_table', 'read_sql'}
+# Argumentos do plotly express que recebem nomes de colunas
+PX_COLUMN_ARGUMENTS = {
+    'x', 'y', 'z', 'color', 'size', 'symbol', 'facet_row', 'facet_col', 'hover_name', 'hover_data',
+    'names', 'values', 'text', 'line_group', 'animation_frame', 'path', 'dimensions', 'lat', 'lon',
+}
+COLUMN_FIX_CUTOFF = 0.8
+
+
+class CodeValidationError(ValueError):
+    """Código gerado rejeitado pela validação estática."""
+
+    def __init__(self, issues: list):
+        super().__init__("; ".join(issues))
+        self.issues = issues
+
+
+class ValidatedCode:
+    """Código aprovado: fonte (possivelmente corrigida) e correções aplicadas."""
+
+    def __init__(self, source: str, repairs: list):
+        self.source = source
+        self.repairs = repairs
+
+
+def _strip_fences(code: str) -> str:
+    """Remove cercas de Markdown (```python ... ```) que o LLM às vezes inclui."""
+    match = re.search(r"```(?:python)?\s*\n(.*?)```", code, re.DOTALL)
+    return match.group(1) if match else code
+
+
+def _is_df(node) -> bool:
+    return isinstance(node, ast.Name) and node.id == 'df'
+
+
+def _string_constants(node) -> list:
+    """Constantes de texto em um nó (string única ou lista/tupla de strings)."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node]
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [elt for elt in node.elts if isinstance(elt, ast.Constant) and isinstance(elt.value, str)]
+    return []
+
+
+class _Repairer(ast.NodeTransformer):
+    """Remove chamadas proibidas que podem ser descartadas com segurança."""
+
+    def __init__(self):
+        self.repairs = []
+
+    def _drop(self, node, reason):
+        self.repairs.append(f"linha {node.lineno}: {reason} removido")
+        return None
+
+    def visit_Expr(self, node):
+        call = node.value
+        if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) and call.func.attr == 'show':
+            return self._drop(node, f"{ast.unparse(call.func)}()")
+        return self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        call = node.value
+        if (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)
+                and call.func.attr in READ_FUNCTIONS):
+            return self._drop(node, f"{call.func.attr}() (o DataFrame `df` já está carregado)")
+        return self.generic_visit(node)
+
+
+def _column_references(tree) -> tuple:
+    """Constantes que referenciam colunas de `df` e colunas criadas pelo próprio código."""
+    references, created = [], set()
+    df_rebound = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == 'df' and isinstance(node.ctx, ast.Store):
+            df_rebound = True
+        elif isinstance(node, ast.Subscript) and _is_df(node.value):
+            constants = _string_constants(node.slice)
+            if isinstance(node.ctx, ast.Store):
+                created.update(constant.value for constant in constants)
+            else:
+                references.extend(constants)
+        elif isinstance(node, ast.Call):
+            func = node.func
+            # px.<tipo>(df, x='col', ...)
+            if (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id == 'px'
+                    and node.args and _is_df(node.args[0])):
+                for keyword in node.keywords:
+                    if keyword.arg in PX_COLUMN_ARGUMENTS:
+                        references.extend(_string_constants(keyword.value))
+            # df.assign(nova=...) / df.rename(columns={...: 'nova'})
+            if isinstance(func, ast.Attribute) and _is_df(func.value):
+                if func.attr == 'assign':
+                    created.update(keyword.arg for keyword in node.keywords if keyword.arg)
+                for keyword in node.keywords:
+                    if keyword.arg == 'columns' and isinstance(keyword.value, ast.Dict):
+                        created.update(value.value for value in keyword.value.values
+                                       if isinstance(value, ast.Constant) and isinstance(value.value, str))
+    return references, created, df_rebound
+
+
+def _check(tree, columns: tuple, require_fig: bool) -> tuple:
+    """Retorna (problemas, correções de colunas) encontrados na AST."""
+    issues, column_fixes = [], []
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or '']
+            for name in names:
+                if name not in ALLOWED_PROJECT_MODULES and name.split('.')[0] not in ALLOWED_IMPORTS:
+                    issues.append(f"linha {node.lineno}: import não permitido '{name}'")
+        elif isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name) and func.id in FORBIDDEN_CALLS:
+                issues.append(f"linha {node.lineno}: chamada não permitida '{func.id}()'")
+            elif isinstance(func, ast.Attribute) and func.attr in READ_FUNCTIONS:
+                issues.append(f"linha {node.lineno}: leitura de arquivo '{func.attr}()' (use o `df` já carregado)")
+        elif isinstance(node, ast.Attribute) and node.attr.startswith('__') and node.attr.endswith('__'):
+            issues.append(f"linha {node.lineno}: acesso a atributo interno '{node.attr}'")
+
+    if require_fig:
+        assigned = {
+            node.id for node in ast.walk(tree)
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)
+        }
+        if 'fig' not in assigned:
+            issues.append("o código não atribui a figura à variável `fig`")
+
+    if columns:
+        references, created, df_rebound = _column_references(tree)
+        if not df_rebound:
+            known = set(columns) | created
+            names = [str(column) for column in columns]
+            for constant in references:
+                if constant.value in known:
+                    continue
+                suggestion = difflib.get_close_matches(constant.value, names, n=1, cutoff=COLUMN_FIX_CUTOFF)
+                if suggestion:
+                    column_fixes.append((constant, suggestion[0]))
+                else:
+                    issues.append(f"linha {constant.lineno}: coluna inexistente '{constant.value}'")
+    return issues, column_fixes
+
+
+@lru_cache(maxsize=256)
+def _prepare(code: str, columns: tuple, require_fig: bool) -> ValidatedCode:
+    source = _strip_fences(code)
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as error:
+        raise CodeValidationError([f"erro de sintaxe na linha {error.lineno}: {error.msg}"]) from error
+
+    repairer = _Repairer()
+    tree = repairer.visit(tree)
+    # Blocos que ficaram vazios após as remoções recebem um `pass`
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Module) and getattr(node, 'body', None) == []:
+            node.body = [ast.Pass()]
+    tree = ast.fix_missing_locations(tree)
+    repairs = list(repairer.repairs)
+    if source is not code:
+        repairs.append("cercas de Markdown removidas")
+
+    issues, column_fixes = _check(tree, columns, require_fig)
+    if issues:
+        raise CodeValidationError(issues)
+    for constant, column in column_fixes:
+        repairs.append(f"linha {constant.lineno}: coluna '{constant.value}' corrigida para '{column}'")
+        constant.value = column
+
+    if repairs:
+        source = ast.unparse(tree)
+    return ValidatedCode(source, repairs)
+
+
+def validate_code(code: str, columns=None, require_fig: bool = True) -> ValidatedCode:
+    """
+    Valida (e corrige quando possível) o código gerado; a compilação fica com compile_statements,
+    no processo que executa o código.
+
+    Args:
+        code: Código Python gerado
+        columns: Colunas do DataFrame `df` (None desativa a checagem de colunas)
+        require_fig: Exige a atribuição da variável `fig`
+
+    Raises:
+        CodeValidationError: com a lista de problemas que impedem a execução
+    """
+    return _prepare(code, tuple(columns) if columns is not None else (), require_fig)
+
+
+@lru_cache(maxsize=256)
+def compile_statements(code: str) -> tuple:
+    """
+    Instruções de nível superior compiladas separadamente, em cache pelo código-fonte
+    (reexecuções não recompilam). Permite medir o tempo de cada instrução.
+
+    Returns:
+        Tupla de (linha, trecho do código, objeto compilado)
+    """
+    statements = []
+    for node in ast.parse(code).body:
+        module = ast.Module(body=[node], type_ignores=[])
+        text = ast.get_source_segment(code, node) or ast.unparse(node)
+        statements.append((node.lineno, text.splitlines()[0], compile(module, '<codigo_gerado>', 'exec')))
+    return tuple(statements)
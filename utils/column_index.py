@@ -0,0 +1,135 @@
+"""
+Índice de colunas por dataset.
+Resolve menções a colunas na pergunta do usuário (nome exato, tokens,
+variações de plural/acentos e pequenos erros de digitação) sem chamar o LLM.
+"""
+import difflib
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils.dataset_cache import get_or_compute
+from utils.category_counts import CATEGORICAL_DTYPES
+from utils.intent import normalize_text, compile_column_matcher
+
+# Palavras comuns que não identificam colunas sozinhas
+STOP_WORDS = {
+    'a', 'o', 'as', 'os', 'de', 'da', 'do', 'das', 'dos', 'e', 'em', 'no', 'na', 'nos', 'nas',
+    'por', 'para', 'com', 'sem', 'entre', 'um', 'uma', 'qual', 'quais', 'que', 'se', 'ao',
+    'the', 'of', 'and', 'in', 'to', 'by',
+}
+STEM_LENGTH = 5
+FUZZY_CUTOFF = 0.85
+MIN_SCORE = 0.5
+
+
+def _tokenize(text: str) -> list:
+    """Quebra em tokens normalizados (camelCase, '_', '-', '.', espaços e dígitos)."""
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', str(text))
+    return re.findall(r'[a-z0-9]+', normalize_text(text))
+
+
+# Plurais irregulares do português reduzidos ao singular antes do radical (regiões -> regiao)
+PLURAL_SUFFIXES = (('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'))
+
+
+def _stem(token: str) -> str:
+    for plural, singular in PLURAL_SUFFIXES:
+        if token.endswith(plural) and len(token) > STEM_LENGTH:
+            token = token[:-len(plural)] + singular
+            break
+    return token[:STEM_LENGTH] if len(token) > STEM_LENGTH else token
+
+
+class ColumnIndex:
+    """Índice pré-computado das colunas de um DataFrame."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.columns = list(df.columns)
+        self.numeric_columns = df.select_dtypes(include=[np.number]).columns.tolist()
+        self.categorical_columns = df.select_dtypes(include=CATEGORICAL_DTYPES).columns.tolist()
+        self.datetime_columns = df.select_dtypes(include=['datetime', 'datetimetz']).columns.tolist()
+
+        # Tokens significativos de cada coluna e mapas token/radical -> colunas
+        self._column_tokens = {}
+        self._token_map = {}
+        self._stem_map = {}
+        for column in self.columns:
+            tokens = _tokenize(column)
+            meaningful = [token for token in tokens if token not in STOP_WORDS] or tokens
+            self._column_tokens[column] = set(meaningful)
+            for token in meaningful:
+                self._token_map.setdefault(token, set()).add(column)
+                if len(token) >= STEM_LENGTH:
+                    self._stem_map.setdefault(_stem(token), set()).add(token)
+
+        self._vocabulary = [token for token in self._token_map if len(token) >= STEM_LENGTH]
+        self._token_cache = {}
+
+    def _match_token(self, token: str) -> set:
+        """Tokens de coluna equivalentes a um token da pergunta (memoizado)."""
+        cached = self._token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        matches = set()
+        if token in self._token_map:
+            matches.add(token)
+        elif len(token) >= STEM_LENGTH and token not in STOP_WORDS:
+            matches |= self._stem_map.get(_stem(token), set())
+            if not matches:
+                matches.update(difflib.get_close_matches(token, self._vocabulary, n=1, cutoff=FUZZY_CUTOFF))
+        self._token_cache[token] = matches
+        return matches
+
+    def resolve(self, question: str, kind: str | None = None, limit: int | None = None) -> list:
+        """
+        Retorna as colunas mencionadas na pergunta, das mais às menos prováveis.
+
+        Args:
+            question: Texto da pergunta
+            kind: 'numeric', 'categorical' ou 'datetime' para filtrar por tipo
+            limit: Número máximo de colunas retornadas
+        """
+        scores = {}
+        positions = {}
+
+        # 1. Nome completo da coluna mencionado literalmente
+        pattern, by_name = compile_column_matcher(tuple(self.columns))
+        if pattern is not None:
+            spaced = re.sub(r'[_\-.]+', ' ', normalize_text(question or ""))
+            for match in pattern.finditer(spaced):
+                column = by_name[match.group()]
+                scores[column] = 2.0
+                positions.setdefault(column, match.start())
+
+        # 2. Cobertura de tokens (exatos, radicais e aproximados)
+        matched_by_column = {}
+        for position, token in enumerate(_tokenize(question or "")):
+            for column_token in self._match_token(token):
+                for column in self._token_map[column_token]:
+                    matched_by_column.setdefault(column, set()).add(column_token)
+                    positions.setdefault(column, 10_000 + position)
+
+        for column, matched in matched_by_column.items():
+            coverage = len(matched) / len(self._column_tokens[column])
+            if coverage >= MIN_SCORE:
+                scores[column] = max(scores.get(column, 0.0), coverage)
+
+        allowed = {
+            'numeric': self.numeric_columns,
+            'categorical': self.categorical_columns,
+            'datetime': self.datetime_columns,
+        }.get(kind)
+        if allowed is not None:
+            allowed = set(allowed)
+            scores = {column: score for column, score in scores.items() if column in allowed}
+
+        resolved = sorted(scores, key=lambda column: (-scores[column], positions[column]))
+        return resolved[:limit] if limit else resolved
+
+
+def get_column_index(df: pd.DataFrame) -> ColumnIndex:
+    """Índice de colunas do dataset (construído uma vez e mantido em cache)."""
+    return get_or_compute(df, "column_index", lambda: ColumnIndex(df))
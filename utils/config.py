@@ -1,8 +1,10 @@
 ﻿import streamlit as st
 
+@st.cache_resource(show_spinner=False)
 def get_config():
     """
     Carrega e retorna as configurações usando st.secrets (compatível com Streamlit Cloud).
+    Lidas uma vez por processo, e não a cada reexecução do script.
     Conforme documentação oficial: https://docs.streamlit.io/develop/api-reference/connections-and-secrets/secrets-toml
     """
     try:
@@ -0,0 +1,179 @@
+"""
+Correlação escalável para datasets largos.
+Calcula a matriz de correlação de Pearson em blocos (em paralelo) e retorna
+apenas os pares mais fortes e submatrizes de grupos de variáveis correlacionadas,
+mantendo o tamanho do resultado limitado independentemente do número de colunas.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.dataset_cache import get_or_compute
+
+DEFAULT_TOP_K = 20
+BLOCK_SIZE = 256
+# Até este número de colunas a matriz completa ainda é compacta o suficiente
+MAX_FULL_MATRIX_COLS = 15
+CLUSTER_THRESHOLD = 0.7
+MAX_CLUSTER_SIZE = 10
+MAX_CLUSTERS = 3
+
+
+def _prepare_matrix(df: pd.DataFrame, cols: list):
+    """Centraliza as colunas e separa valores, máscara de válidos e quadrados."""
+    X = df[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    mask = ~np.isnan(X)
+    has_missing = not mask.all()
+    # Centralizar pela média reduz erros de cancelamento nas somas
+    X = X - np.nanmean(X, axis=0)
+    X[~mask] = 0.0
+    return X, mask.astype(np.float64), has_missing
+
+
+def _block_correlation(X, M, X2, has_missing, rows: slice, cols: slice):
+    """Correlação de Pearson (pairwise-complete, como o pandas) entre dois blocos de colunas."""
+    A, B = X[:, rows], X[:, cols]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if not has_missing:
+            n = X.shape[0]
+            sxy = A.T @ B
+            sxx = (A * A).sum(axis=0)[:, None]
+            syy = (B * B).sum(axis=0)[None, :]
+            corr = sxy / np.sqrt(sxx * syy)
+            if n < 2:
+                corr[:] = np.nan
+            return corr
+
+        MA, MB = M[:, rows], M[:, cols]
+        n = MA.T @ MB
+        sx = A.T @ MB
+        sy = MA.T @ B
+        sxx = X2[:, rows].T @ MB
+        syy = MA.T @ X2[:, cols]
+        sxy = A.T @ B
+        cov = n * sxy - sx * sy
+        var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+        corr = cov / np.sqrt(var)
+        corr[(n < 2) | (var <= 0)] = np.nan
+        return corr
+
+
+def _block_top_pairs(X, M, X2, has_missing, bi: int, bj: int, block_size: int, top_k: int):
+    """Calcula um bloco da matriz e retorna seus `top_k` pares mais fortes (i, j, r)."""
+    p = X.shape[1]
+    rows = slice(bi, min(bi + block_size, p))
+    cols = slice(bj, min(bj + block_size, p))
+    corr = _block_correlation(X, M, X2, has_missing, rows, cols)
+
+    strength = np.abs(corr)
+    strength[np.isnan(strength)] = -1.0
+    if bi == bj:
+        # Bloco diagonal: considerar apenas o triângulo superior estrito
+        strength[np.tril_indices_from(strength)] = -1.0
+
+    flat = strength.ravel()
+    k = min(top_k, flat.size)
+    idx = np.argpartition(flat, -k)[-k:]
+    idx = idx[flat[idx] >= 0]
+    i, j = np.unravel_index(idx, strength.shape)
+    return i + bi, j + bj, corr[i, j]
+
+
+def _cluster_columns(pairs: pd.DataFrame, threshold: float):
+    """Agrupa colunas conectadas por correlações fortes (union-find sobre os top pares)."""
+    parent = {}
+
+    def find(c):
+        parent.setdefault(c, c)
+        while parent[c] != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+        return c
+
+    degree = {}
+    for a, b, r in pairs[['Variável 1', 'Variável 2', 'Correlação']].itertuples(index=False):
+        if abs(r) < threshold:
+            continue
+        parent[find(a)] = find(b)
+        degree[a] = degree.get(a, 0) + 1
+        degree[b] = degree.get(b, 0) + 1
+
+    groups = {}
+    for c in degree:
+        groups.setdefault(find(c), []).append(c)
+
+    clusters = [
+        sorted(members, key=lambda c: -degree[c])[:MAX_CLUSTER_SIZE]
+        for members in groups.values() if len(members) > 1
+    ]
+    clusters.sort(key=len, reverse=True)
+    return clusters[:MAX_CLUSTERS]
+
+
+def compute_correlation_summary(df: pd.DataFrame, numeric_cols: list, top_k: int = DEFAULT_TOP_K,
+                                block_size: int = BLOCK_SIZE, n_jobs: int | None = None) -> dict:
+    """
+    Calcula a correlação em blocos paralelos e retorna um resumo compacto:
+    - matrix: matriz completa (apenas para datasets estreitos, senão None)
+    - top_pairs: DataFrame com os `top_k` pares de maior |correlação|
+    - clusters: lista de submatrizes de grupos fortemente correlacionados
+    - heatmap_columns: colunas sugeridas para um heatmap legível
+    """
+    cols = list(numeric_cols)
+    p = len(cols)
+    X, M, has_missing = _prepare_matrix(df, cols)
+    X2 = X * X if has_missing else None
+
+    starts = range(0, p, block_size)
+    tasks = [(bi, bj) for bi in starts for bj in starts if bj >= bi]
+    n_jobs = n_jobs or min(os.cpu_count() or 1, 8)
+
+    # numpy libera o GIL nas multiplicações de matrizes, então threads usam vários núcleos
+    with ThreadPoolExecutor(max_workers=max(1, min(n_jobs, len(tasks)))) as executor:
+        partials = list(executor.map(
+            lambda t: _block_top_pairs(X, M, X2, has_missing, t[0], t[1], block_size, top_k),
+            tasks
+        ))
+
+    rows_idx = np.concatenate([part[0] for part in partials]) if partials else np.array([], dtype=int)
+    cols_idx = np.concatenate([part[1] for part in partials]) if partials else np.array([], dtype=int)
+    values = np.concatenate([part[2] for part in partials]) if partials else np.array([])
+
+    order = np.argsort(-np.abs(values), kind='stable')[:top_k]
+    top_pairs = pd.DataFrame({
+        'Variável 1': [cols[i] for i in rows_idx[order]],
+        'Variável 2': [cols[j] for j in cols_idx[order]],
+        'Correlação': np.round(values[order], 4),
+    })
+
+    clusters = [df[members].corr() for members in _cluster_columns(top_pairs, CLUSTER_THRESHOLD)]
+
+    if p <= MAX_FULL_MATRIX_COLS:
+        matrix = df[cols].corr()
+        heatmap_columns = cols
+    else:
+        matrix = None
+        heatmap_columns = []
+        for name in list(top_pairs['Variável 1']) + list(top_pairs['Variável 2']):
+            if name not in heatmap_columns:
+                heatmap_columns.append(name)
+        heatmap_columns = heatmap_columns[:MAX_FULL_MATRIX_COLS]
+
+    return {
+        "n_cols": p,
+        "matrix": matrix,
+        "top_pairs": top_pairs,
+        "clusters": clusters,
+        "heatmap_columns": heatmap_columns,
+    }
+
+
+def get_correlation_summary(df: pd.DataFrame, numeric_cols: list, top_k: int = DEFAULT_TOP_K) -> dict:
+    """Versão com cache por dataset (reutilizada pelo analista e pela visualização)."""
+    return get_or_compute(
+        df,
+        ("correlation", tuple(numeric_cols), top_k),
+        lambda: compute_correlation_summary(df, numeric_cols, top_k=top_k)
+    )
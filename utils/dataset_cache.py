@@ -0,0 +1,67 @@
+"""
+Cache de artefatos por dataset.
+Guarda resultados caros (correlações, códigos fatorizados, índices) associados
+ao DataFrame carregado na sessão, para que sejam reutilizados entre perguntas.
+"""
+import hashlib
+import threading
+import weakref
+
+import pandas as pd
+
+_artifacts = {}
+_lock = threading.Lock()
+
+
+def _signature(df: pd.DataFrame) -> tuple:
+    """Assinatura barata para detectar mudanças de estrutura no DataFrame."""
+    return df.shape, tuple(df.columns)
+
+
+def get_dataset_artifacts(df: pd.DataFrame) -> dict:
+    """
+    Retorna o dicionário de artefatos associado a este DataFrame.
+    O cache é descartado automaticamente quando o DataFrame é coletado
+    ou quando sua estrutura (shape/colunas) muda.
+    """
+    key = id(df)
+    signature = _signature(df)
+    with _lock:
+        entry = _artifacts.get(key)
+        if entry is None:
+            entry = {"signature": signature, "items": {}}
+            _artifacts[key] = entry
+            weakref.finalize(df, _artifacts.pop, key, None)
+        elif entry["signature"] != signature:
+            # Estrutura alterada pelo próprio app; o código gerado roda sempre sobre cópias
+            # (worker ou execução local), então alterações só de valores não chegam aqui
+            entry["signature"] = signature
+            entry["items"] = {}
+        return entry["items"]
+
+
+def get_or_compute(df: pd.DataFrame, name, compute):
+    """Retorna o artefato `name` do cache ou calcula com `compute()` e armazena."""
+    items = get_dataset_artifacts(df)
+    if name not in items:
+        items[name] = compute()
+    return items[name]
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Impressão digital do conteúdo do DataFrame (valores, índice, colunas e tipos),
+    calculada uma vez por dataset: datasets diferentes com o mesmo schema não colidem.
+    """
+    def compute():
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((list(map(str, df.columns)), list(map(str, df.dtypes)), df.shape)).encode())
+        try:
+            hashes = pd.util.hash_pandas_object(df, index=True)
+        except TypeError:
+            # Células não hasheáveis (listas, dicts): usa a representação em texto
+            hashes = pd.util.hash_pandas_object(df.astype(str), index=True)
+        digest.update(hashes.to_numpy().tobytes())
+        return digest.hexdigest()
+
+    return get_or_compute(df, "fingerprint", compute)
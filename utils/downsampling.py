@@ -0,0 +1,191 @@
+"""
+Redução de séries grandes em gráficos Plotly.
+Linhas com muitos pontos são reduzidas com LTTB (Largest-Triangle-Three-Buckets)
+ou min-max, nuvens de pontos são amostradas, e traces grandes passam a usar
+WebGL (Scattergl), mantendo o tempo de renderização e o payload limitados.
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+# Anotação única de rodapé (amostragem, redução de pontos...)
+FOOTNOTE_NAME = 'rodape'
+
+# Máximo de pontos por trace de linha após a redução
+MAX_LINE_POINTS = 5_000
+# Máximo de pontos por trace de marcadores (WebGL suporta bem esta ordem de grandeza)
+MAX_MARKER_POINTS = 50_000
+# Acima deste número de pontos o trace é convertido para Scattergl
+WEBGL_THRESHOLD = 10_000
+# Limite mínimo por trace quando o orçamento é dividido entre muitos traces
+MIN_TRACE_POINTS = 500
+
+# Atributos por ponto que precisam acompanhar a redução
+_POINT_ATTRIBUTES = ('text', 'hovertext', 'customdata', 'ids')
+_MARKER_ATTRIBUTES = ('color', 'size', 'symbol', 'opacity')
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Índices selecionados pelo algoritmo LTTB (x deve estar ordenado)."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        # Ponto médio do próximo bucket
+        avg_x = x[end:next_end].mean() if next_end > end else x[-1]
+        avg_y = y[end:next_end].mean() if next_end > end else y[-1]
+        # Área do triângulo (anterior selecionado, candidato, média do próximo)
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area)) if end > start else start
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Mantém o mínimo e o máximo de cada bucket (preserva picos em qualquer ordem de x)."""
+    n = len(y)
+    n_buckets = max(1, n_out // 2)
+    if n <= n_out:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    indices = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            bucket = y[start:end]
+            indices.append(start + int(np.nanargmin(bucket)) if not np.isnan(bucket).all() else start)
+            indices.append(start + int(np.nanargmax(bucket)) if not np.isnan(bucket).all() else end - 1)
+    return np.unique(indices)
+
+
+def _as_numeric(values) -> np.ndarray | None:
+    """Converte eixos numéricos/datas para float; retorna None para eixos categóricos."""
+    array = np.asarray(values)
+    if np.issubdtype(array.dtype, np.datetime64):
+        return array.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    if np.issubdtype(array.dtype, np.number) or array.dtype == bool:
+        return array.astype(np.float64)
+    try:
+        return array.astype(np.float64)
+    except (TypeError, ValueError):
+        return None
+
+
+def _subset_trace(props: dict, indices: np.ndarray, n: int) -> dict:
+    """Aplica a seleção de pontos a x, y e demais atributos por ponto."""
+    for key in ('x', 'y') + _POINT_ATTRIBUTES:
+        value = props.get(key)
+        if value is not None and not isinstance(value, str) and np.ndim(value) > 0 and len(value) == n:
+            props[key] = np.asarray(value)[indices]
+    marker = props.get('marker')
+    if isinstance(marker, dict):
+        for key in _MARKER_ATTRIBUTES:
+            value = marker.get(key)
+            if value is not None and not isinstance(value, str) and np.ndim(value) > 0 and len(value) == n:
+                marker[key] = np.asarray(value)[indices]
+    return props
+
+
+def _reduce_trace(trace, max_line_points: int, max_marker_points: int) -> tuple:
+    """Reduz um trace scatter/scattergl; retorna (novo trace, pontos antes, pontos depois)."""
+    props = trace.to_plotly_json()
+    y = props.get('y')
+    if y is None or isinstance(y, str) or np.ndim(y) == 0:
+        return trace, 0, 0
+    n = len(y)
+    if props.get('x') is None:
+        props['x'] = np.arange(n)
+
+    mode = props.get('mode') or ('lines' if n >= 20 else 'lines+markers')
+    indices = None
+    if 'lines' in mode and n > max_line_points:
+        x_num = _as_numeric(props['x'])
+        y_num = _as_numeric(y)
+        if y_num is not None:
+            if x_num is not None and np.all(np.diff(x_num) >= 0) and not np.isnan(y_num).any():
+                indices = lttb_indices(x_num, y_num, max_line_points)
+            else:
+                indices = minmax_indices(y_num, max_line_points)
+    elif 'lines' not in mode and n > max_marker_points:
+        # Nuvem de pontos: amostra uniforme determinística preserva a densidade visual
+        rng = np.random.default_rng(0)
+        indices = np.sort(rng.choice(n, size=max_marker_points, replace=False))
+
+    if indices is not None:
+        props = _subset_trace(props, indices, n)
+    rendered = len(props['y'])
+
+    # Traces grandes (e sem recursos exclusivos de SVG) passam para WebGL
+    use_webgl = (
+        rendered > WEBGL_THRESHOLD or props.get('type') == 'scattergl'
+    ) and not props.get('stackgroup') and (props.get('line') or {}).get('shape') != 'spline'
+    if indices is None and not (use_webgl and props.get('type') == 'scatter'):
+        return trace, n, n
+
+    props.pop('type', None)
+    trace_class = go.Scattergl if use_webgl else go.Scatter
+    return trace_class(props, skip_invalid=True), n, rendered
+
+
+def optimize_figure(fig: go.Figure) -> tuple:
+    """
+    Reduz traces grandes da figura e anota a taxa de redução.
+
+    Returns:
+        (figura otimizada, relatório com pontos originais/renderizados e traces alterados)
+    """
+    report = {"original_points": 0, "rendered_points": 0, "downsampled_traces": 0, "webgl_traces": 0}
+    if fig is None or not hasattr(fig, 'data'):
+        return fig, report
+
+    # O orçamento de pontos é da figura inteira, dividido entre os traces scatter
+    n_scatter = sum(trace.type in ('scatter', 'scattergl') for trace in fig.data)
+    max_line_points = max(MIN_TRACE_POINTS, MAX_LINE_POINTS // max(n_scatter, 1))
+    max_marker_points = max(MIN_TRACE_POINTS, MAX_MARKER_POINTS // max(n_scatter, 1))
+
+    new_traces = []
+    changed = False
+    for trace in fig.data:
+        if trace.type not in ('scatter', 'scattergl'):
+            new_traces.append(trace)
+            continue
+        new_trace, original, rendered = _reduce_trace(trace, max_line_points, max_marker_points)
+        report["original_points"] += original
+        report["rendered_points"] += rendered
+        if rendered < original:
+            report["downsampled_traces"] += 1
+        if new_trace is not trace:
+            changed = True
+            if new_trace.type == 'scattergl':
+                report["webgl_traces"] += 1
+        new_traces.append(new_trace)
+
+    if not changed:
+        return fig, report
+
+    optimized = go.Figure(data=new_traces, layout=fig.layout)
+    if report["rendered_points"] < report["original_points"]:
+        ratio = report["original_points"] / max(report["rendered_points"], 1)
+        add_footnote(optimized, f"Dados reduzidos para renderização: {report['original_points']:,} → "
+                                f"{report['rendered_points']:,} pontos ({ratio:.0f}×)")
+    return optimized, report
+
+
+def add_footnote(fig, text: str):
+    """Nota no rodapé do gráfico; notas seguintes entram na mesma anotação, uma por linha."""
+    for annotation in fig.layout.annotations:
+        if annotation.name == FOOTNOTE_NAME:
+            annotation.text = f"{annotation.text}<br>{text}"
+            return
+    fig.add_annotation(
+        name=FOOTNOTE_NAME, text=text, xref='paper', yref='paper', x=1, y=-0.12, xanchor='right', yanchor='top',
+        align='right', showarrow=False, font=dict(size=10, color='#666666')
+    )
@@ -0,0 +1,139 @@
+"""
+Execução em duas etapas do código gerado.
+Em datasets grandes o código roda antes em amostras estratificadas pequenas:
+erros e figuras inválidas aparecem em milissegundos, e os tempos das duas
+amostras estimam o custo da execução completa. Se a estimativa passar do
+orçamento, o resultado da amostra é mantido com uma nota visível.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils.code_executor import execute_isolated, CodeExecutionError, ExecutionResult
+from utils.dataset_cache import get_or_compute
+from utils.downsampling import add_footnote
+
+# Datasets menores que isto rodam direto nos dados completos
+DRY_RUN_MIN_ROWS = 50_000
+# Tamanhos das duas amostras (a diferença de tempo entre elas estima o custo por linha)
+DRY_RUN_ROWS = (1_000, 20_000)
+# Orçamento da execução completa estimada (segundos)
+FULL_RUN_BUDGET = 15
+# Colunas categóricas com até este número de valores podem definir os estratos
+MAX_STRATA = 50
+STRATA_PROBE_ROWS = 100_000
+SAMPLE_SEED = 0
+# Erros que podem ser causados pela própria amostra (ex.: df.iloc[10000], df.loc['rótulo fora da amostra']):
+# não são conclusivos
+INCONCLUSIVE_ERRORS = {'IndexError', 'KeyError'}
+
+
+def _strata_column(df: pd.DataFrame):
+    """Coluna categórica de menor cardinalidade (2 a MAX_STRATA valores) usada como estrato."""
+    def compute():
+        probe = df.head(STRATA_PROBE_ROWS)
+        best, best_count = None, MAX_STRATA + 1
+        for column in probe.columns:
+            series = probe[column]
+            if not (series.dtype == object or isinstance(series.dtype, (pd.CategoricalDtype, pd.StringDtype))
+                    or pd.api.types.is_bool_dtype(series)):
+                continue
+            try:
+                count = series.nunique()
+            except TypeError:
+                continue
+            if 2 <= count < best_count:
+                best, best_count = column, count
+        return best
+    return get_or_compute(df, "strata_column", compute)
+
+
+def stratified_sample(df: pd.DataFrame, rows: int) -> pd.DataFrame:
+    """
+    Amostra determinística com `rows` linhas, proporcional a cada categoria da coluna
+    de estrato (ao menos uma linha por categoria). Mantém a ordem e o índice originais.
+    """
+    def compute():
+        if len(df) <= rows:
+            return df
+        rng = np.random.default_rng(SAMPLE_SEED)
+        column = _strata_column(df)
+        if column is None:
+            positions = np.sort(rng.choice(len(df), size=rows, replace=False))
+            return df.iloc[positions]
+
+        codes = pd.factorize(df[column])[0] + 1  # 0 = valores ausentes
+        counts = np.bincount(codes)
+        quotas = np.where(counts > 0, np.maximum(1, np.round(counts * rows / len(df))), 0).astype(np.int64)
+        # Ordena por estrato e, dentro dele, por uma chave aleatória; pega as primeiras `quota` linhas
+        order = np.lexsort((rng.random(len(df)), codes))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sorted_codes = codes[order]
+        rank = np.arange(len(df)) - starts[sorted_codes]
+        positions = np.sort(order[rank < quotas[sorted_codes]])
+        return df.iloc[positions]
+    return get_or_compute(df, ("stratified_sample", rows), compute)
+
+
+def _check_figure(result: ExecutionResult, require_fig: bool):
+    if require_fig and not (isinstance(result.fig, go.Figure) and len(result.fig.data)):
+        raise CodeExecutionError("ValueError", "o código não gerou uma figura `fig` válida na amostra")
+
+
+def _is_inconclusive(error: Exception) -> bool:
+    error_type = error.error_type if isinstance(error, CodeExecutionError) else type(error).__name__
+    return error_type in INCONCLUSIVE_ERRORS
+
+
+def estimate_full_ms(small_ms: float, large_ms: float, small_rows: int, large_rows: int, total_rows: int) -> float:
+    """Extrapolação linear: custo fixo + custo por linha medido entre as duas amostras."""
+    per_row = max(0.0, (large_ms - small_ms) / (large_rows - small_rows))
+    return large_ms + per_row * (total_rows - large_rows)
+
+
+def execute_with_dry_run(code: str, df: pd.DataFrame, require_fig: bool = False,
+                         budget: float = FULL_RUN_BUDGET, trusted: bool = False) -> ExecutionResult:
+    """
+    Executa o código primeiro em amostras estratificadas e só então nos dados completos
+    (ou mantém o resultado da amostra, com nota, se a execução completa estourar o orçamento).
+    Código do próprio sistema (`trusted`: templates e visualizações estatísticas, já
+    agregados) vai direto para os dados completos.
+
+    Raises:
+        ExecutionTimeout, CodeExecutionError ou o erro levantado pelo código na amostra
+    """
+    if trusted or len(df) < DRY_RUN_MIN_ROWS:
+        return execute_isolated(code, df)
+
+    small_rows, large_rows = DRY_RUN_ROWS
+    try:
+        small = execute_isolated(code, stratified_sample(df, small_rows))
+        _check_figure(small, require_fig)
+        large = execute_isolated(code, stratified_sample(df, large_rows))
+        _check_figure(large, require_fig)
+    except Exception as error:
+        if not _is_inconclusive(error):
+            raise
+        print(f"Erro possivelmente causado pela amostra, executando nos dados completos: {error}")
+        return execute_isolated(code, df)
+
+    small_ms, large_ms = small.timings.get("exec_ms", 0.0), large.timings.get("exec_ms", 0.0)
+    estimate = estimate_full_ms(small_ms, large_ms, small_rows, large_rows, len(df))
+    if estimate > budget * 1000:
+        # Confirma a medição antes de abrir mão dos dados completos (ruído é amplificado pela extrapolação)
+        small_ms = min(small_ms, execute_isolated(code, stratified_sample(df, small_rows)).timings.get("exec_ms", small_ms))
+        large_ms = min(large_ms, execute_isolated(code, stratified_sample(df, large_rows)).timings.get("exec_ms", large_ms))
+        estimate = estimate_full_ms(small_ms, large_ms, small_rows, large_rows, len(df))
+    dry_run_timings = {"dry_run_ms": small_ms + large_ms, "estimated_full_ms": estimate}
+
+    if estimate <= budget * 1000:
+        result = execute_isolated(code, df)
+        result.timings.update(dry_run_timings)
+        return result
+
+    large.note = (f"Resultado calculado em uma amostra estratificada de {large_rows:,} de {len(df):,} linhas: "
+                  f"a execução completa levaria cerca de {estimate / 1000:.0f}s (orçamento: {budget:.0f}s).")
+    if isinstance(large.fig, go.Figure):
+        add_footnote(large.fig, f"Amostra estratificada: {large_rows:,} de {len(df):,} linhas")
+    large.timings.update(dry_run_timings)
+    return large
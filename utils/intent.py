@@ -0,0 +1,169 @@
+"""
+Detecção de intenções compartilhada.
+Todas as listas de palavras-chave do sistema ficam aqui e são compiladas em um
+único autômato (regex em forma de trie), aplicado em uma passada sobre o texto
+normalizado (minúsculas e sem acentos).
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+# Palavras-chave já normalizadas (sem acento); prefixos casam com variações
+# (ex.: 'descri' -> 'descritiva', 'correlac' -> 'correlação')
+INTENT_KEYWORDS = {
+    "describe": ['descri', 'estatistica', 'resumo', 'media', 'mediana', 'desvio', 'padrao',
+                 'minimo', 'maximo', 'geral'],
+    "correlation": ['correlac', 'relaciona', 'influencia'],
+    "outliers": ['outlier', 'atipico', 'anomalia', 'anomalo'],
+    "frequency": ['frequente', 'frequencia', 'comum', 'valor_counts', 'contagem'],
+    "missing": ['faltante', 'missing', 'nulo', 'nan', 'vazio'],
+    "distribution": ['distribuic', 'histograma', 'densidade'],
+    "visualization": ['grafico', 'plot', 'boxplot', 'box plot', 'visualizac', 'histograma',
+                      'scatter', 'heatmap'],
+    "insights": ['insight', 'recomend', 'conclus', 'negocio', 'estrategi', 'otimiz'],
+    "conclusion": ['conclus', 'insight', 'recomend', 'sugest', 'negocio', 'acoes', 'estrategi'],
+    "code": ['codigo', 'python', 'notebook', 'script', 'funcao'],
+    # Tipos de gráfico pedidos explicitamente (motor de templates de gráficos)
+    "chart_bar": ['barra', 'bar chart', 'ranking'],
+    "chart_time_series": ['serie tempor', 'series tempor', 'temporal', 'ao longo do', 'evolucao',
+                          'tendencia', 'linha do tempo'],
+    "chart_scatter": ['dispersao', 'scatter', 'versus'],
+    "chart_grouped_box": ['box', 'boxplot', 'box plot'],
+    "chart_pie": ['pizza', 'pie', 'rosca', 'proporc', 'participac'],
+    # Agregações pedidas
+    "agg_mean": ['media', 'medio'],
+    "agg_sum": ['soma', 'total', 'somator'],
+    # Menções explícitas aos agentes nas respostas
+    "agent_data_analyst": ['dataanalystagent'],
+    "agent_visualization": ['visualizationagent'],
+    "agent_consultant": ['consultantagent'],
+    "agent_code_generator": ['codegeneratoragent'],
+}
+
+STATISTICS_INTENTS = ("describe", "correlation", "outliers", "distribution")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas e sem acentos (NFKD + remoção das marcas combinantes)."""
+    return unicodedata.normalize('NFKD', text.lower()).encode('ascii', 'ignore').decode('ascii')
+
+
+def _trie_pattern(words) -> str:
+    """Monta uma alternância em forma de trie, que o `re` percorre sem retestar prefixos."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        group = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return '(?:' + group + ')?'
+        return group
+
+    return build(trie)
+
+
+def _compile_keywords():
+    keyword_intents = {}
+    for intent, keywords in INTENT_KEYWORDS.items():
+        for keyword in keywords:
+            keyword_intents.setdefault(keyword, []).append(intent)
+    pattern = re.compile(r'(?<![a-z0-9])' + _trie_pattern(keyword_intents))
+    return pattern, keyword_intents
+
+
+_KEYWORD_PATTERN, _KEYWORD_INTENTS = _compile_keywords()
+_MAX_KEYWORD_LENGTH = max(len(keyword) for keyword in _KEYWORD_INTENTS)
+
+
+def _normalize_column_name(name) -> str:
+    return re.sub(r'[\s_\-.]+', ' ', normalize_text(str(name))).strip()
+
+
+@lru_cache(maxsize=32)
+def compile_column_matcher(columns: tuple):
+    """Compila os nomes de colunas em um autômato (cache por conjunto de colunas)."""
+    by_name = {}
+    for column in columns:
+        normalized = _normalize_column_name(column)
+        if normalized:
+            by_name.setdefault(normalized, column)
+    if not by_name:
+        return None, by_name
+    pattern = re.compile(r'(?<![a-z0-9])' + _trie_pattern(by_name) + r'(?![a-z0-9])')
+    return pattern, by_name
+
+
+def _count_intents(normalized: str, counts: dict, min_end: int = 0) -> dict:
+    for match in _KEYWORD_PATTERN.finditer(normalized):
+        if match.end() <= min_end:
+            continue
+        for intent in _KEYWORD_INTENTS[match.group()]:
+            counts[intent] = counts.get(intent, 0) + 1
+    return counts
+
+
+def detect_intents(text: str, columns=None) -> dict:
+    """
+    Detecta intenções e colunas mencionadas no texto.
+
+    Args:
+        text: Texto a analisar
+        columns: Lista de nomes de colunas (casamento exato) ou um ColumnIndex
+            (resolução com tokens, radicais e erros de digitação)
+
+    Returns:
+        {"intents": {intenção: número de ocorrências}, "columns": [colunas mencionadas]}
+    """
+    normalized = normalize_text(text or "")
+    intents = _count_intents(normalized, {})
+
+    mentioned = []
+    if hasattr(columns, "resolve"):
+        mentioned = columns.resolve(text)
+    elif columns is not None and len(columns) > 0:
+        pattern, by_name = compile_column_matcher(tuple(columns))
+        if pattern is not None:
+            # Nomes com '_' também casam quando escritos com espaços na pergunta
+            spaced = re.sub(r'[_\-.]+', ' ', normalized)
+            for match in pattern.finditer(spaced):
+                column = by_name[match.group()]
+                if column not in mentioned:
+                    mentioned.append(column)
+
+    return {"intents": intents, "columns": mentioned}
+
+
+def scan_incremental(text: str, state: dict) -> dict:
+    """
+    Atualiza `state` com as intenções do texto varrendo apenas o trecho novo.
+    Pensado para históricos que só crescem por concatenação; se o prefixo já
+    varrido mudou (ex.: histórico limpo), a varredura recomeça do início.
+
+    Returns:
+        Dicionário acumulado {intenção: número de ocorrências}
+    """
+    text = text or ""
+    length = state.get("length", 0)
+    tail = state.get("tail", "")
+    if length > len(text) or text[max(0, length - len(tail)):length] != tail:
+        length = 0
+        state["counts"] = {}
+
+    counts = state.setdefault("counts", {})
+    if len(text) > length:
+        # Reanalisa uma pequena sobreposição para pegar palavras cortadas na fronteira,
+        # contando apenas ocorrências que terminam no trecho novo
+        start = max(0, length - _MAX_KEYWORD_LENGTH)
+        overlap = len(normalize_text(text[start:length]))
+        _count_intents(normalize_text(text[start:]), counts, min_end=overlap)
+
+    state["length"] = len(text)
+    state["tail"] = text[-64:]
+    return counts
@@ -1,74 +1,377 @@
+import atexit
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
 from supabase import create_client, Client
 
+from utils.active_conversations import remember_conversation, resolve_conversation
+from utils.chart_store import compress_chart, decompress_chart, encode_payload, decode_payload
+
+# Tabelas na ordem de gravação de cada lote: as referenciadas antes das que as referenciam
+TABLE_ORDER = ("sessions", "charts", "conversations", "analyses", "conclusions", "generated_codes")
+# Tabelas endereçadas por conteúdo: linhas repetidas são ignoradas (upsert sem atualização).
+# Esquema no Supabase: supabase/migrations/001_content_addressed_charts.sql
+CONTENT_ADDRESSED_TABLES = {"charts"}
+WRITE_BATCH_SIZE = 100
+# Espera após a primeira gravação para juntar as demais do mesmo turno no lote
+WRITE_BATCH_DELAY = 0.05
+WRITE_MAX_RETRIES = 3
+WRITE_RETRY_BACKOFF = 0.5
+SHUTDOWN_FLUSH_TIMEOUT = 10
+# Espera máxima de uma leitura pelas gravações pendentes da sua sessão
+READ_FLUSH_TIMEOUT = 2.0
+
+# Histórico paginado: conversas por página e apenas as colunas usadas (gráficos são carregados sob demanda)
+HISTORY_PAGE_SIZE = 50
+CONVERSATION_COLUMNS = "id, created_at, question, answer, chart_id"
+ANALYSIS_COLUMNS = "id, created_at, conversation_id, analysis_type, results"
+CONCLUSION_COLUMNS = "id, created_at, conversation_id, conclusion_text, confidence_score"
+# Código do PostgREST quando não há relação (chave estrangeira) entre as tabelas do select aninhado
+POSTGREST_MISSING_RELATIONSHIP = "PGRST200"
+
+# Um cliente por projeto Supabase no processo: a sessão HTTP mantém as conexões abertas (keep-alive)
+_clients = {}
+_clients_lock = threading.Lock()
+_write_queues = {}
+_write_queues_lock = threading.Lock()
+# Gráficos já gravados por este processo (não são reenviados); marcados pela fila após o upsert
+_stored_charts = set()
+
+
+class WriteBehindQueue:
+    """
+    Fila de gravações assíncronas no Supabase.
+    Uma thread em segundo plano grava em lotes (um insert por tabela), na ordem de
+    chegada: a ordem por sessão é preservada e as linhas referenciadas são gravadas
+    antes das que as referenciam. Falhas são repetidas um número limitado de vezes;
+    um lote que ainda falha é regravado linha a linha (só as linhas com erro se perdem).
+    Cada operação leva marcadores (sessão, usuário, id): leituras esperam apenas as
+    gravações pendentes com os seus marcadores.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+        self.stats = {"written": 0, "failed": 0, "batches": 0, "retries": 0}
+        self._queue = queue.Queue()
+        self._pending = Counter()
+        self._pending_lock = threading.Lock()
+        # Gravações perdidas por marcador (ex.: por sessão), para avisar o usuário afetado
+        self._failed = Counter()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="supabase-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def insert(self, table: str, row: dict, tags=()):
+        # Horário do evento (não da gravação): linhas do mesmo lote mantêm a ordem em `created_at`
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        self._put(("insert", table, row, tuple(tags)))
+
+    def update(self, table: str, row_id: str, values: dict, tags=()):
+        self._put(("update", table, (row_id, values), tuple(tags)))
+
+    def _put(self, operation):
+        with self._pending_lock:
+            self._pending.update(operation[3])
+        self._queue.put(operation)
+
+    def _done(self, operations: list):
+        with self._pending_lock:
+            for operation in operations:
+                self._pending.subtract(operation[3])
+            self._pending = +self._pending
+
+    def has_pending(self, tags) -> bool:
+        with self._pending_lock:
+            return any(self._pending[tag] > 0 for tag in tags)
+
+    def failed_count(self, tag: str) -> int:
+        """Gravações com o marcador que falharam após as novas tentativas."""
+        with self._pending_lock:
+            return self._failed[tag]
+
+    def _fail(self, operation):
+        self.stats["failed"] += 1
+        with self._pending_lock:
+            self._failed.update(operation[3])
+
+    def flush(self, tags=None, timeout: float | None = READ_FLUSH_TIMEOUT) -> bool:
+        """
+        Bloqueia até que o que foi enfileirado antes desta chamada esteja gravado (apenas se houver
+        gravação pendente com algum dos `tags`, quando informados). Retorna False se o tempo
+        esgotar ou a thread de gravação não estiver ativa; a leitura segue sem as pendências.
+        """
+        if tags is not None and not self.has_pending(tags):
+            return True
+        if self._closed or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(("flush", None, done, ()))
+        if not done.wait(timeout):
+            print(f"Gravações pendentes no Supabase não concluídas em {timeout} s; lendo sem elas")
+            return False
+        return True
+
+    def close(self):
+        """Grava as pendências e encerra a thread (chamado também na saída do processo)."""
+        self._closed = True
+        if self._thread.is_alive():
+            self._queue.put(("stop", None, None, ()))
+            self._thread.join(SHUTDOWN_FLUSH_TIMEOUT)
+
+    def _run(self):
+        while True:
+            operations = [self._queue.get()]
+            if operations[0][0] in ("insert", "update"):
+                time.sleep(WRITE_BATCH_DELAY)
+            while len(operations) < WRITE_BATCH_SIZE:
+                try:
+                    operations.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not self._process(operations):
+                return
+
+    def _process(self, operations: list) -> bool:
+        """Grava as operações até cada marcador (flush/stop); retorna False ao parar."""
+        pending = []
+        for operation in operations:
+            kind, _, argument, _ = operation
+            if kind in ("insert", "update"):
+                pending.append(operation)
+                continue
+            self._write_pending(pending)
+            pending = []
+            if kind == "flush":
+                argument.set()
+            else:
+                return False
+        self._write_pending(pending)
+        return True
+
+    def _write_pending(self, operations: list):
+        try:
+            self._write(operations)
+        finally:
+            self._done(operations)
+
+    def _write(self, operations: list):
+        if not operations:
+            return
+        inserts = {}
+        for operation in operations:
+            if operation[0] == "insert":
+                inserts.setdefault(operation[1], []).append(operation)
+        for table in sorted(inserts, key=lambda name: TABLE_ORDER.index(name) if name in TABLE_ORDER else len(TABLE_ORDER)):
+            written = self._insert_rows(table, inserts[table])
+            if table == "charts":
+                # Só depois de gravados: gráficos que falharam são reenviados no próximo store_chart
+                _stored_charts.update(row["id"] for row in written)
+        # Atualizações depois dos inserts do lote (a linha atualizada já foi gravada)
+        for operation in (operation for operation in operations if operation[0] == "update"):
+            _, table, (row_id, values), _ = operation
+            if not self._with_retry(f"atualização de {table} {row_id}", 1,
+                                    lambda table=table, row_id=row_id, values=values:
+                                    self.client.table(table).update(values).eq("id", row_id).execute()):
+                self._fail(operation)
+
+    def _insert_rows(self, table: str, operations: list) -> list:
+        """Insere as linhas em lote; se o lote falhar, linha a linha. Retorna as linhas gravadas."""
+        def write(rows):
+            if table in CONTENT_ADDRESSED_TABLES:
+                return lambda: self.client.table(table).upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+            return lambda: self.client.table(table).insert(rows).execute()
+
+        rows = [operation[2] for operation in operations]
+        if self._with_retry(f"{len(rows)} linha(s) em {table}", len(rows), write(rows)):
+            return rows
+        if len(rows) == 1:
+            self._fail(operations[0])
+            return []
+        # Uma linha inválida (ex.: chave estrangeira) não derruba as demais do lote
+        written = []
+        for operation in operations:
+            row = operation[2]
+            if self._with_retry(f"linha {row.get('id', '')} em {table}", 1, write([row]), retries=0):
+                written.append(row)
+            else:
+                self._fail(operation)
+        return written
+
+    def _with_retry(self, description: str, count: int, write, retries: int = WRITE_MAX_RETRIES) -> bool:
+        """Executa a gravação com novas tentativas; retorna se ela foi concluída."""
+        self.stats["batches"] += 1
+        for attempt in range(retries + 1):
+            try:
+                write()
+                self.stats["written"] += count
+                return True
+            except Exception as e:
+                if attempt == retries:
+                    print(f"Erro ao gravar {description} no Supabase após {attempt + 1} tentativas: {e}")
+                    return False
+                self.stats["retries"] += 1
+                time.sleep(WRITE_RETRY_BACKOFF * 2 ** attempt)
+
+
+def get_supabase_client(url: str, key: str) -> Client:
+    """Cliente compartilhado por projeto Supabase (criado uma vez por processo)."""
+    with _clients_lock:
+        client = _clients.get((url, key))
+        if client is None:
+            client = create_client(url, key)
+            _clients[(url, key)] = client
+        return client
+
+
+def get_write_queue(url: str, key: str) -> WriteBehindQueue:
+    """Fila de gravação compartilhada por projeto Supabase (uma thread por processo)."""
+    with _write_queues_lock:
+        writer = _write_queues.get((url, key))
+        if writer is None:
+            writer = WriteBehindQueue(get_supabase_client(url, key))
+            _write_queues[(url, key)] = writer
+        return writer
+
+
+def _is_missing_relationship(error) -> bool:
+    """Erro do PostgREST para select aninhado sem chave estrangeira entre as tabelas."""
+    return getattr(error, "code", None) == POSTGREST_MISSING_RELATIONSHIP or "relationship" in str(error).lower()
+
+
+def _history_page(conversations: list, analyses: list, conclusions: list, limit: int) -> dict:
+    """Página em ordem cronológica; `next_cursor` busca as conversas anteriores (None na última página)."""
+    conversations = sorted(conversations, key=lambda row: row["created_at"])
+    return {
+        "conversations": conversations,
+        "analyses": sorted(analyses, key=lambda row: row["created_at"]),
+        "conclusions": sorted(conclusions, key=lambda row: row["created_at"]),
+        "next_cursor": conversations[0]["created_at"] if len(conversations) == limit else None,
+    }
+
 
 class SupabaseMemory:
+    # False quando o banco não tem as chaves estrangeiras para o select aninhado
+    _embedded_history = True
+
     def __init__(self, url: str, key: str):
-        self.client: Client = create_client(url, key)
+        self.client: Client = get_supabase_client(url, key)
+        # Gravações saem do caminho da resposta: os IDs são gerados aqui e as linhas gravadas em segundo plano
+        self.writer = get_write_queue(url, key)
+        # Contadores por thread: a instância é compartilhada pelas sessões do processo
+        self._local = threading.local()
+
+    @property
+    def round_trips(self) -> dict:
+        """Requisições ao banco da execução atual: síncronas (no caminho da resposta) e gravações enfileiradas."""
+        if not hasattr(self._local, "counts"):
+            self._local.counts = {"sync": 0, "queued": 0}
+        return self._local.counts
+
+    def _execute(self, query):
+        self.round_trips["sync"] += 1
+        return query.execute()
+
+    def _queue_insert(self, table: str, row: dict):
+        self.round_trips["queued"] += 1
+        # Marcadores: as leituras da sessão, do usuário ou da própria linha esperam esta gravação
+        tags = [row[column] for column in ("id", "session_id", "user_id") if row.get(column)]
+        self.writer.insert(table, row, tags)
+
+    def _queue_update(self, table: str, row_id: str, values: dict, session_id: str | None = None):
+        self.round_trips["queued"] += 1
+        self.writer.update(table, row_id, values, [tag for tag in (row_id, session_id) if tag])
+
+    def round_trip_count(self) -> dict:
+        return dict(self.round_trips)
+
+    def ping(self):
+        """Verificação de saúde: consulta mínima (levanta exceção se o banco estiver inacessível)."""
+        self.client.table("sessions").select("id").limit(1).execute()
 
     def create_session(self, dataset_name: str, dataset_hash: str, user_id: str) -> str:
-        response = self.client.table("sessions").insert({
+        session_id = str(uuid.uuid4())
+        self._queue_insert("sessions", {
+            "id": session_id,
             "dataset_name": dataset_name,
             "dataset_hash": dataset_hash,
             "user_id": user_id
-        }).execute()
-        return response.data[0]['id']
+        })
+        return session_id
+
+    def store_chart(self, fig_json: str) -> str:
+        """Grava o gráfico comprimido (uma vez por conteúdo) e retorna o `chart_id`."""
+        chart_id, payload = compress_chart(fig_json)
+        if chart_id not in _stored_charts:
+            self._queue_insert("charts", {
+                "id": chart_id,
+                "payload": encode_payload(payload),
+                "size_bytes": len(fig_json)
+            })
+        return chart_id
+
+    def get_chart(self, chart_id: str) -> str | None:
+        """JSON da figura, buscado apenas quando o gráfico for exibido."""
+        self.writer.flush([chart_id])
+        rows = self._execute(self.client.table("charts").select("payload").eq("id", chart_id).limit(1)).data
+        return decompress_chart(decode_payload(rows[0]["payload"])) if rows else None
 
-    def log_conversation(self, session_id: str, question: str, answer: str, chart_json: dict | None = None) -> str:
+    def log_conversation(self, session_id: str, question: str, answer: str, chart_id: str | None = None) -> str:
+        conversation_id = str(uuid.uuid4())
         payload = {
+            "id": conversation_id,
             "session_id": session_id,
             "question": question,
             "answer": answer,
-            "chart_json": chart_json if chart_json is not None else None
+            "chart_id": chart_id
         }
-        response = self.client.table("conversations").insert(payload).execute()
-        return response.data[0]['id']
+        self._queue_insert("conversations", payload)
+        remember_conversation(session_id, conversation_id)
+        return conversation_id
+
+    def update_conversation(self, conversation_id: str, answer: str, chart_id: str | None = None,
+                            session_id: str | None = None):
+        self._queue_update("conversations", conversation_id, {
+            "answer": answer,
+            "chart_id": chart_id
+        }, session_id)
+
+    def _resolve_conversation(self, session_id: str, conversation_id: str | None, question: str, answer: str) -> str:
+        """Garante que temos pelo menos um ID de conversa válido."""
+        def find_latest():
+            self.writer.flush([session_id])
+            rows = self._execute(self.client.table("conversations").select("id").eq("session_id", session_id).order(
+                "created_at", desc=True).limit(1)).data
+            return rows[0]["id"] if rows else None
+
+        return resolve_conversation(session_id, conversation_id, find_latest,
+                                    lambda: self.log_conversation(session_id, question, answer))
 
     def store_analysis(self, session_id: str, conversation_id: str | None, analysis_type: str, results: dict):
-        # Garante que temos pelo menos um ID de conversa válido
-        if not conversation_id:
-            # Se não houver conversation_id, cria uma entrada na tabela de conversas
-            conversation = self.client.table("conversations").select("id").eq("session_id", session_id).order("created_at", desc=True).limit(1).execute()
-            if conversation.data:
-                conversation_id = conversation.data[0]['id']
-            else:
-                # Se não houver conversa, cria uma vazia
-                conversation = self.client.table("conversations").insert({
-                    "session_id": session_id,
-                    "question": "Análise automática",
-                    "answer": "Análise gerada pelo sistema"
-                }).execute()
-                conversation_id = conversation.data[0]['id']
-                
-        self.client.table("analyses").insert({
+        conversation_id = self._resolve_conversation(
+            session_id, conversation_id, "Análise automática", "Análise gerada pelo sistema")
+        self._queue_insert("analyses", {
             "session_id": session_id,
             "conversation_id": conversation_id,
             "analysis_type": analysis_type,
             "results": results
-        }).execute()
+        })
 
     def store_conclusion(self, session_id: str, conversation_id: str | None, conclusion_text: str,
                          confidence_score: float | None = None):
-        # Garante que temos pelo menos um ID de conversa válido
-        if not conversation_id:
-            # Se não houver conversation_id, tenta obter o mais recente
-            conversation = self.client.table("conversations").select("id").eq("session_id", session_id).order("created_at", desc=True).limit(1).execute()
-            if conversation.data:
-                conversation_id = conversation.data[0]['id']
-            else:
-                # Se não houver conversa, cria uma vazia
-                conversation = self.client.table("conversations").insert({
-                    "session_id": session_id,
-                    "question": "Conclusão automática",
-                    "answer": "Conclusão gerada pelo sistema"
-                }).execute()
-                conversation_id = conversation.data[0]['id']
-                
-        self.client.table("conclusions").insert({
+        conversation_id = self._resolve_conversation(
+            session_id, conversation_id, "Conclusão automática", "Conclusão gerada pelo sistema")
+        self._queue_insert("conclusions", {
             "session_id": session_id,
             "conversation_id": conversation_id,
             "conclusion_text": conclusion_text,
             "confidence_score": confidence_score
-        }).execute()
+        })
 
     def store_generated_code(self, session_id: str, conversation_id: str, code_type: str, python_code: str,
                              description: str | None):
@@ -76,26 +379,24 @@ class SupabaseMemory:
         if len(python_code) > 5000:
             python_code = python_code[:5000] + "\n\n# ... (código truncado para evitar timeout no banco de dados)"
 
-        try:
-            self.client.table("generated_codes").insert({
-                "session_id": session_id,
-                "conversation_id": conversation_id,
-                "code_type": code_type,
-                "python_code": python_code,
-                "description": description
-            }).execute()
-        except Exception as e:
-            # Em caso de erro no banco, não propagar a exceção para não interromper o fluxo principal
-            print(f"Erro ao salvar código gerado no banco: {e}")
-            # Não relançar a exceção para não interromper o usuário
+        # Erros de gravação são tratados (e registrados) pela fila, sem interromper o usuário
+        self._queue_insert("generated_codes", {
+            "session_id": session_id,
+            "conversation_id": conversation_id,
+            "code_type": code_type,
+            "python_code": python_code,
+            "description": description
+        })
 
     def get_session_history(self, session_id: str) -> dict:
-        conversations = self.client.table("conversations").select("*").eq("session_id", session_id).order(
-            "created_at").execute().data
-        analyses = self.client.table("analyses").select("*").eq("session_id", session_id).order(
-            "created_at").execute().data
-        conclusions = self.client.table("conclusions").select("*").eq("session_id", session_id).order(
-            "created_at").execute().data
+        # Leituras enxergam as gravações ainda na fila
+        self.writer.flush([session_id])
+        conversations = self._execute(self.client.table("conversations").select("*").eq("session_id", session_id).order(
+            "created_at")).data
+        analyses = self._execute(self.client.table("analyses").select("*").eq("session_id", session_id).order(
+            "created_at")).data
+        conclusions = self._execute(self.client.table("conclusions").select("*").eq("session_id", session_id).order(
+            "created_at")).data
 
         return {
             "conversations": conversations,
@@ -103,11 +404,71 @@ class SupabaseMemory:
             "conclusions": conclusions
         }
 
-    def get_user_sessions(self, user_id: str):
-        return self.client.table("sessions").select("id, created_at, dataset_name").eq("user_id", user_id).order(
-            "created_at", desc=True).execute().data
+    def _conversations_query(self, columns: str, session_id: str, before: str | None, limit: int):
+        query = self.client.table("conversations").select(columns).eq("session_id", session_id)
+        if before:
+            query = query.lt("created_at", before)
+        return query.order("created_at", desc=True).limit(limit)
+
+    def get_history_page(self, session_id: str, before: str | None = None, limit: int = HISTORY_PAGE_SIZE) -> dict:
+        """
+        Página do histórico (conversas mais recentes antes de `before`) com as análises e
+        conclusões dessas conversas, sem os gráficos (ver get_chart).
+        Uma única requisição (select aninhado) ou, sem as chaves estrangeiras, duas: as
+        conversas e, em paralelo, as análises e conclusões.
+        """
+        self.writer.flush([session_id])
+        page = None
+        if SupabaseMemory._embedded_history:
+            try:
+                rows = self._execute(self._conversations_query(
+                    f"{CONVERSATION_COLUMNS}, analyses({ANALYSIS_COLUMNS}), conclusions({CONCLUSION_COLUMNS})",
+                    session_id, before, limit
+                )).data
+                analyses = [analysis for row in rows for analysis in row.pop("analyses") or []]
+                conclusions = [conclusion for row in rows for conclusion in row.pop("conclusions") or []]
+                page = _history_page(rows, analyses, conclusions, limit)
+            except Exception as e:
+                # Só a falta das chaves estrangeiras desliga o select aninhado; outros erros valem para esta chamada
+                if _is_missing_relationship(e):
+                    print(f"Select aninhado indisponível, buscando o histórico em paralelo: {e}")
+                    SupabaseMemory._embedded_history = False
+                else:
+                    print(f"Erro no select aninhado, buscando o histórico em paralelo: {e}")
+
+        if page is None:
+            conversations = self._execute(self._conversations_query(CONVERSATION_COLUMNS, session_id, before, limit)).data
+            ids = [row["id"] for row in conversations]
+            if not ids:
+                return _history_page([], [], [], limit)
+            # Contadores são por thread: as duas consultas paralelas são contadas aqui, na thread da execução
+            self.round_trips["sync"] += 2
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                analyses = executor.submit(lambda: self.client.table("analyses").select(ANALYSIS_COLUMNS)
+                                           .in_("conversation_id", ids).execute().data)
+                conclusions = executor.submit(lambda: self.client.table("conclusions").select(CONCLUSION_COLUMNS)
+                                              .in_("conversation_id", ids).execute().data)
+                page = _history_page(conversations, analyses.result(), conclusions.result(), limit)
+
+        # A conversa mais recente passa a ser a ativa (sem consulta extra em store_analysis)
+        if before is None and page["conversations"]:
+            remember_conversation(session_id, page["conversations"][-1]["id"], replace=False)
+        return page
+
+    def get_user_sessions(self, user_id: str, limit: int | None = None):
+        self.writer.flush([user_id])
+        query = self.client.table("sessions").select("id, created_at, dataset_name").eq("user_id", user_id).order(
+            "created_at", desc=True)
+        return self._execute(query.limit(limit) if limit else query).data
+
+    def find_sessions_by_dataset(self, dataset_hash: str, user_id: str, limit: int = 5) -> list:
+        """Sessões mais recentes do usuário com o mesmo conteúdo de dataset."""
+        self.writer.flush([user_id])
+        return self._execute(self.client.table("sessions").select("id, created_at").eq("dataset_hash", dataset_hash).eq(
+            "user_id", user_id).order("created_at", desc=True).limit(limit)).data
 
     def get_generated_codes(self, session_id: str):
-        return self.client.table("generated_codes").select(
+        self.writer.flush([session_id])
+        return self._execute(self.client.table("generated_codes").select(
             "id, created_at, code_type, python_code, description, conversation_id"
-        ).eq("session_id", session_id).order("created_at", desc=True).execute().data
\ No newline at end of file
+        ).eq("session_id", session_id).order("created_at", desc=True)).data
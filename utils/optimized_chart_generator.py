@@ -0,0 +1,283 @@
+"""
+Motor de templates de gráficos.
+Construtores parametrizados e vetorizados (barras por categoria, série temporal,
+dispersão, box plot por grupo e pizza) que recebem colunas já resolvidas e
+retornam um go.Figure, evitando a chamada ao LLM para pedidos comuns.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils.aggregated_charts import box_statistics, aggregated_box_trace
+from utils.column_index import get_column_index
+from utils.dataset_cache import get_or_compute
+from utils.category_counts import get_factorized_codes, top_k_frequent
+from utils.intent import detect_intents
+
+DEFAULT_TOP_N = 20
+PIE_TOP_N = 8
+BOX_TOP_GROUPS = 10
+SCATTER_TOP_GROUPS = 10
+MAX_SCATTER_POINTS = 50_000
+# Máximo de períodos em uma série temporal (a frequência é escolhida para caber nele)
+MAX_TIME_POINTS = 1_000
+# Fração mínima de valores convertidos para considerar uma coluna de texto como data
+DATETIME_PARSE_RATIO = 0.9
+
+AGG_LABELS = {"sum": "Soma", "mean": "Média", "count": "Contagem"}
+# Frequências candidatas (da mais fina para a mais grossa) e sua duração aproximada em segundos.
+# Aliases do pandas >= 2.2 ('h', 'YS'; os antigos 'H' e 'AS' foram removidos no pandas 3)
+TIME_FREQUENCIES = [
+    ('s', 1), ('min', 60), ('h', 3_600), ('D', 86_400), ('W', 604_800),
+    ('MS', 2_629_746), ('QS', 7_889_238), ('YS', 31_556_952),
+]
+CHART_INTENTS = ("chart_bar", "chart_time_series", "chart_scatter", "chart_grouped_box", "chart_pie")
+
+
+# --- Auxiliares vetorizados (reaproveitam os artefatos em cache do dataset) ---
+
+def get_datetime_values(df: pd.DataFrame, col: str):
+    """Coluna convertida para datetime (em cache) ou None se ela não parecer conter datas."""
+    def parse():
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            return None
+        non_null = series.dropna()
+        if non_null.empty:
+            return None
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            # Testa uma amostra antes de converter a coluna inteira
+            sample = pd.to_datetime(non_null.iloc[:1_000], errors='coerce')
+            if sample.notna().mean() < DATETIME_PARSE_RATIO:
+                return None
+            parsed = pd.to_datetime(series, errors='coerce')
+        return parsed if parsed.notna().sum() >= DATETIME_PARSE_RATIO * len(non_null) else None
+
+    return get_or_compute(df, ("datetime_values", col), parse)
+
+
+def grouped_aggregate(df: pd.DataFrame, category: str, value: str | None = None, agg: str = "sum") -> pd.Series:
+    """Agregação por categoria com bincount sobre os códigos fatorizados (ordenada decrescente)."""
+    def compute():
+        codes, uniques = get_factorized_codes(df, category)
+        valid = codes >= 0
+        if value is None or agg == "count":
+            result = np.bincount(codes[valid], minlength=len(uniques)).astype(np.float64)
+        else:
+            values = pd.to_numeric(df[value], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            valid &= np.isfinite(values)
+            sums = np.bincount(codes[valid], weights=values[valid], minlength=len(uniques))
+            if agg == "mean":
+                counts = np.bincount(codes[valid], minlength=len(uniques))
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = sums / counts
+            else:
+                result = sums
+        series = pd.Series(result, index=pd.Index(uniques, name=category), name=value or "Contagem")
+        return series.dropna().sort_values(ascending=False, kind='stable')
+
+    return get_or_compute(df, ("grouped_aggregate", category, value, agg), compute)
+
+
+def _choose_frequency(dates: pd.Series) -> str:
+    span = (dates.max() - dates.min()).total_seconds()
+    for freq, seconds in TIME_FREQUENCIES:
+        if span / seconds <= MAX_TIME_POINTS:
+            return freq
+    return TIME_FREQUENCIES[-1][0]
+
+
+# --- Construtores de gráficos ---
+
+def bar_by_category(df: pd.DataFrame, category: str, value: str | None = None, agg: str = "sum",
+                    top_n: int = DEFAULT_TOP_N) -> go.Figure:
+    """Barras com a contagem (ou soma/média de `value`) das `top_n` maiores categorias."""
+    if value is None or agg == "count":
+        top = top_k_frequent(df, category, top_n)
+        labels, heights = top['Valor'].astype(str), top['Contagem']
+        title, y_title = f'Contagem por {category}', 'Contagem'
+    else:
+        top = grouped_aggregate(df, category, value, agg).iloc[:top_n]
+        labels, heights = top.index.astype(str), top.to_numpy()
+        title, y_title = f'{AGG_LABELS[agg]} de {value} por {category}', f'{AGG_LABELS[agg]} de {value}'
+
+    fig = go.Figure(go.Bar(x=labels, y=heights, text=heights, texttemplate='%{text:.4s}',
+                           textposition='outside', marker_color='#1f77b4'))
+    fig.update_layout(title=title, xaxis_title=category, yaxis_title=y_title, height=500)
+    return fig
+
+
+def time_series(df: pd.DataFrame, date_col: str, value_cols: list | None = None, agg: str = "mean",
+                freq: str | None = None) -> go.Figure:
+    """Série temporal reamostrada em até MAX_TIME_POINTS períodos (contagem se não houver valores)."""
+    dates = get_datetime_values(df, date_col)
+    if dates is None:
+        raise ValueError(f"A coluna '{date_col}' não contém datas reconhecíveis.")
+    value_cols = list(value_cols or [])
+    # Valores posicionais: o índice original das colunas não deve ser alinhado com as datas
+    frame = pd.DataFrame({col: pd.to_numeric(df[col], errors='coerce').to_numpy() for col in value_cols},
+                         index=pd.DatetimeIndex(dates.to_numpy()))
+    frame = frame[frame.index.notna()]
+    # Sem colunas de valor o frame é "vazio" mesmo com datas: checa as linhas
+    if not len(frame.index):
+        raise ValueError(f"A coluna '{date_col}' não possui datas válidas.")
+    freq = freq or _choose_frequency(frame.index.to_series())
+
+    resampled = frame.resample(freq)
+    sizes = resampled.size()
+    fig = go.Figure()
+    if not value_cols:
+        counts = sizes[sizes > 0]
+        fig.add_trace(go.Scatter(x=counts.index, y=counts.to_numpy(), mode='lines', name='Registros'))
+        y_title = 'Registros'
+    else:
+        aggregated = resampled.sum() if agg == "sum" else resampled.mean()
+        aggregated = aggregated[sizes > 0]
+        for col in value_cols:
+            fig.add_trace(go.Scatter(x=aggregated.index, y=aggregated[col].to_numpy(), mode='lines', name=col))
+        y_title = AGG_LABELS.get(agg, agg) if len(value_cols) > 1 else f'{AGG_LABELS.get(agg, agg)} de {value_cols[0]}'
+
+    label = ', '.join(value_cols) if value_cols else 'Registros'
+    fig.update_layout(title=f'Evolução de {label} ao longo de {date_col}', xaxis_title=date_col,
+                      yaxis_title=y_title, height=500, hovermode='x unified')
+    return fig
+
+
+def scatter(df: pd.DataFrame, x: str, y: str, color: str | None = None,
+            max_points: int = MAX_SCATTER_POINTS) -> go.Figure:
+    """Dispersão em WebGL com amostra determinística limitada a `max_points` pontos."""
+    x_values = pd.to_numeric(df[x], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    y_values = pd.to_numeric(df[y], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    rows = np.flatnonzero(np.isfinite(x_values) & np.isfinite(y_values))
+    total = len(rows)
+    if total > max_points:
+        rows = np.sort(np.random.default_rng(0).choice(rows, size=max_points, replace=False))
+
+    fig = go.Figure()
+    if color is None:
+        fig.add_trace(go.Scattergl(x=x_values[rows], y=y_values[rows], mode='markers', name=f'{y} x {x}',
+                                   marker=dict(size=5, opacity=0.6)))
+    else:
+        codes, uniques = get_factorized_codes(df, color)
+        groups = grouped_aggregate(df, color, None, "count").index[:SCATTER_TOP_GROUPS]
+        group_codes = pd.Index(uniques).get_indexer(groups)
+        sample_codes = codes[rows]
+        for group, code in zip(groups, group_codes):
+            selected = rows[sample_codes == code]
+            fig.add_trace(go.Scattergl(x=x_values[selected], y=y_values[selected], mode='markers', name=str(group),
+                                       marker=dict(size=5, opacity=0.6)))
+        others = rows[~np.isin(sample_codes, group_codes)]
+        if len(others):
+            fig.add_trace(go.Scattergl(x=x_values[others], y=y_values[others], mode='markers', name='Outros',
+                                       marker=dict(size=5, opacity=0.4, color='#bbbbbb')))
+
+    title = f'{y} x {x}'
+    if total > max_points:
+        title += f' (amostra de {max_points:,} de {total:,} pontos)'
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y, height=500)
+    return fig
+
+
+def grouped_box(df: pd.DataFrame, value: str, group: str, top_n: int = BOX_TOP_GROUPS) -> go.Figure:
+    """Box plots pré-agregados de `value` para os `top_n` grupos mais frequentes."""
+    codes, uniques = get_factorized_codes(df, group)
+    groups = grouped_aggregate(df, group, None, "count").index[:top_n]
+    values = pd.to_numeric(df[value], errors='coerce')
+
+    fig = go.Figure()
+    for name, code in zip(groups, pd.Index(uniques).get_indexer(groups)):
+        stats = box_statistics(values[codes == code], max_outlier_points=0)
+        fig.add_trace(aggregated_box_trace(values, name=str(name), stats=stats))
+    fig.update_layout(title=f'Distribuição de {value} por {group}', xaxis_title=group, yaxis_title=value,
+                      showlegend=False, height=500)
+    return fig
+
+
+def pie(df: pd.DataFrame, category: str, value: str | None = None, top_n: int = PIE_TOP_N) -> go.Figure:
+    """Pizza com as `top_n` maiores categorias e o restante agrupado em 'Outros'."""
+    totals = grouped_aggregate(df, category, value, "sum" if value else "count")
+    top = totals.iloc[:top_n]
+    labels, values = list(top.index.astype(str)), list(top.to_numpy())
+    remainder = totals.iloc[top_n:].sum()
+    if remainder > 0:
+        labels.append('Outros')
+        values.append(remainder)
+
+    fig = go.Figure(go.Pie(labels=labels, values=values, hole=0.3, textinfo='percent+label'))
+    title = f'Participação de {value} por {category}' if value else f'Proporção por {category}'
+    fig.update_layout(title=title, height=500)
+    return fig
+
+
+CHART_BUILDERS = {
+    "bar_by_category": bar_by_category,
+    "time_series": time_series,
+    "scatter": scatter,
+    "grouped_box": grouped_box,
+    "pie": pie,
+}
+
+
+# --- Planejamento: pergunta -> construtor + parâmetros ---
+
+def plan_chart(df: pd.DataFrame, question: str) -> dict | None:
+    """
+    Escolhe o construtor e os parâmetros a partir das intenções e colunas da pergunta.
+    Só há plano quando um tipo de gráfico foi pedido explicitamente: as demais perguntas
+    seguem para as visualizações estatísticas ou para o LLM.
+
+    Returns:
+        {"builder": nome, "kwargs": parâmetros} ou None.
+    """
+    column_index = get_column_index(df)
+    detection = detect_intents(question, column_index)
+    intents = detection["intents"]
+    if not any(intent in intents for intent in CHART_INTENTS):
+        return None
+    mentioned = detection["columns"]
+
+    datetime_cols = [col for col in mentioned
+                     if col not in column_index.numeric_columns and get_datetime_values(df, col) is not None]
+    numeric = [col for col in mentioned if col in column_index.numeric_columns]
+    categorical = [col for col in mentioned if col in column_index.categorical_columns and col not in datetime_cols]
+    if "chart_time_series" in intents and not datetime_cols and column_index.datetime_columns:
+        datetime_cols = column_index.datetime_columns[:1]
+
+    agg = "mean" if "agg_mean" in intents else "sum"
+    # Pedidos de contagem/frequência ignoram as colunas numéricas citadas
+    if "frequency" in intents and "agg_mean" not in intents and "agg_sum" not in intents:
+        numeric = []
+
+    def plan(builder, **kwargs):
+        return {"builder": builder, "kwargs": kwargs}
+
+    if "chart_pie" in intents and categorical:
+        return plan("pie", category=categorical[0], value=numeric[0] if numeric else None)
+    if "chart_time_series" in intents and datetime_cols:
+        return plan("time_series", date_col=datetime_cols[0], value_cols=numeric[:3],
+                    agg="sum" if "agg_sum" in intents else "mean")
+    # Box plot de outliers fica com a visualização estatística
+    if "chart_grouped_box" in intents and "outliers" not in intents and numeric and categorical:
+        return plan("grouped_box", value=numeric[0], group=categorical[0])
+    if "chart_scatter" in intents and len(numeric) >= 2:
+        return plan("scatter", x=numeric[0], y=numeric[1], color=categorical[0] if categorical else None)
+    if "chart_bar" in intents and categorical:
+        return plan("bar_by_category", category=categorical[0], value=numeric[0] if numeric else None, agg=agg)
+    return None
+
+
+def generate_chart_code(chart_plan: dict) -> str:
+    """Código curto (e reexecutável/cacheável) que chama o construtor planejado."""
+    builder = chart_plan["builder"]
+    arguments = ", ".join(f"{name}={value!r}" for name, value in chart_plan["kwargs"].items())
+    return f"""
+from utils.optimized_chart_generator import {builder}
+
+# Gráfico gerado pelo motor de templates (sem LLM)
+fig = {builder}(df, {arguments})
+"""
@@ -15,6 +15,8 @@ import re
 import tempfile
 import os
 
+from utils.intent import detect_intents
+
 def extract_markdown_tables(text):
     """
     Extrai tabelas Markdown do texto e retorna lista de tabelas.
@@ -287,7 +289,7 @@ def create_pdf_report(messages, dataset_name, participant_name="Alberto Côrtes
     <b>2. DataAnalystAgent (Analista de Dados):</b><br/>
     • Executa análises estatísticas descritivas automaticamente<br/>
     • Gera tabelas reais usando Pandas: describe(), corr(), outliers (IQR), value_counts()<br/>
-    • Converte DataFrames para formato Markdown para visualização<br/>
+    • Mantém as tabelas como DataFrames estruturados (Markdown/PDF gerados sob demanda)<br/>
     • Calcula métricas: médias, medianas, desvios, correlações, p-values<br/>
     • Detecta outliers usando método IQR (Q1-1.5*IQR, Q3+1.5*IQR)<br/><br/>
     
@@ -413,6 +415,14 @@ def create_pdf_report(messages, dataset_name, participant_name="Alberto Côrtes
                         content_clean = content_clean[:2000] + "... [conteúdo truncado]"
                     elements.append(Paragraph(content_clean, assistant_style))
                 
+                # Tabelas estruturadas da análise (geradas direto dos DataFrames, sem re-parse)
+                for analysis_table in message.get("tables") or []:
+                    elements.append(Paragraph(f"<b>{analysis_table.title}:</b>", info_style))
+                    reportlab_table = create_reportlab_table(analysis_table.to_table_data())
+                    if reportlab_table:
+                        elements.append(reportlab_table)
+                        elements.append(Spacer(1, 0.3*cm))
+                
                 # Adicionar gráfico se existir
                 chart_fig = message.get("chart_fig")
                 if chart_fig:
@@ -453,8 +463,7 @@ def create_pdf_report(messages, dataset_name, participant_name="Alberto Côrtes
     
     for idx, message in enumerate(messages):
         if message.get("role") == "user":
-            content_lower = message.get("content", "").lower()
-            if any(word in content_lower for word in ['conclus', 'insight', 'recomend', 'sugest', 'negócio', 'ações', 'estratégia']):
+            if "conclusion" in detect_intents(message.get("content", ""))["intents"]:
                 has_conclusion_question = True
                 conclusion_q_idx = idx
                 break
@@ -0,0 +1,76 @@
+"""
+Serviços compartilhados pelo processo.
+A memória (Supabase ou SQLite) e o monitor de saúde são criados uma única vez por
+processo (st.cache_resource), e não a cada reexecução do script: cliques, mensagens
+e sugestões reaproveitam o mesmo cliente e suas conexões abertas.
+"""
+import threading
+import time
+
+import streamlit as st
+
+from utils.memory import SupabaseMemory
+from utils.sqlite_memory import SQLiteMemory
+
+# Intervalo entre verificações de saúde do banco (segundos)
+HEALTH_CHECK_INTERVAL = 60
+
+
+class HealthMonitor:
+    """Verifica o banco periodicamente em segundo plano; o script apenas lê o último estado."""
+
+    def __init__(self, memory, interval: float = HEALTH_CHECK_INTERVAL):
+        self.memory = memory
+        self.interval = interval
+        self.status = {"ok": None, "latency_ms": None, "checked_at": None, "error": None}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-health-check", daemon=True)
+        self._thread.start()
+
+    def check(self) -> dict:
+        start = time.perf_counter()
+        try:
+            self.memory.ping()
+            error = None
+        except Exception as e:
+            error = str(e)
+            print(f"Verificação de saúde do banco falhou: {e}")
+        self.status = {
+            "ok": error is None,
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "checked_at": time.time(),
+            "error": error,
+        }
+        return self.status
+
+    def _run(self):
+        while True:
+            self.check()
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+
+@st.cache_resource(show_spinner=False)
+def get_memory_service(supabase_url: str, supabase_key: str):
+    """Memória do processo: Supabase quando configurado, senão SQLite local (None se nenhuma disponível)."""
+    if supabase_url and supabase_key:
+        try:
+            return SupabaseMemory(url=supabase_url, key=supabase_key)
+        except Exception as e:
+            print(f"Supabase indisponível, usando memória local: {e}")
+    # Sem Supabase, o histórico é persistido localmente em SQLite
+    try:
+        return SQLiteMemory()
+    except Exception as e:
+        # Memória opcional - memória da sessão continua funcionando
+        print(f"Memória local indisponível: {e}")
+        return None
+
+
+@st.cache_resource(show_spinner=False)
+def get_health_monitor(supabase_url: str, supabase_key: str) -> HealthMonitor | None:
+    memory = get_memory_service(supabase_url, supabase_key)
+    return HealthMonitor(memory) if memory is not None else None
@@ -0,0 +1,73 @@
+"""
+Lista de sessões do usuário para a sidebar.
+Cacheada por usuário com TTL (a sidebar é redesenhada a cada reexecução do script)
+e invalidada por quem cria a sessão (app.py). As datas são formatadas uma única
+vez, na consulta.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Validade da lista em cache (segundos) e sessões mais recentes consultadas
+SESSION_LIST_TTL = 300
+SESSION_LIST_LIMIT = 200
+# Usuários com lista em cache (o user_id é novo a cada sessão do navegador)
+MAX_CACHED_USERS = 500
+
+_session_lists = OrderedDict()
+_lock = threading.Lock()
+# Incrementado a cada invalidação: listas consultadas durante uma invalidação não entram no cache
+_generation = 0
+
+
+def format_session(session: dict) -> str:
+    """Linha da sessão na sidebar, com a data no fuso horário local."""
+    created_at = datetime.fromisoformat(session['created_at'].replace('Z', '+00:00'))
+    if created_at.tzinfo is None:
+        # Sem timezone: assume UTC
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    local_time = created_at.astimezone()
+    offset = local_time.strftime('%z')
+    return (f"ID: ...{session['id'][-6:]} · {session['dataset_name']} · "
+            f"{local_time.strftime('%d/%m/%Y %H:%M')} (UTC{offset[:3]}:{offset[3:5]})")
+
+
+def get_session_list(memory, user_id: str) -> list:
+    """Sessões do usuário já formatadas (mais recentes primeiro), do cache enquanto válido."""
+    now = time.monotonic()
+    with _lock:
+        entry = _session_lists.get(user_id)
+        if entry is not None and entry[0] > now:
+            _session_lists.move_to_end(user_id)
+            return entry[1]
+        generation = _generation
+
+    sessions = []
+    for session in memory.get_user_sessions(user_id, limit=SESSION_LIST_LIMIT):
+        try:
+            sessions.append(format_session(session))
+        except Exception as e:
+            print(f"Erro ao formatar sessão: {e}")
+    with _lock:
+        if generation == _generation:
+            _session_lists[user_id] = (now + SESSION_LIST_TTL, sessions)
+            _session_lists.move_to_end(user_id)
+        _prune(now)
+    return sessions
+
+
+def _prune(now: float):
+    """Remove as listas expiradas e as menos usadas além de MAX_CACHED_USERS (chamado com a trava)."""
+    for user_id in [user_id for user_id, (expires, _) in _session_lists.items() if expires <= now]:
+        del _session_lists[user_id]
+    while len(_session_lists) > MAX_CACHED_USERS:
+        _session_lists.popitem(last=False)
+
+
+def invalidate_session_list(user_id: str):
+    """Descarta a lista do usuário; chamado após criar uma sessão."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _session_lists.pop(user_id, None)
@@ -0,0 +1,84 @@
+"""
+Reaproveitamento entre sessões de um mesmo dataset.
+No upload, sessões anteriores do usuário com o mesmo hash de arquivo são
+localizadas e seus artefatos persistidos (análises, respostas e gráficos) aquecem
+os caches: um dataset recorrente começa sem recomputar o que já foi calculado.
+"""
+from utils.analysis_results import AnalysisResult
+from utils.answer_cache import is_standalone_question, put_answer
+from utils.chart_cache import seed_chart_result, warm_chart_cache
+from utils.code_executor import figure_from_json
+from utils.column_index import get_column_index
+
+# Sessões anteriores consultadas e gráficos trazidos do banco no upload
+WARM_SESSION_LIMIT = 3
+STORED_CHART_LIMIT = 20
+# Conversas criadas pelo sistema (não são perguntas do usuário)
+SYSTEM_QUESTIONS = {"Análise automática", "Conclusão automática"}
+
+
+def _group_by_conversation(rows: list) -> dict:
+    grouped = {}
+    for row in rows:
+        if row.get("conversation_id"):
+            grouped.setdefault(row["conversation_id"], []).append(row)
+    return grouped
+
+
+def warm_from_previous_sessions(memory, dataset_hash: str, df, user_id: str, session_id=None) -> dict:
+    """
+    Aquece os caches com os artefatos de sessões anteriores do usuário com o mesmo dataset.
+
+    Só são reaproveitadas respostas bem-sucedidas: com análise ou gráfico associado e
+    sem código que não tenha produzido gráfico (erros e código do CodeGeneratorAgent).
+
+    Returns:
+        {"sessions", "answers", "charts", "analyses" (lista de AnalysisResult)}
+    """
+    summary = {"sessions": 0, "answers": 0, "charts": warm_chart_cache(df, session_id), "analyses": []}
+    if memory is None:
+        return summary
+
+    column_index = get_column_index(df)
+    previous = [session for session in memory.find_sessions_by_dataset(dataset_hash, user_id, limit=WARM_SESSION_LIMIT + 1)
+                if session["id"] != session_id][:WARM_SESSION_LIMIT]
+    charts_left = STORED_CHART_LIMIT
+    # Da mais antiga para a mais recente: respostas mais novas prevalecem
+    for session in reversed(previous):
+        page = memory.get_history_page(session["id"])
+        summary["sessions"] += 1
+
+        analyses = _group_by_conversation(page["analyses"])
+        codes = _group_by_conversation(memory.get_generated_codes(session["id"]))
+        for analysis in page["analyses"]:
+            try:
+                summary["analyses"].append(AnalysisResult.from_dict(analysis["results"]))
+            except Exception as e:
+                print(f"Análise persistida ignorada: {e}")
+
+        for conversation in page["conversations"]:
+            question, chart_id = conversation["question"], conversation.get("chart_id")
+            if question in SYSTEM_QUESTIONS or not conversation["answer"]:
+                continue
+            conversation_codes = codes.get(conversation["id"], [])
+            conversation_analyses = analyses.get(conversation["id"], [])
+            # Código sem gráfico é erro de visualização ou saída do CodeGeneratorAgent (depende da execução)
+            if any(code["code_type"] != "visualization" for code in conversation_codes):
+                continue
+            if (conversation_codes and not chart_id) or not (conversation_analyses or chart_id):
+                continue
+            if not is_standalone_question(question, column_index):
+                continue
+
+            tables = [table for analysis in conversation_analyses for table in analysis["results"].get("tables", [])]
+            code = conversation_codes[0]["python_code"] if len(conversation_codes) == 1 else None
+            put_answer(user_id, dataset_hash, question, conversation["answer"], chart_id, tables, code)
+            summary["answers"] += 1
+
+            # Gráfico registrado sob a chave do único código de visualização que o produziu
+            if code and chart_id and charts_left > 0:
+                fig_json = memory.get_chart(chart_id)
+                if fig_json and seed_chart_result(code, df, figure_from_json(fig_json), session_id):
+                    summary["charts"] += 1
+                    charts_left -= 1
+    return summary
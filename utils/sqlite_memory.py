@@ -0,0 +1,308 @@
+"""
+Memória local em SQLite com a mesma interface do SupabaseMemory.
+Usada quando as credenciais do Supabase não estão configuradas: o histórico
+continua persistido (arquivo único em modo WAL, índices por sessão e data) sem
+depender de rede. Também serve de base para medir a camada de memória.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from utils.active_conversations import remember_conversation, resolve_conversation
+from utils.chart_store import compress_chart, decompress_chart
+
+MEMORY_DB_PATH = Path(os.environ.get("MEMORY_DB_PATH", Path(__file__).resolve().parent.parent / ".cache" / "memory.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    dataset_name TEXT,
+    dataset_hash TEXT,
+    user_id TEXT
+);
+CREATE TABLE IF NOT EXISTS charts (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    size_bytes INTEGER
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    question TEXT,
+    answer TEXT,
+    chart_id TEXT REFERENCES charts(id)
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    conversation_id TEXT REFERENCES conversations(id),
+    analysis_type TEXT,
+    results TEXT
+);
+CREATE TABLE IF NOT EXISTS conclusions (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    conversation_id TEXT REFERENCES conversations(id),
+    conclusion_text TEXT,
+    confidence_score REAL
+);
+CREATE TABLE IF NOT EXISTS generated_codes (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    conversation_id TEXT REFERENCES conversations(id),
+    code_type TEXT,
+    python_code TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_dataset ON sessions(user_id, dataset_hash, created_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_session ON conversations(session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_session ON analyses(session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_conclusions_session ON conclusions(session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_generated_codes_session ON generated_codes(session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_conversation ON analyses(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_conclusions_conversation ON conclusions(conversation_id);
+"""
+# Conversas por página do histórico
+HISTORY_PAGE_SIZE = 50
+# Colunas guardadas como JSON (jsonb no Supabase)
+JSON_COLUMNS = {"results"}
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _get_connection(path: Path):
+    """Conexão compartilhada por arquivo (as threads do Streamlit usam a mesma, com trava)."""
+    with _connections_lock:
+        entry = _connections.get(path)
+        if entry is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.executescript(SCHEMA)
+            # Bancos criados antes da tabela de gráficos
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(conversations)")}
+            if "chart_id" not in columns:
+                connection.execute("ALTER TABLE conversations ADD COLUMN chart_id TEXT REFERENCES charts(id)")
+            entry = (connection, threading.Lock())
+            _connections[path] = entry
+        return entry
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _row_to_dict(row) -> dict:
+    item = dict(row)
+    for column in JSON_COLUMNS & item.keys():
+        if item[column] is not None:
+            item[column] = json.loads(item[column])
+    return item
+
+
+class SQLiteMemory:
+    def __init__(self, path: Path | str = MEMORY_DB_PATH):
+        self.path = Path(path)
+        self.connection, self.lock = _get_connection(self.path)
+        # Contadores por thread: a instância é compartilhada pelas sessões do processo
+        self._local = threading.local()
+
+    @property
+    def round_trips(self) -> dict:
+        """Comandos executados no banco na execução atual (todos síncronos; não há fila de gravação)."""
+        if not hasattr(self._local, "counts"):
+            self._local.counts = {"sync": 0, "queued": 0}
+        return self._local.counts
+
+    def _execute(self, query: str, parameters: tuple):
+        self.round_trips["sync"] += 1
+        with self.lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+    def round_trip_count(self) -> dict:
+        return dict(self.round_trips)
+
+    def ping(self):
+        with self.lock:
+            self.connection.execute("SELECT 1").fetchall()
+
+    def _insert(self, table: str, row: dict) -> str:
+        row = {"id": str(uuid.uuid4()), "created_at": _now(), **row}
+        for column in JSON_COLUMNS & row.keys():
+            if row[column] is not None:
+                row[column] = json.dumps(row[column])
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        self._execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(row.values()))
+        return row["id"]
+
+    def _select(self, query: str, parameters: tuple) -> list:
+        return [_row_to_dict(row) for row in self._execute(query, parameters)]
+
+    def create_session(self, dataset_name: str, dataset_hash: str, user_id: str) -> str:
+        session_id = self._insert("sessions", {
+            "dataset_name": dataset_name,
+            "dataset_hash": dataset_hash,
+            "user_id": user_id
+        })
+        return session_id
+
+    def store_chart(self, fig_json: str) -> str:
+        """Grava o gráfico comprimido (uma vez por conteúdo) e retorna o `chart_id`."""
+        chart_id, payload = compress_chart(fig_json)
+        self._execute(
+            "INSERT OR IGNORE INTO charts (id, created_at, payload, size_bytes) VALUES (?, ?, ?, ?)",
+            (chart_id, _now(), payload, len(fig_json))
+        )
+        return chart_id
+
+    def get_chart(self, chart_id: str) -> str | None:
+        """JSON da figura, buscado apenas quando o gráfico for exibido."""
+        rows = self._execute("SELECT payload FROM charts WHERE id = ?", (chart_id,))
+        return decompress_chart(rows[0]["payload"]) if rows else None
+
+    def log_conversation(self, session_id: str, question: str, answer: str, chart_id: str | None = None) -> str:
+        conversation_id = self._insert("conversations", {
+            "session_id": session_id,
+            "question": question,
+            "answer": answer,
+            "chart_id": chart_id
+        })
+        remember_conversation(session_id, conversation_id)
+        return conversation_id
+
+    def update_conversation(self, conversation_id: str, answer: str, chart_id: str | None = None,
+                            session_id: str | None = None):
+        self._execute(
+            "UPDATE conversations SET answer = ?, chart_id = ? WHERE id = ?",
+            (answer, chart_id, conversation_id)
+        )
+
+    def _resolve_conversation(self, session_id: str, conversation_id: str | None, question: str, answer: str) -> str:
+        """Garante que temos pelo menos um ID de conversa válido."""
+        def find_latest():
+            rows = self._select(
+                "SELECT id FROM conversations WHERE session_id = ? ORDER BY created_at DESC LIMIT 1", (session_id,))
+            return rows[0]["id"] if rows else None
+
+        return resolve_conversation(session_id, conversation_id, find_latest,
+                                    lambda: self.log_conversation(session_id, question, answer))
+
+    def store_analysis(self, session_id: str, conversation_id: str | None, analysis_type: str, results: dict):
+        conversation_id = self._resolve_conversation(
+            session_id, conversation_id, "Análise automática", "Análise gerada pelo sistema")
+        self._insert("analyses", {
+            "session_id": session_id,
+            "conversation_id": conversation_id,
+            "analysis_type": analysis_type,
+            "results": results
+        })
+
+    def store_conclusion(self, session_id: str, conversation_id: str | None, conclusion_text: str,
+                         confidence_score: float | None = None):
+        conversation_id = self._resolve_conversation(
+            session_id, conversation_id, "Conclusão automática", "Conclusão gerada pelo sistema")
+        self._insert("conclusions", {
+            "session_id": session_id,
+            "conversation_id": conversation_id,
+            "conclusion_text": conclusion_text,
+            "confidence_score": confidence_score
+        })
+
+    def store_generated_code(self, session_id: str, conversation_id: str, code_type: str, python_code: str,
+                             description: str | None):
+        try:
+            self._insert("generated_codes", {
+                "session_id": session_id,
+                "conversation_id": conversation_id,
+                "code_type": code_type,
+                "python_code": python_code,
+                "description": description
+            })
+        except sqlite3.Error as e:
+            # Em caso de erro no banco, não propagar a exceção para não interromper o fluxo principal
+            print(f"Erro ao salvar código gerado no banco: {e}")
+
+    def get_session_history(self, session_id: str) -> dict:
+        return {
+            table: self._select(f"SELECT * FROM {table} WHERE session_id = ? ORDER BY created_at", (session_id,))
+            for table in ("conversations", "analyses", "conclusions")
+        }
+
+    def get_history_page(self, session_id: str, before: str | None = None, limit: int = HISTORY_PAGE_SIZE) -> dict:
+        """Página do histórico (conversas mais recentes antes de `before`), sem os gráficos."""
+        conversations = self._select(
+            "SELECT id, created_at, question, answer, chart_id FROM conversations WHERE session_id = ? AND created_at < ? "
+            "ORDER BY created_at DESC LIMIT ?", (session_id, before or "\uffff", limit))[::-1]
+        ids = [row["id"] for row in conversations]
+        placeholders = ", ".join("?" for _ in ids)
+        analyses = self._select(
+            f"SELECT id, created_at, conversation_id, analysis_type, results FROM analyses "
+            f"WHERE conversation_id IN ({placeholders}) ORDER BY created_at", tuple(ids)) if ids else []
+        conclusions = self._select(
+            f"SELECT id, created_at, conversation_id, conclusion_text, confidence_score FROM conclusions "
+            f"WHERE conversation_id IN ({placeholders}) ORDER BY created_at", tuple(ids)) if ids else []
+        if before is None and conversations:
+            remember_conversation(session_id, conversations[-1]["id"], replace=False)
+        return {
+            "conversations": conversations,
+            "analyses": analyses,
+            "conclusions": conclusions,
+            "next_cursor": conversations[0]["created_at"] if len(conversations) == limit else None,
+        }
+
+    def get_user_sessions(self, user_id: str, limit: int | None = None):
+        # LIMIT -1: sem limite
+        return self._select(
+            "SELECT id, created_at, dataset_name FROM sessions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+            (user_id, limit or -1))
+
+    def find_sessions_by_dataset(self, dataset_hash: str, user_id: str, limit: int = 5) -> list:
+        """Sessões mais recentes do usuário com o mesmo conteúdo de dataset."""
+        return self._select(
+            "SELECT id, created_at FROM sessions WHERE user_id = ? AND dataset_hash = ? ORDER BY created_at DESC LIMIT ?",
+            (user_id, dataset_hash, limit))
+
+    def get_generated_codes(self, session_id: str):
+        return self._select(
+            "SELECT id, created_at, code_type, python_code, description, conversation_id FROM generated_codes "
+            "WHERE session_id = ? ORDER BY created_at DESC", (session_id,))
+
+
+def benchmark_memory(memory, turns: int = 100) -> dict:
+    """Tempo médio (ms) de cada operação de um turno típico em um backend de memória."""
+    timings = {"create_session": 0.0, "log_conversation": 0.0, "store_analysis": 0.0,
+               "update_conversation": 0.0, "get_session_history": 0.0}
+    started = time.perf_counter()
+    session_id = memory.create_session("benchmark.csv", "benchmark", "benchmark")
+    timings["create_session"] = (time.perf_counter() - started) * 1000
+    for turn in range(turns):
+        started = time.perf_counter()
+        conversation_id = memory.log_conversation(session_id, f"Pergunta {turn}", "")
+        timings["log_conversation"] += (time.perf_counter() - started) * 1000 / turns
+        started = time.perf_counter()
+        memory.store_analysis(session_id, conversation_id, "data_analysis", {"turno": turn})
+        timings["store_analysis"] += (time.perf_counter() - started) * 1000 / turns
+        started = time.perf_counter()
+        memory.update_conversation(conversation_id, f"Resposta {turn}")
+        timings["update_conversation"] += (time.perf_counter() - started) * 1000 / turns
+    started = time.perf_counter()
+    memory.get_session_history(session_id)
+    timings["get_session_history"] = (time.perf_counter() - started) * 1000
+    return timings